@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the main ferro workloads on the data in tests/testData.
+
+Each run is appended to benchmarks/results/history.jsonl together with the
+git commit, so timings can be followed over time. A run can be stored as
+the baseline of this machine and later runs are compared against it, any
+benchmark slower than the baseline by more than the threshold is reported
+as a regression (and the script exits with status 1).
+
+Usage::
+
+    python benchmarks/bench.py                    # run all, compare to baseline
+    python benchmarks/bench.py -k forc --repeat 3 # only benchmarks matching 'forc'
+    python benchmarks/bench.py --save-baseline    # store this run as the baseline
+"""
+import argparse
+import atexit
+import json
+import shutil
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from glob import glob
+from os import makedirs
+from os.path import join, dirname, realpath, relpath, exists, basename
+from tempfile import mkdtemp
+
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+
+rootdir = dirname(dirname(realpath(__file__)))
+sys.path.insert(0, rootdir)
+from ferro import data as hd
+from ferro import models as lf
+from ferro import aixacct as aix
+from ferro import synthetic as syn
+
+testdatadir = join(rootdir, "tests", "testData")
+benchdir = join(rootdir, "benchmarks")
+resultsdir = join(benchdir, "results")
+baseline_file = join(benchdir, "baseline.json")
+
+hfo2dir = join(testdatadir, "hfo2_MFM")
+# 10k point FORC waveforms
+forc_files = sorted(glob(join(hfo2dir, "H9_x9y4_1e4_forc", "* 0Hz *.tsv"))) + sorted(
+    glob(join(testdatadir, "RTWhiteB", "RTWhiteB_FORC", "*.tsv"))
+)
+dat_files = sorted(
+    f
+    for f in glob(join(testdatadir, "**", "*.dat"), recursive=True)
+    if aix.check_datatype(f) in (aix.MeasEnum.HYSTERESIS, aix.MeasEnum.LEAKAGE)
+)
+
+BENCHMARKS = []
+
+
+def benchmark(name, params=(None,)):
+    """
+    Registers a benchmark. The decorated function does the setup for one
+    parameter value and returns the function to be timed.
+    """
+
+    def register(setup):
+        BENCHMARKS.append((name, params, setup))
+        return setup
+
+    return register
+
+
+def _label(param):
+    if param is None:
+        return ""
+    if isinstance(param, str) and exists(param):
+        return "[" + relpath(param, testdatadir) + "]"
+    return "[" + str(param) + "]"
+
+
+@benchmark("read_tfdata", dat_files)
+def read_tfdata(path):
+    return lambda: aix.load_tfdata(aix.read_tfdata(path))
+
+
+@benchmark("read_tfdata_synthetic", (10000, 100000))
+def read_tfdata_synthetic(n_points):
+    tmpdir = mkdtemp()
+    atexit.register(shutil.rmtree, tmpdir, True)
+    files = syn.generate_dataset(tmpdir, n_points=n_points, forc_points=0,
+                                 tsv=False, seed=0)
+    return lambda: aix.load_tfdata(aix.read_tfdata(files["freq"]))
+
+
+@benchmark("tsv_read", forc_files)
+def tsv_read(path):
+    def run():
+        d = hd.HysteresisData(area=6579E-8, thickness=13E-7)
+        d.tsv_read(path)
+
+    return run
+
+
+@benchmark("list_read_lkg_comp")
+def list_read_lkg_comp():
+    files = hd.dir_read(join(hfo2dir, "H9_x9y4_1e4_S3_temps"))
+    lkgfiles = hd.dir_read(join(hfo2dir, "H9_x9y4_1e4_S3_tempslkg"))
+    return lambda: hd.list_read(files, lkgfiles)
+
+
+@benchmark("lcm_fit")
+def lcm_fit():
+    lkg = []
+    for f in hd.dir_read(join(hfo2dir, "H9_x9y4_1e4_S3_tempslkg")):
+        d = hd.LeakageData()
+        d.lcm_read(f)
+        lkg.append(d)
+
+    def run():
+        for d in lkg:
+            d.lcm_fit()
+
+    return run
+
+
+def _forc_data(path):
+    d = hd.HysteresisData(area=6579E-8, thickness=13E-7)
+    d.tsv_read(path)
+    return d
+
+
+@benchmark("forc_calc", forc_files[:1])
+def forc_calc(path):
+    d = _forc_data(path)
+    return lambda: d.forc_calc()
+
+
+@benchmark("domain_gen", (100, 1000))
+def domain_gen(n):
+    film = lf.LandauSimple(area=6579E-8, thickness=13E-7)
+    e, er, probs = _forc_data(forc_files[0]).forc_calc()
+    np.random.seed(0)
+    return lambda: film.domain_gen(e, er, probs, n=n)
+
+
+@benchmark("calc_efe_preisach", (10, 100, 1000, 10000))
+def calc_efe_preisach(n):
+    film = lf.LandauSimple(area=6579E-8, thickness=13E-7, pr=15E-6)
+    e, er, probs = _forc_data(forc_files[0]).forc_calc()
+    np.random.seed(0)
+    domains = film.domain_gen(e, er, probs, n=n)
+    esweep = np.linspace(-4.5E6, 4.5E6, num=1000)
+    esweep = np.append(esweep, esweep[::-1])
+    return lambda: film.calc_efe_preisach(esweep, domains)
+
+
+def time_func(func, repeat=5, min_time=0.05):
+    """
+    Times func, running it in loops of at least min_time seconds.
+
+    Returns
+    -------
+    median, best : float
+        Median and minimum time of one call in seconds.
+    loops : int
+        Calls per timed loop.
+    """
+    t0 = time.perf_counter()
+    func()  # warm up, also fills caches of lazily imported modules
+    first = time.perf_counter() - t0
+    loops = max(1, int(np.ceil(min_time / max(first, 1E-9))))
+    times = np.zeros(repeat)
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times[i] = (time.perf_counter() - t0) / loops
+    return float(np.median(times)), float(np.min(times)), loops
+
+
+def run(select=None, repeat=5, verbose=True):
+    """
+    Runs the benchmarks whose name contains select (all if None).
+
+    Returns
+    -------
+    results : dict
+        {benchmark name: {'median': s, 'min': s, 'loops': n}}
+    """
+    results = {}
+    for name, params, setup in BENCHMARKS:
+        for p in params:
+            full = name + _label(p)
+            if select and select not in full:
+                continue
+            func = setup() if p is None else setup(p)
+            median, best, loops = time_func(func, repeat)
+            results[full] = {"median": median, "min": best, "loops": loops}
+            if verbose:
+                print(f"{full:<80s} {1E3 * median:10.2f} ms")
+    return results
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Compares results to a baseline.
+
+    Returns
+    -------
+    regressions : list
+        (name, ratio) of benchmarks whose best time got slower by more than
+        threshold (0.25 = 25%).
+    """
+    regressions = []
+    print(f"\n{'benchmark':<80s} {'baseline':>10s} {'now':>10s} {'ratio':>7s}")
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        # best time is the least sensitive to load from other processes
+        ratio = r["min"] / baseline[name]["min"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+            flag = "  REGRESSION"
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(
+            f"{name:<80s} {1E3 * baseline[name]['min']:8.2f}ms "
+            f"{1E3 * r['min']:8.2f}ms {ratio:7.2f}{flag}"
+        )
+    return regressions
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=rootdir, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", dest="select", help="only run benchmarks matching this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown ratio flagged as a regression")
+    parser.add_argument("--baseline", default=baseline_file)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run as the baseline")
+    parser.add_argument("--no-history", action="store_true",
+                        help="don't append this run to the results history")
+    args = parser.parse_args(argv)
+
+    results = run(args.select, args.repeat)
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.node(),
+        "results": results,
+    }
+
+    if not args.no_history:
+        makedirs(resultsdir, exist_ok=True)
+        with open(join(resultsdir, "history.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    if args.save_baseline:
+        if exists(args.baseline):
+            with open(args.baseline) as f:
+                record["results"] = {**json.load(f)["results"], **results}
+        with open(args.baseline, "w") as f:
+            json.dump(record, f, indent=1)
+        print(f"\nBaseline saved to {basename(args.baseline)}")
+        return 0
+
+    if exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nBaseline: commit {baseline['commit']} from {baseline['timestamp']}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s)")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,9 +35,9 @@ cCompData = freqData[0]
 hfo2.c = hfo2.c_calc(freqData, plot=1)
 compensatedData, hfo2.pr = hfo2.c_compensation(cCompData)
 compensatedData.hyst_plot(plot_e=True)
-hfo2.rho_calc(freqData)
+hfo2.rho = hfo2.rho_calc(freqData, plot=True)
 
-hfo2.a0 = hfo2.a0_calc(tempData)
+hfo2.a0, hfo2.T0 = hfo2.a0_calc(tempData, plot=True)
 
 freqDataLkgComp = hd.list_read(freqfiles, templkgfiles)
 cCompDataLkgComp = freqDataLkgComp[0]
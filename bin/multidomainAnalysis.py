@@ -10,12 +10,17 @@ import numpy as np
 from os.path import join, dirname, realpath
 from context import models as lf
 from context import data as hd
+from context import profiling
 
 plt.close('all')
 testdatadir = join(dirname(dirname(realpath(__file__))), "tests", "testData")
 
 leakageComp = False
 device = 0
+profile = False  # print the time spent in each processing stage at the end
+
+if profile:
+    profiling.enable()
 
 ### Radiant Technologies White B ###
 if device == 0:
@@ -81,7 +86,7 @@ if tempdir != None:
         tempData = hd.list_read(tempfiles, plot = False,
                                 thickness = t, area = a)     
     
-    landau.a0 = landau.a0_calc(tempData)
+    landau.a0, landau.T0 = landau.a0_calc(tempData, plot=True)
 
 freqfiles = hd.dir_read(freqdir)
 freqData = hd.list_read(freqfiles, thickness = t, area = a)
@@ -95,7 +100,7 @@ hd.hyst_plot([cCompData, compensatedData],
              ['Before', 'After'],
              plot_e=False)
 freqCompData = list(map(lambda x:landau.c_compensation(x)[0], freqData))
-landau.rho_calc(freqData)
+landau.rho = landau.rho_calc(freqData, plot=True)
 
 
 
@@ -129,6 +134,14 @@ ax.plot(cCompData.field*1E-6,cCompData.polarization*1E6,esweep*1E-6,res[0]*1E6)
 ax.set_ylabel('Polarization Charge ($\mu{}C/cm^2$)')
 ax.set_xlabel('Electric Field (MV/cm)')
 
+# RMS difference between model and measurement on each branch
+half = len(esweep)//2
+for name, e, p in (("up", esweep[:half], res[0][:half]),
+                   ("down", esweep[half:], res[0][half:])):
+    p_meas = cCompData.branch_interp(e, branch=name, x_attr="field")
+    rms = np.sqrt(np.nanmean((p - p_meas)**2))
+    print(f"{name} branch RMS error: {1E6*rms:0.2f} uC/cm^2")
+
 
 
 # Following code plots a series of diff freq hystdata files on same plot
@@ -199,3 +212,6 @@ legend = sorted(legend)
 leakageData = sorted(leakageData, key=lambda data: int(data.temp))
 legend = [str(x)+' K' for x in legend]  
 hd.lcm_plot(leakageData, legend)
+
+if profile:
+    print(profiling.summary())
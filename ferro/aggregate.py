@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Die level aggregation of a lot of measurements.
+
+Measurement names follow device_dieN_stack_structure_series, e.g.
+FeFETD1_die84_MFS+_100_10x10_freqs, and are stored as device/stack/dieN
+directories. die_stats() finds all series below a data root (see
+batch.discover), groups them by device, stack, die and structure, analyzes
+the groups in parallel and returns one record per die and structure::
+
+    stats = aggregate.die_stats(root, cache="lot_cache.json")
+    d1 = stats[stats["device"] == "FeFETD1"]
+    plt.plot(d1["die"], d1["c"], "o")
+
+Results are cached per die with a key of the settings and the files of the
+die, so after new measurements only the changed dies are analyzed again.
+"""
+import hashlib
+import json
+import re
+from multiprocessing import Pool
+from os.path import basename, splitext, exists
+from warnings import warn
+import numpy as np
+from ferro import metrics
+from ferro import batch
+
+name_re = re.compile(
+    r"^(?P<device>[^_]+)_die(?P<die>\d+)_(?P<stack>[^_]+)_"
+    r"(?P<structure>\d+_\d+x\d+)(?:_(?P<series>[A-Za-z]+))?$"
+)
+# series name spellings used in the lab
+series_names = {
+    "freq": "freq",
+    "freqs": "freq",
+    "temps": "temp",
+    "lkg": "leakage",
+    "leakage": "leakage",
+    "forc": "forc",
+    "fatigue": "fatigue",
+    "fatique": "fatigue",
+    "voltages": "voltage",
+}
+
+stats_dtype = np.dtype(
+    [
+        ("device", "U32"),
+        ("stack", "U16"),
+        ("die", int),
+        ("structure", "U16"),
+        ("c", float),  # F
+        ("er", float),  # relative permittivity
+        ("pr", float),  # C/cm^2, after capacitance compensation
+        ("ec", float),  # V/cm, (ec_pos - ec_neg) / 2
+        ("lcm_parms", float, 7),  # leakage fit closest to 300 K
+    ]
+)
+
+
+def parse_name(path):
+    """
+    Device, stack, die, structure and series of a measurement path.
+
+    Returns
+    -------
+    info : dict
+        None if the name doesn't follow the naming scheme. The series is
+        normalized (freqs -> freq, lkg -> leakage, ...), '' if missing.
+    """
+    m = name_re.match(splitext(basename(path))[0])
+    if m is None:
+        return None
+    info = m.groupdict()
+    info["die"] = int(info["die"])
+    series = (info["series"] or "").lower()
+    info["series"] = series_names.get(series, series)
+    return info
+
+
+def group_series(series, fmt="tsv"):
+    """
+    Groups series by die.
+
+    Parameters
+    ----------
+    series : list
+        batch.Series objects.
+    fmt : str
+        'tsv' or 'dat', preferred format if a series exists in both.
+
+    Returns
+    -------
+    groups : dict
+        {(device, stack, die, structure): {series name: batch.Series}}
+    """
+    groups = {}
+    for s in series:
+        info = parse_name(s.path)
+        if info is None:
+            continue
+        key = (info["device"], info["stack"], info["die"], info["structure"])
+        g = groups.setdefault(key, {})
+        old = g.get(info["series"])
+        is_fmt = s.path.endswith(".dat") == (fmt == "dat")
+        # copies of a series elsewhere in the tree are only used once
+        if old is None or (is_fmt and old.path.endswith(".dat") != (fmt == "dat")):
+            g[info["series"]] = s
+    return dict(sorted(groups.items()))
+
+
+def _group_key(group):
+    h = hashlib.sha1()
+    for name in sorted(group):
+        h.update(name.encode())
+        h.update(group[name].key().encode())
+    return h.hexdigest()
+
+
+def analyze_die(group):
+    """
+    Capacitance, Pr, Ec and leakage fit of one die and structure.
+
+    Parameters
+    ----------
+    group : dict
+        {series name: batch.Series}, see group_series.
+
+    Returns
+    -------
+    values : dict
+        c, er, pr, ec and lcm_parms, NaN where the series is missing.
+    """
+    values = {"c": np.nan, "er": np.nan, "pr": np.nan, "ec": np.nan,
+              "lcm_parms": [np.nan] * 7}
+    if "freq" in group:
+        s = group["freq"]
+        data = batch._read(s, s.settings)[0]
+        m = metrics.loop_metrics(data)
+        values["ec"] = float(np.nanmedian((m["ec_pos"] - m["ec_neg"]) / 2))
+        if len({float(d.freq) for d in data}) > 1:
+            values.update(batch.capacitance_summary(data, s.settings["area_real"]))
+    if "leakage" in group:
+        s = group["leakage"]
+        lkg = batch._read(s, s.settings)[0]
+        d = min(lkg, key=lambda l: abs(float(l.temp) - 300))
+        d.lcm_fit()
+        values["lcm_parms"] = [float(p) for p in d.lcm_parms]
+    return values
+
+
+def _analyze(args):
+    key, group = args
+    try:
+        return key, analyze_die(group), None
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+
+
+def die_stats(root, config=None, processes=None, cache=None, fmt="tsv"):
+    """
+    Analyzes every die below root.
+
+    Parameters
+    ----------
+    root : str
+        Data root directory.
+    config : configparser.ConfigParser
+        Thickness and area settings, see batch.load_config.
+    processes : int
+        Number of worker processes. Defaults to the number of CPUs.
+    cache : dict or str
+        Results of earlier calls, updated in place. A str is the path of a
+        json file the cache is read from and written to.
+    fmt : str
+        'tsv' or 'dat', preferred format if a series exists in both.
+
+    Returns
+    -------
+    stats : np structured array
+        One record per die and structure with fields device, stack, die,
+        structure, c, er, pr, ec and lcm_parms (stats_dtype).
+    """
+    if config is None:
+        config = batch.load_config()
+    series = batch.discover(root)
+    batch.apply_config(series, config)
+    groups = group_series(series, fmt)
+
+    cache_file = cache if isinstance(cache, str) else None
+    if cache_file is not None:
+        cache = {}
+        if exists(cache_file):
+            with open(cache_file) as f:
+                cache = json.load(f)
+    elif cache is None:
+        cache = {}
+
+    keys = {g: _group_key(group) for g, group in groups.items()}
+    valid = _valid(cache, keys)
+    todo = [(g, group) for g, group in groups.items() if g not in valid]
+    if len(todo) == 1 or processes == 1:
+        results = map(_analyze, todo)
+    elif todo:
+        with Pool(processes) as pool:
+            results = pool.map(_analyze, todo)
+    else:
+        results = []
+    for g, values, error in results:
+        if error is not None:
+            warn(f"Analysis of {g} failed: {error}", RuntimeWarning)
+            continue
+        cache["/".join(map(str, g))] = {"key": keys[g], "values": values}
+
+    if cache_file is not None:
+        with open(cache_file, "w") as f:
+            json.dump(cache, f)
+
+    stats = np.zeros(len(groups), dtype=stats_dtype)
+    for k in ("c", "er", "pr", "ec", "lcm_parms"):
+        stats[k] = np.nan
+    for i, g in enumerate(groups):
+        for k, v in zip(("device", "stack", "die", "structure"), g):
+            stats[k][i] = v
+        entry = cache.get("/".join(map(str, g)))
+        if entry is not None and entry["key"] == keys[g]:
+            for k, v in entry["values"].items():
+                stats[k][i] = v
+    return stats
+
+
+def _valid(cache, keys):
+    """Groups whose cached results are still valid."""
+    return {
+        g for g, key in keys.items()
+        if cache.get("/".join(map(str, g)), {}).get("key") == key
+    }
+
+
+def group_by(stats, field, by=("device", "structure")):
+    """
+    Median, standard deviation and count of a field over the dies of each
+    group.
+
+    Returns
+    -------
+    groups : dict
+        {group values: (median, std, n)}, NaN values are ignored.
+    """
+    by = list(by)
+    out = {}
+    for g in np.unique(stats[by]):
+        v = stats[field][stats[by] == g]
+        v = v[np.isfinite(v)]
+        out[tuple(g)] = (
+            np.median(v) if len(v) else np.nan,
+            np.std(v) if len(v) else np.nan,
+            len(v),
+        )
+    return out
@@ -2,9 +2,16 @@
 import re
 import numpy as np
 from ferro import data as hd
-from os.path import basename
+from ferro import profiling
+from os.path import basename, getsize
 from enum import Enum
 
+# data lines read by read_tfdata per array parsed when streaming
+stream_chunk = 10000
+# approximate memory of the unstreamed parse (line strings and genfromtxt
+# temporaries) relative to the file size
+line_memory_factor = 10
+
 class MeasEnum(Enum):
     """
     An Enumeration representing measurement data type.
@@ -108,7 +115,8 @@ def check_istable(line, datatype):
         m = re.match(r'^Time \[s\]', line)
     return bool(m)
 
-def read_tfdata(filepath):
+@profiling.timed("read_tfdata")
+def read_tfdata(filepath, stream=None):
     '''
     Read an AixACCT .dat text file
 
@@ -131,12 +139,20 @@ def read_tfdata(filepath):
     ----------
     filepath: str
         Path (inc. filename) of data to parse
+    stream: bool
+        If True, data lines are parsed into a float array every
+        stream_chunk lines instead of being kept as strings until
+        load_tfdata, so 'data' is a 2d np array. If None, streaming is used
+        when the file is too large for the memory budget set with
+        profiling.set_memory_budget.
 
     Returns
     -------
     table_dict: dict
         Dictionary containing parsed text file.
     '''
+    if stream is None:
+        stream = profiling.over_budget(line_memory_factor * getsize(filepath))
     summary_table_read = False
     is_data_table = False
     is_data_table_header = False
@@ -145,6 +161,8 @@ def read_tfdata(filepath):
     global_metadata = {}
     table_metadata = {}
     datastr = []
+    chunks = []
+    pending = False  # rows not yet stored in table_dict (streaming only)
     tableheaderstr = ''
     table_key = ''
 
@@ -155,6 +173,29 @@ def read_tfdata(filepath):
             'datatables': {}
         }
     }
+
+    def add_table():
+        nonlocal pending
+        if stream:
+            if not pending and table_key in table_dict[filekey]['datatables']:
+                return
+            pending = False
+            if datastr:
+                chunks.append(_parse_rows(datastr))
+                datastr.clear()
+            data = chunks[0] if len(chunks) == 1 else np.concatenate(chunks or [np.empty((0, 0))])
+        else:
+            data = datastr
+        table_dict[filekey]['datatables'].update({
+            table_key: {
+                'metadata': {**global_metadata,
+                             **table_metadata},
+                'dataheader': tableheaderstr.split('\t'),
+                'data': data
+            }
+        }
+        )
+
     with open(filepath, encoding='cp1252') as f:
         for line in f:
             line.rstrip(r'\n')
@@ -183,35 +224,34 @@ def read_tfdata(filepath):
                             table_metadata[m.group(1)] = m.group(2)
                 elif is_data_table:
                     if re.match(r'^(\n)?$', line):
-                        table_dict[filekey]['datatables'].update({
-                            table_key: {
-                                'metadata': {**global_metadata,
-                                             **table_metadata},
-                                'dataheader': tableheaderstr.split('\t'),
-                                'data': datastr
-                            }
-                        }
-                        )
+                        add_table()
                     elif re.match(r'Table (\[*\d*.*\d*\]*)', line):
+                        if pending:
+                            add_table()  # rows after the blank line
                         table_key = line
                         is_data_table_header = True
                         is_data_table = False
                         table_metadata.clear()
                         datastr = []
+                        chunks = []
                     else:
                         datastr.append(line)
+                        pending = True
+                        if stream and len(datastr) >= stream_chunk:
+                            chunks.append(_parse_rows(datastr))
+                            datastr.clear()
     # add last table in file to dict
-    table_dict[filekey]['datatables'].update({
-        table_key: {
-            'metadata': {**global_metadata,
-                         **table_metadata},
-            'dataheader': tableheaderstr.split('\t'),
-            'data': datastr
-        }
-    }
-    )
+    add_table()
+    if profiling.enabled:
+        profiling.count("files parsed")
+        profiling.count("rows parsed", sum(
+            len(t['data']) for t in table_dict[filekey]['datatables'].values()))
     return table_dict
 
+
+def _parse_rows(lines):
+    return np.loadtxt(lines, ndmin=2)
+
 def get_multiplier(datatype, key):
     """
     Checks to see if unit conversion is defined for current information being parsed.
@@ -233,6 +273,7 @@ def get_multiplier(datatype, key):
     else:
         return 1
 
+@profiling.timed("load_tfdata")
 def load_tfdata(table_dict):
     """
 
@@ -255,7 +296,10 @@ def load_tfdata(table_dict):
             for table in table_dict[f]['datatables']:
                 t = table_dict[f]['datatables'][table]['data']
                 header = table_dict[f]['datatables'][table]['dataheader']
-                table_array = np.genfromtxt(t)
+                if isinstance(t, np.ndarray):  # parsed while streaming
+                    table_array = t
+                else:
+                    table_array = np.genfromtxt(t)
 
                 dataobj = meas_struct[datatype]['datatype']()
                 dataobj.sample_name = f
@@ -275,4 +319,6 @@ def load_tfdata(table_dict):
                         dataobj.__setattr__(key, m * table_array[:, val])
 
                 obj_list.append(dataobj)
+    if profiling.enabled:
+        profiling.count("array bytes", profiling.nbytes(obj_list))
     return obj_list
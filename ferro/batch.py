@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Batch processing of a directory tree of measurements (ferro-batch).
+
+Every directory of .tsv files and every AixACCT .dat file below the data
+root is a measurement series. Series are classified by name: names
+containing 'forc' are FORC measurements, 'lkg' or 'leak' leakage
+measurements and everything else hysteresis measurements (frequency,
+temperature or voltage series). The configured analyses are run on each
+series in a process pool and the results are written to one CSV table.
+
+Progress is saved after every series, an interrupted run continues where
+it stopped when started again with the same output directory. Series whose
+files or settings changed since are processed again.
+
+Usage::
+
+    ferro-batch tests/testData -c lot.ini -o results -j 8
+
+Example config, sections other than [batch] are glob patterns of series
+paths (relative to the data root) whose settings override the defaults::
+
+    [batch]
+    thickness = 10E-7      # cm, overrides the .dat file metadata if set
+    area = 1E-4            # cm^2, likewise
+    area_real =            # cm^2, used for capacitance, defaults to area
+    leakage = auto         # auto (sibling *_lkg series) or none
+    leakage_temp_tol = 0   # K, largest temperature difference to the
+                           # leakage measurement used for compensation
+    analyses = metrics, capacitance, leakage, forc
+
+    [RTWhiteB/*]
+    thickness = 255E-7
+"""
+import argparse
+import configparser
+import csv
+import hashlib
+import json
+import re
+import sys
+import traceback
+from fnmatch import fnmatch
+from multiprocessing import Pool
+from os import walk, makedirs, stat
+from os.path import join, relpath, basename, splitext, dirname, exists, realpath
+from warnings import warn
+import numpy as np
+from ferro import data as hd
+from ferro import models as lf
+from ferro import aixacct as aix
+from ferro import metrics
+
+analyses = ("metrics", "capacitance", "leakage", "forc")
+defaults = {
+    "thickness": "",
+    "area": "",
+    "area_real": "",
+    "leakage": "auto",
+    "leakage_temp_tol": "0",
+    "analyses": ", ".join(analyses),
+}
+
+
+class Series:
+    def __init__(self, path, root, kind, files):
+        """
+        Measurement series found by discover().
+
+        Parameters
+        ----------
+        path : str
+            Directory of tsv files or .dat file.
+        root : str
+            Data root, series are identified by their path relative to it.
+        kind : str
+            'hysteresis', 'forc' or 'leakage'
+        files : list
+            Data files of the series.
+        """
+        self.path = path
+        self.name = relpath(path, root).replace("\\", "/")
+        self.kind = kind
+        self.files = files
+        self.settings = dict(defaults)
+        self.leakage = None  # leakage Series used for compensation
+
+    def key(self):
+        """Hash of the settings and the files (with size and mtime)."""
+        h = hashlib.sha1(json.dumps(self.settings, sort_keys=True).encode())
+        series = [self] + ([self.leakage] if self.leakage else [])
+        for s in series:
+            for f in s.files:
+                st = stat(f)
+                h.update(f"{f}:{st.st_size}:{st.st_mtime_ns}".encode())
+        return h.hexdigest()
+
+
+def _kind(name):
+    name = name.lower()
+    if "forc" in name:
+        return "forc"
+    if "lkg" in name or "leak" in name:
+        return "leakage"
+    return "hysteresis"
+
+
+def _prefix(name):
+    """Series name without a trailing _freqs, _temps, ... suffix."""
+    m = re.match(r"(.*)_[A-Za-z]+$", name)
+    return m.group(1) if m else name
+
+
+def discover(root, exclude=()):
+    """
+    Finds the measurement series below root.
+
+    Parameters
+    ----------
+    root : str
+        Data root directory.
+    exclude : list
+        Directories not to search (e.g. the output directory).
+
+    Returns
+    -------
+    series : list
+        Series objects sorted by name, with hysteresis series linked to a
+        matching leakage series in the same directory if there is one.
+    """
+    exclude = [realpath(e) for e in exclude]
+    found = []
+    for path, dirs, files in walk(root):
+        dirs[:] = sorted(d for d in dirs if realpath(join(path, d)) not in exclude)
+        tsv = sorted(join(path, f) for f in files if f.endswith(".tsv"))
+        if tsv:
+            found.append(Series(path, root, _kind(basename(path)), tsv))
+        for f in sorted(files):
+            if not f.endswith(".dat"):
+                continue
+            datatype = aix.check_datatype(join(path, f))
+            if datatype == aix.MeasEnum.LEAKAGE:
+                kind = "leakage"
+            elif datatype == aix.MeasEnum.HYSTERESIS:
+                kind = _kind(f)
+            else:
+                continue  # fatigue and PUND data are not analyzed
+            found.append(Series(join(path, f), root, kind, [join(path, f)]))
+
+    for s in found:
+        if s.kind == "leakage":
+            continue
+        name = splitext(basename(s.path))[0]
+        for l in found:
+            if (
+                l.kind == "leakage"
+                and dirname(l.path) == dirname(s.path)
+                and l.path.endswith(".dat") == s.path.endswith(".dat")
+                and basename(l.path).lower().startswith(_prefix(name).lower())
+            ):
+                s.leakage = l
+                break
+    return sorted(found, key=lambda s: s.name)
+
+
+def load_config(filename=None):
+    """
+    Reads a batch config file.
+
+    Returns
+    -------
+    config : configparser.ConfigParser
+        With a [batch] section containing all default settings.
+    """
+    config = configparser.ConfigParser(inline_comment_prefixes=("#", ";"))
+    config.optionxform = str
+    config.read_dict({"batch": defaults})
+    if filename is not None:
+        if not config.read(filename):
+            raise FileNotFoundError(filename)
+    return config
+
+
+def apply_config(series, config):
+    """Sets the settings of each series from the matching config sections."""
+    for s in series:
+        s.settings = dict(config["batch"])
+        for section in config.sections():
+            if section != "batch" and fnmatch(s.name, section):
+                s.settings.update(config[section])
+        for key in ("thickness", "area", "area_real", "leakage_temp_tol"):
+            if s.settings[key]:
+                float(s.settings[key])  # fail early on typos
+
+
+def _read(series, settings):
+    """Measurement objects of a series."""
+    sizes = {k: float(settings[k]) for k in ("thickness", "area") if settings[k]}
+    if series.path.endswith(".dat"):
+        data = aix.load_tfdata(aix.read_tfdata(series.path))
+        for d in data:
+            for k, v in sizes.items():
+                setattr(d, k, v)
+        names = [f"{basename(series.path)}[{i}]" for i in range(len(data))]
+        return data, names
+    data = []
+    for f in series.files:
+        if series.kind == "leakage":
+            d = hd.LeakageData(**sizes)
+            d.lcm_read(f)
+        else:
+            d = hd.HysteresisData(**sizes)
+            d.tsv_read(f)
+        data.append(d)
+    return data, [basename(f) for f in series.files]
+
+
+def _nearest_temp(d, lkg, tol=0):
+    """
+    Leakage measurement closest in temperature to d. None if there is
+    none within tol (K).
+    """
+    l = min(lkg, key=lambda l: abs(float(l.temp) - float(d.temp)))
+    if abs(float(l.temp) - float(d.temp)) > tol:
+        return None
+    return l
+
+
+def process(series, outdir):
+    """
+    Runs the configured analyses on one series.
+
+    Returns
+    -------
+    rows : list
+        One dict per result row of the table.
+    """
+    settings = series.settings
+    todo = [a.strip() for a in settings["analyses"].split(",") if a.strip()]
+    data, names = _read(series, settings)
+    rows = []
+
+    def row(name, analysis, **values):
+        r = {"series": series.name, "kind": series.kind,
+             "measurement": name, "analysis": analysis}
+        r.update(values)
+        rows.append(r)
+
+    if series.kind == "leakage":
+        if "leakage" in todo:
+            for d, name in zip(data, names):
+                d.lcm_fit()
+                row(name, "leakage", temp=d.temp,
+                    **{f"lcm_p{i}": p for i, p in enumerate(d.lcm_parms)})
+        return rows
+
+    if settings["leakage"] == "auto" and series.leakage is not None:
+        lkg = _read(series.leakage, settings)[0]
+        for l in lkg:
+            l.lcm_fit()
+        tol = float(settings["leakage_temp_tol"] or 0)
+        for k, (d, name) in enumerate(zip(data, names)):
+            l = _nearest_temp(d, lkg, tol)
+            if l is None:
+                warn(f"{series.name}: no leakage measurement within {tol} K "
+                     f"of {name} ({d.temp} K), it is not compensated.",
+                     RuntimeWarning)
+            else:
+                data[k] = d.leakage_compensation(l)
+
+    if series.kind == "forc":
+        if "forc" in todo:
+            makedirs(join(outdir, "forc"), exist_ok=True)
+            for i, (d, name) in enumerate(zip(data, names)):
+                try:
+                    e, er, prob = d.forc_calc()
+                except ValueError as err:  # e.g. a plain loop in the directory
+                    row(name, "forc", error=str(err))
+                    continue
+                fname = re.sub(r"[^\w.+-]+", "_", f"{series.name}_{i}") + ".npz"
+                np.savez(join(outdir, "forc", fname), e=e, er=er, prob=prob)
+                row(name, "forc", forc_file=join("forc", fname))
+        return rows
+
+    if "metrics" in todo:
+        for m, name in zip(metrics.loop_metrics(data), names):
+            row(name, "metrics", **{k: m[k] for k in metrics.metrics_dtype.names})
+    freqs = {float(d.freq) for d in data}
+    if "capacitance" in todo and len(freqs) > 1:
+        row("", "capacitance", **capacitance_summary(data, settings["area_real"]))
+    return rows
+
+
+def capacitance_summary(data, area_real=None):
+    """
+    Capacitance of a series measured at several frequencies (c_calc), the
+    relative permittivity and the median Pr after capacitance compensation.
+
+    Parameters
+    ----------
+    data : list
+        HysteresisData objects.
+    area_real : float or str
+        Device area (cm^2) used for the film, defaults to the data's area.
+
+    Returns
+    -------
+    values : dict
+        c, er and pr
+    """
+    area = float(area_real or data[0].area)
+    film = lf.LandauFull(thickness=data[0].thickness, area=area)
+    film.c = film.c_calc(data)
+    return {
+        "c": film.c,
+        "er": lf.relative_permittivity(film.c, film.thickness, film.area),
+        "pr": float(np.median([film.c_compensation(d)[1] for d in data])),
+    }
+
+
+def _run(args):
+    series, outdir = args
+    try:
+        return series.name, series.key(), process(series, outdir), None
+    except Exception:
+        return series.name, series.key(), None, traceback.format_exc()
+
+
+def read_progress(filename):
+    """{series name: (key, rows)} of the series finished in earlier runs."""
+    done = {}
+    if exists(filename):
+        with open(filename) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # line cut off by an interrupted run
+                done[entry["series"]] = (entry["key"], entry["rows"])
+    return done
+
+
+def write_table(filename, rows):
+    """Writes result rows to a CSV file, columns in order of appearance."""
+    columns = []
+    for r in rows:
+        columns.extend(k for k in r if k not in columns)
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _json_value(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+
+def run(root, outdir, config=None, processes=None, restart=False, verbose=True):
+    """
+    Processes all series below root.
+
+    Parameters
+    ----------
+    root : str
+        Data root directory.
+    outdir : str
+        Output directory for results.csv, the progress file and FORC arrays.
+    config : configparser.ConfigParser
+        Settings, see load_config.
+    processes : int
+        Number of worker processes. Defaults to the number of CPUs.
+    restart : bool
+        Ignore the progress of earlier runs.
+    verbose : bool
+        Print each finished series.
+
+    Returns
+    -------
+    rows : list
+        Result rows of all series.
+    failed : dict
+        {series name: traceback} of the series that raised an error. They
+        are retried by the next run.
+    """
+    if config is None:
+        config = load_config()
+    makedirs(outdir, exist_ok=True)
+    series = discover(root, exclude=[outdir])
+    apply_config(series, config)
+
+    progress_file = join(outdir, "progress.jsonl")
+    done = {} if restart else read_progress(progress_file)
+    if restart and exists(progress_file):
+        open(progress_file, "w").close()
+    todo = [s for s in series if done.get(s.name, (None,))[0] != s.key()]
+    if verbose:
+        print(f"{len(series)} series, {len(series) - len(todo)} already done")
+
+    failed = {}
+    if todo:
+        with Pool(processes) as pool, open(progress_file, "a") as progress:
+            jobs = pool.imap_unordered(_run, [(s, outdir) for s in todo])
+            for i, (name, key, rows, error) in enumerate(jobs, 1):
+                if error is not None:
+                    failed[name] = error
+                    if verbose:
+                        print(f"[{i}/{len(todo)}] {name} FAILED\n{error}",
+                              file=sys.stderr)
+                    continue
+                rows = [{k: _json_value(v) for k, v in r.items()} for r in rows]
+                done[name] = (key, rows)
+                progress.write(json.dumps({"series": name, "key": key,
+                                           "rows": rows}) + "\n")
+                progress.flush()
+                if verbose:
+                    print(f"[{i}/{len(todo)}] {name}")
+
+    rows = [r for s in series if s.name in done for r in done[s.name][1]]
+    write_table(join(outdir, "results.csv"), rows)
+    return rows, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ferro-batch", description=__doc__.split("\n\n")[0])
+    parser.add_argument("root", help="data root directory")
+    parser.add_argument("-c", "--config", help="config file (INI)")
+    parser.add_argument("-o", "--output", default="ferro-results",
+                        help="output directory")
+    parser.add_argument("-j", "--processes", type=int,
+                        help="worker processes, defaults to the number of CPUs")
+    parser.add_argument("--restart", action="store_true",
+                        help="process all series again")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    rows, failed = run(args.root, args.output, config, args.processes,
+                       args.restart, not args.quiet)
+    if not args.quiet:
+        print(f"{len(rows)} rows written to {join(args.output, 'results.csv')}")
+    if failed:
+        print(f"{len(failed)} series failed: " + ", ".join(sorted(failed)),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,8 @@ TODO: move TF-1000 parsing into python, auto-read thickness & freq from metadata
 """
 from warnings import warn
 import re
-import copy  # used for creating Ilkg compensated copies of exp data
+import hashlib
+import copy  # used for deriving Ilkg compensated copies of exp data
 from os import listdir
 from os.path import join, isfile, basename
 import matplotlib.pyplot as plt
@@ -19,6 +20,8 @@ from scipy.optimize import curve_fit
 from scipy import signal
 from scipy.ndimage import filters as flt
 from scipy.interpolate import griddata
+from ferro import stats
+from ferro import profiling
 
 
 # matplotlib.rcParams.update({'font.size': 16})
@@ -38,6 +41,251 @@ def leakage_func(x, a, b, c, d, e, f, g):
 #    return np.sign(x-d)*a*(np.exp(b*(np.abs(x-d))**c)-1)+np.log(e)
 
 
+def leakage_polyfit(voltage, current, g=None):
+    """
+    Exact least squares fit of leakage_func to one or more leakage curves.
+
+    For a fixed shift g, leakage_func is linear in a through f, so they are
+    found with a single Vandermonde least squares solve. Any g gives the
+    same fitted curve; by default the mean voltage is used for numerical
+    conditioning.
+
+    Parameters
+    ----------
+    voltage : 1d np array
+        Voltage values shared by all curves.
+    current : np array
+        Leakage current, 1d or 2d with one curve per row.
+    g : float
+        Voltage shift of the polynomial. Defaults to mean(voltage).
+
+    Returns
+    -------
+    parms : np array
+        leakage_func parameters (a, b, c, d, e, f, g), one row per curve if
+        current is 2d.
+    pcov : np array
+        Estimated covariance of parms (7 by 7, one per curve if current is
+        2d). The fixed g has zero variance.
+    """
+    voltage = np.asfarray(voltage)
+    current = np.asfarray(current)
+    if g is None:
+        g = np.mean(voltage)
+
+    x = np.vander(voltage - g, 6)
+    coef = np.linalg.lstsq(x, current.T, rcond=None)[0].T
+
+    dof = max(len(voltage) - 6, 1)
+    resid = current - coef @ x.T
+    var = np.sum(resid ** 2, axis=-1) / dof
+    xtx_inv = np.linalg.pinv(x.T @ x)
+
+    parms = np.concatenate((coef, np.full(coef.shape[:-1] + (1,), g)), axis=-1)
+    pcov = np.zeros(np.shape(var) + (7, 7))
+    pcov[..., :6, :6] = np.multiply.outer(var, xtx_inv)
+    return parms, pcov
+
+
+@profiling.timed("lcm_fit_list")
+def lcm_fit_list(data, verbose=False):
+    """
+    Fits leakage_func to a list of LeakageData objects. Curves measured at
+    identical voltages are fit together in one least squares solve.
+
+    Parameters
+    ----------
+    data : list
+        LeakageData objects to fit. Fit parameters are stored in each
+        object's lcm_parms.
+    verbose : bool
+        If True, print calculated fit parameters and std dev
+
+    Returns
+    -------
+    n/a
+    """
+    groups = {}
+    for d in data:
+        key = np.asfarray(d.lcm_voltage).tobytes()
+        groups.setdefault(key, []).append(d)
+
+    for group in groups.values():
+        current = np.stack([d.lcm_current for d in group])
+        parms, pcov = leakage_polyfit(group[0].lcm_voltage, current)
+        profiling.count("leakage fits", len(group))
+        for d, p, c in zip(group, parms, pcov):
+            d.lcm_parms = p
+            if verbose:
+                print("Fit Parms:", p)
+                print("Std Dev:", np.sqrt(np.diag(c)))
+
+
+def stack_data(data, attr, fill=np.nan):
+    """
+    Stacks an array attribute of several measurements into one 2d array so
+    that it can be processed for all measurements at once.
+
+    Parameters
+    ----------
+    data : list
+        SampleData objects.
+    attr : str
+        Name of the array attribute to stack, e.g. 'polarization'.
+    fill : float
+        Value used to pad measurements shorter than the longest one.
+
+    Returns
+    -------
+    stacked : 2d np array
+        One row per measurement.
+    lengths : 1d np array
+        Number of valid points in each row.
+    """
+    return _stack_arrays([getattr(d, attr) for d in data], fill)
+
+
+def _stack_arrays(arrays, fill=np.nan):
+    lengths = np.array([len(a) for a in arrays], dtype=int)
+    stacked = np.full((len(arrays), lengths.max(initial=0)), fill, dtype=float)
+    for i, a in enumerate(arrays):
+        stacked[i, : lengths[i]] = a
+    return stacked, lengths
+
+
+def branch_interp(data, x, attr="polarization", branch="up", x_attr="voltage"):
+    """
+    Interpolates an array attribute of several hysteresis measurements at
+    arbitrary points on their ascending or descending voltage branch. Uses
+    the cached sorted branch of each measurement and a single binary search
+    over all measurements at once.
+
+    Parameters
+    ----------
+    data : list
+        HysteresisData objects.
+    x : float or np array
+        Query points in units of x_attr. A 1d array is evaluated on every
+        measurement, a 2d array gives one row of query points per measurement.
+    attr : str
+        Name of the array attribute to interpolate, e.g. 'polarization'.
+    branch : str
+        'up' for the ascending voltage branch, 'down' for the descending one.
+    x_attr : str
+        'voltage' or 'field'.
+
+    Returns
+    -------
+    y : 2d np array
+        One row per measurement. Queries outside the range of a branch are
+        NaN.
+    """
+    xs, lengths = _stack_arrays([d.branch_data(x_attr, branch) for d in data])
+    ys, _ = _stack_arrays([d.branch_data(attr, branch) for d in data])
+    n, m = xs.shape
+    xq = np.broadcast_to(np.asfarray(x), (n,) + np.shape(x)[-1:]).reshape(n, -1)
+    rows = np.arange(n)
+    if m == 0:
+        return np.full(xq.shape, np.nan)
+
+    # pad each row with its last value so that rows stay sorted
+    pad = np.arange(m)[None, :] >= lengths[:, None]
+    last = xs[rows, np.maximum(lengths - 1, 0)]
+    xs[pad] = np.broadcast_to(last[:, None], xs.shape)[pad]
+    ys[pad] = np.broadcast_to(ys[rows, np.maximum(lengths - 1, 0)][:, None], ys.shape)[pad]
+
+    # shift every row into its own interval so one searchsorted covers all
+    lo = xs.min()
+    shift = xs.max() - lo + 1.0
+    offset = (rows * shift)[:, None]
+    qclip = np.clip(xq, lo, lo + shift - 1.0)
+    pos = np.searchsorted((xs - lo + offset).ravel(), (qclip - lo + offset).ravel(), side="right")
+    pos = pos.reshape(xq.shape) - rows[:, None] * m
+    i1 = np.clip(pos, 1, np.maximum(lengths - 1, 1)[:, None])
+    i0 = i1 - 1
+
+    r = rows[:, None]
+    x0, x1 = xs[r, i0], xs[r, i1]
+    y0, y1 = ys[r, i0], ys[r, i1]
+    dx = x1 - x0
+    t = np.divide(xq - x0, dx, out=np.zeros(xq.shape), where=dx != 0)
+    y = y0 + t * (y1 - y0)
+    valid = (lengths[:, None] > 0) & (xq >= xs[:, :1]) & (xq <= last[:, None])
+    return np.where(valid, y, np.nan)
+
+
+def dedup(data):
+    """
+    Removes duplicate measurements (e.g. the same loop read from a TSV
+    export and from a .dat file) from a list. Measurements are grouped by
+    fingerprint so the list is only scanned once, __eq__ is only called
+    for measurements with the same fingerprint.
+    
+    Parameters
+    ----------
+    data : list
+        SampleData objects.
+    
+    Returns
+    -------
+    unique : list
+        First occurrence of each distinct measurement, in input order.
+    """
+    seen = {}
+    unique = []
+    for d in data:
+        group = seen.setdefault(d.fingerprint, [])
+        if not any(d == u for u in group):
+            group.append(d)
+            unique.append(d)
+    return unique
+
+
+def capacitance_compensation(current, icap):
+    """
+    Subtracts a capacitive current of magnitude icap from a measured
+    current. Points where the current is smaller than icap are set to 0.
+
+    Parameters
+    ----------
+    current : 1d np array (A)
+    icap : float
+        C * mean(abs(dV/dt)) of the loop (A).
+
+    Returns
+    -------
+    current : 1d np array (A)
+    """
+    i = np.asfarray(current)
+    return np.where(np.abs(i) >= icap, i - np.sign(i) * icap, 0)
+
+
+def integrate_current(current, dt, area):
+    """
+    Polarization of a loop from its current, centered between its
+    extremes.
+
+    Parameters
+    ----------
+    current : 1d np array (A)
+    dt : float or 1d np array
+        Time step (s), or the time since the previous point of every point.
+    area : float
+        Device area (cm^2)
+
+    Returns
+    -------
+    polarization : 1d np array (C/cm^2)
+    """
+    current = np.asfarray(current)
+    pol = np.zeros(len(current))
+    if np.ndim(dt):
+        pol[1:] = np.cumsum(current[1:] * dt[1:]) / area
+    else:
+        pol[1:] = np.cumsum(current[1:]) * dt / area
+    return pol - (pol.max() + pol.min()) / 2
+
+
 def dir_read(path):
     files = []
     r = re.compile(r".*\.tsv$")
@@ -47,7 +295,9 @@ def dir_read(path):
     return files
 
 
-def list_read(files, leakagefiles=None, plot=False, verbose=False, **kwargs):
+@profiling.timed("list_read")
+def list_read(files, leakagefiles=None, plot=False, verbose=False,
+              leakage_model=None, **kwargs):
     """
     Reads in several hysteresis measurements and creates objects for them.
     
@@ -60,6 +310,10 @@ def list_read(files, leakagefiles=None, plot=False, verbose=False, **kwargs):
     leakagefiles : list 
         Paths to leakage data for files.
         If none, leakage compensation is not performed.
+
+    leakage_model : LeakageSurface
+        Fit leakage model used to compensate every file at its own
+        temperature. Used instead of leakagefiles.
         
     plot: bool
         Triggers plotting of leakage data with fit.
@@ -77,7 +331,9 @@ def list_read(files, leakagefiles=None, plot=False, verbose=False, **kwargs):
     for f in files:
         data = HysteresisData(**kwargs)
         data.tsv_read(f)
-        if leakagefiles:
+        if leakage_model is not None:
+            data = data.leakage_compensation(leakage_model)
+        elif leakagefiles:
             r = re.compile(".*(_| )(" + re.escape(str(data.temp)) + '|' + re.escape(str(int(data.temp))) + ")K.*")
             temp_c = str(data.temp - 273)
             temp_c_int = str(int(data.temp - 273))
@@ -102,6 +358,8 @@ def list_read(files, leakagefiles=None, plot=False, verbose=False, **kwargs):
                 )
         data_list.append(data)
 
+    if profiling.enabled:
+        profiling.count("array bytes", profiling.nbytes(data_list))
     return data_list
 
 
@@ -186,8 +444,7 @@ def ncv_plot(data, legend=None, plot_e=False):
     ax1.set_prop_cycle("c", [colormap(i) for i in np.linspace(0, 0.6, len(data))])
     lines = []
     for d in data:
-        ncv = np.diff(d.polarization) / np.diff(d.voltage)
-        ncv_v = 0.5 * (d.voltage[1:] + d.voltage[:-1])
+        ncv, ncv_v = d.dpdv
         if plot_e:
             line = ax1.plot(1e-6 * ncv_v / d.thickness, 1e6 * ncv)
             lines.append(line[0])
@@ -249,6 +506,99 @@ def lcm_plot(data, legend=None):
 
 
 class SampleData:
+    # assigning any of these clears the cache of derived quantities
+    _base_attrs = frozenset(
+        ("time", "voltage", "current", "polarization", "thickness", "area",
+         "temp", "lcm_voltage", "lcm_current")
+    )
+
+    def __setattr__(self, name, value):
+        if name in self._base_attrs:
+            self.__dict__.get("_cache", {}).clear()
+        object.__setattr__(self, name, value)
+
+    def clear_cache(self):
+        """
+        Clears cached derived quantities. Needed only after modifying a
+        data array in place, assigning a new array clears the cache
+        automatically.
+        """
+        self._cache.clear()
+
+    # array attributes compared exactly / with a tolerance by __eq__
+    _exact_attrs = ()
+    _approx_attrs = ()
+
+    def _content_hash(self, attrs):
+        """sha1 of type, area, thickness and the given arrays as float32."""
+        h = hashlib.sha1(type(self).__name__.encode())
+        h.update(np.array([self.area, self.thickness], dtype=float).tobytes())
+        for attr in attrs:
+            a = np.asarray(getattr(self, attr), dtype=np.float32) + np.float32(0)  # -0 -> 0
+            h.update(attr.encode())
+            h.update(np.int64(a.size).tobytes())
+            h.update(a.tobytes())
+        return h.hexdigest()
+
+    @property
+    def fingerprint(self):
+        """
+        Hash of the measurement content (area, thickness and data arrays
+        quantized to float32). Computed once and cached until the data
+        changes. Measurements with different fingerprints are never equal.
+        """
+        return self._cached(
+            "fingerprint",
+            lambda: self._content_hash(self._exact_attrs + self._approx_attrs),
+        )
+
+    def __hash__(self):
+        # __eq__ rejects different fingerprints, so equal objects hash equal
+        return hash(self.fingerprint)
+
+    def derive(self, **changes):
+        """
+        Creates a new measurement object from this one with some attributes
+        replaced. Unchanged data arrays are shared with this object as
+        read-only views rather than copied, so chained processing steps only
+        allocate the arrays they actually change.
+        
+        Parameters
+        ----------
+        **changes
+            Attributes to replace, e.g. current=new_current.
+        
+        Returns
+        -------
+        derived : same type as self
+            New object. Writing into a shared array of it raises an error,
+            assign a new array instead.
+        """
+        derived = copy.copy(self)
+        object.__setattr__(derived, "_cache", dict(self._cache))
+        for name, value in vars(self).items():
+            if name in changes or name == "_cache":
+                continue
+            if isinstance(value, np.ndarray):
+                view = value.view()
+                view.flags.writeable = False
+                object.__setattr__(derived, name, view)
+            elif isinstance(value, (list, dict)):
+                object.__setattr__(derived, name, copy.copy(value))
+        for name, value in changes.items():
+            setattr(derived, name, value)
+        return derived
+
+    def _cached(self, key, func):
+        """Returns func() from the cache, computing it on first use. Arrays
+        are made read-only since they are shared between callers."""
+        if key not in self._cache:
+            value = func()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._cache[key] = value
+        return self._cache[key]
+
     def __init__(self, thickness=13e-7, area=1e-4, temperature=300):
         """
         Parameters
@@ -267,6 +617,7 @@ class SampleData:
         -------
         n/a
         """
+        self._cache = {}
         self.sample_name = ""
         self.thickness = thickness  # cm
         self.area = area  # cm^2
@@ -274,6 +625,8 @@ class SampleData:
 
 
 class HysteresisData(SampleData):
+    _exact_attrs = ("voltage", "polarization", "time", "current")
+
     def __init__(self, freq=100.0, **kwargs):
         """
         Inherits SampleData. See that class for info on thickness, area, 
@@ -309,6 +662,8 @@ class HysteresisData(SampleData):
 
     def __eq__(self, other):
         if type(self) == type(other):
+            if self.fingerprint != other.fingerprint:
+                return False
             if (self.area == other.area and
                     self.thickness == other.thickness and
                     np.array_equal(self.voltage, other.voltage) and
@@ -321,15 +676,126 @@ class HysteresisData(SampleData):
         else:
             return False
 
+    __hash__ = SampleData.__hash__
+
     @property
     def field(self):
-        return self.voltage/self.thickness
+        return self._cached("field", lambda: np.asfarray(self.voltage) / self.thickness)
 
     @property
     def dt(self):
         return self.time[1] - self.time[0]
 
+    @property
+    def dvdt(self):
+        """dV/dt between consecutive points (V/s), one point shorter than voltage."""
+        return self._cached("dvdt", lambda: np.diff(np.asfarray(self.voltage)) / self.dt)
+
+    @property
+    def dvdt_mean(self):
+        """Mean of abs(dV/dt) over the measurement (V/s)."""
+        return self._cached("dvdt_mean", lambda: np.mean(np.abs(self.dvdt)))
+
+    @property
+    def dpdv(self):
+        """
+        dP/dV between consecutive points (F/cm^2) and the voltage at the
+        midpoint of each step.
+        """
+        def calc():
+            v = np.asfarray(self.voltage)
+            dpdv = np.diff(np.asfarray(self.polarization)) / np.diff(v)
+            dpdv.flags.writeable = False
+            v_mid = 0.5 * (v[1:] + v[:-1])
+            v_mid.flags.writeable = False
+            return dpdv, v_mid
+
+        return self._cached("dpdv", calc)
 
+    def fft(self, attr="current"):
+        """
+        FFT of an array attribute of the measurement, e.g. 'current'.
+        
+        Parameters
+        ----------
+        attr : str
+            Name of the array attribute.
+        
+        Returns
+        -------
+        pf : complex np array
+            Full (two-sided) FFT of the data.
+        """
+        return self._cached(("fft", attr), lambda: np.fft.fft(getattr(self, attr)))
+
+    def branch(self, branch="up"):
+        """
+        Indices of the points on the ascending ('up') or descending ('down')
+        voltage branch, sorted by voltage. Turning points belong to both
+        branches. Cached until the data arrays change.
+        
+        Parameters
+        ----------
+        branch : str
+            'up' or 'down'
+        
+        Returns
+        -------
+        idx : 1d np array
+            Indices into the data arrays.
+        """
+        if branch not in ("up", "down"):
+            raise ValueError("branch must be 'up' or 'down'")
+
+        def calc():
+            v = np.asfarray(self.voltage)
+            dv = np.diff(v)
+            step = dv > 0 if branch == "up" else dv < 0
+            on_branch = np.zeros(len(v), dtype=bool)
+            on_branch[1:] |= step
+            on_branch[:-1] |= step
+            idx = np.flatnonzero(on_branch)
+            return idx[np.argsort(v[idx], kind="stable")]
+
+        return self._cached(("branch", branch), calc)
+
+    def branch_data(self, attr, branch="up"):
+        """
+        Array attribute (e.g. 'voltage', 'field', 'polarization') restricted
+        to one voltage branch and sorted by voltage. Cached until the data
+        arrays change.
+        """
+        return self._cached(
+            ("branch_data", attr, branch),
+            lambda: np.asarray(getattr(self, attr))[self.branch(branch)],
+        )
+
+    def branch_interp(self, x, attr="polarization", branch="up", x_attr="voltage"):
+        """
+        Interpolates an array attribute at arbitrary points on the ascending
+        or descending voltage branch, e.g. P(E) on the up branch.
+        
+        Parameters
+        ----------
+        x : float or 1d np array
+            Query points in units of x_attr.
+        attr : str
+            Name of the array attribute to interpolate.
+        branch : str
+            'up' or 'down'
+        x_attr : str
+            'voltage' or 'field'
+        
+        Returns
+        -------
+        y : float or 1d np array
+            Interpolated values, NaN outside of the branch.
+        """
+        y = branch_interp([self], np.ravel(x), attr, branch, x_attr)[0]
+        return y.reshape(np.shape(x))
+
+
+    @profiling.timed("tsv_read")
     def tsv_read(self, filename, verbose=False):
         """
         Imports TSV measurement data previously parsed by tfDataTSV_v4.pl. 
@@ -386,7 +852,10 @@ class HysteresisData(SampleData):
         self.voltage = np.asfarray(self.voltage)
         self.current = np.asfarray(self.current)  # A
         self.polarization = 1e-6 * np.asfarray(self.polarization)  # C/cm^2
+        profiling.count("files parsed")
+        profiling.count("rows parsed", len(self.time))
 
+    @profiling.timed("leakage_compensation")
     def leakage_compensation(self, leakage_data):
         """
         Removes leakage current contribution from hysteresis data using 
@@ -394,42 +863,31 @@ class HysteresisData(SampleData):
 
         Parameters
         ----------
-        leakage_data: LeakageData
-            Object to use in compensation.
+        leakage_data: LeakageData or LeakageSurface
+            Object to use in compensation. A LeakageSurface is evaluated at
+            the temperature of this measurement.
         
         Returns
         -------
         comp_data: HysteresisData
-            Deep copy of self with leakage current removed.
+            Copy of self with leakage current removed, sharing the unchanged
+            arrays with self (see derive).
         """
         ld = leakage_data
 
-        if ld.lcm_parms == []:
+        if len(ld.lcm_parms) == 0:
             warn(
                 "Please run lcm_fit on the Leakage Data before attempting compensation.",
                 RuntimeWarning,
             )
             return self
 
-        comp_data = copy.deepcopy(self)  #
-
-        for j, i in enumerate(comp_data.current):
-            ilkg = leakage_func(self.voltage[j], *ld.lcm_parms)
-            comp_data.current[j] = i - ilkg
-
-        comp_data.current = comp_data.current - np.mean(comp_data.current)
+        ilkg = ld.leakage_current(self.voltage, self.temp)
+        current = self.current - ilkg
+        current = current - np.mean(current)
 
-        testpol = np.zeros(len(comp_data.current))
-        for i in range(np.size(testpol)):
-            if i == 0:
-                next
-            else:
-                testpol[i] = testpol[i - 1] + comp_data.current[i] * self.dt / self.area
-
-        offset = max(testpol) - (max(testpol) - min(testpol)) / 2
-
-        testpol = testpol - offset
-        comp_data.polarization = testpol
+        testpol = integrate_current(current, self.dt, self.area)
+        comp_data = self.derive(current=current, polarization=testpol)
 
         return comp_data
 
@@ -485,8 +943,9 @@ class HysteresisData(SampleData):
          
         Parameters
         ----------
-        y : np array 
-            Data to be plotted
+        y : np array or str
+            Data to be plotted, or the name of an array attribute (e.g.
+            'current') to use the cached FFT of that attribute.
         
         Returns
         -------
@@ -494,7 +953,7 @@ class HysteresisData(SampleData):
         """
         n = len(self.time)
 
-        pf = np.fft.fft(y)
+        pf = self.fft(y) if isinstance(y, str) else np.fft.fft(y)
         tf = np.linspace(0, 1 / (2 * self.dt), n // 2)
 
         fig1 = plt.figure()
@@ -563,8 +1022,8 @@ class HysteresisData(SampleData):
         Can be used to investigate noise in capacitance extraction.
         """
 
-        dvdt = np.abs(np.diff(self.voltage) / self.dt)
-        avg = np.mean(dvdt)
+        dvdt = np.abs(self.dvdt)
+        avg = self.dvdt_mean
 
         fig1 = plt.figure()
         fig1.set_facecolor("white")
@@ -593,8 +1052,7 @@ class HysteresisData(SampleData):
         fig1.set_facecolor("white")
         ax1 = fig1.add_subplot(111)
 
-        ncv = np.diff(self.polarization) / np.diff(self.voltage)
-        ncv_v = 0.5 * (self.voltage[1:] + self.voltage[:-1])
+        ncv, ncv_v = self.dpdv
         if plot_e:
             ax1.plot(1e-6 * ncv_v / self.thickness, 1e6 * ncv)
             ax1.set_xlabel("Electric Field (MV/cm)")
@@ -605,6 +1063,7 @@ class HysteresisData(SampleData):
             ax1.set_xlabel("Voltage (V)")
             ax1.set_ylabel(r"Capacitance ($\mu{}F/cm^2$)")
 
+    @profiling.timed("forc_calc")
     def forc_calc(self, plot=False, linear=True, filt_iter=None, filt_dim=[1, 1]):
         """
         Finds minima/maxima in voltage data, cuts down data to only reversal 
@@ -746,6 +1205,9 @@ class HysteresisData(SampleData):
 
 
 class LeakageData(SampleData):
+    _exact_attrs = ("lcm_voltage",)
+    _approx_attrs = ("lcm_current",)
+
     def __init__(self, **kwargs):
         SampleData.__init__(self, **kwargs)
         self.lcm_voltage = []
@@ -759,6 +1221,8 @@ class LeakageData(SampleData):
 
     def __eq__(self, other):
         if type(self) == type(other):
+            if self.fingerprint != other.fingerprint:
+                return False
             if (self.area == other.area and
                     self.thickness == other.thickness and
                     np.array_equal(self.lcm_voltage, other.lcm_voltage) and
@@ -770,6 +1234,8 @@ class LeakageData(SampleData):
         else:
             return False
 
+    __hash__ = SampleData.__hash__
+
     def lcm_read(self, filename):
         """
         Imports TSV measurement data previously parsed by tfDataTSV_v5.pl
@@ -812,6 +1278,7 @@ class LeakageData(SampleData):
         self.lcm_voltage = np.asfarray(self.lcm_voltage)  # V
         self.lcm_current = self.area * 1e-6 * np.asfarray(self.lcm_current)  # A
 
+    @profiling.timed("lcm_fit")
     def lcm_fit(
             self,
             func=leakage_func,
@@ -819,28 +1286,83 @@ class LeakageData(SampleData):
             verbose=False,
     ):
         """
-        Attempts to fit parameters to leakage current, stores in hd object
+        Attempts to fit parameters to leakage current, stores in hd object.
+
+        The default leakage_func is fit exactly with leakage_polyfit; other
+        functions are fit with curve_fit.
         
         Parameters
         ----------
         func : function 
             Defines eqn to be used to fit data
         init_guess : np array of appropriate length to match func            
-            Provides initial values for curve_fit
+            Provides initial values for curve_fit (unused for leakage_func)
         verbose : bool
             If True, print calculated fit parameters and std dev
         Returns
         -------
         n/a
         """
-        # FIXME: curve_fit has trouble converging with some data
-        self.lcm_parms, pcov = curve_fit(
-            func, self.lcm_voltage, self.lcm_current, p0=init_guess
-        )
+        if func is leakage_func:
+            self.lcm_parms, pcov = leakage_polyfit(self.lcm_voltage, self.lcm_current)
+        else:
+            self.lcm_parms, pcov = curve_fit(
+                func, self.lcm_voltage, self.lcm_current, p0=init_guess
+            )
+        profiling.count("leakage fits")
         if verbose:
             print("Fit Parms:", self.lcm_parms)
             print("Std Dev:", np.sqrt(np.diag(pcov)))
 
+    def lcm_bootstrap(self, n_boot=1000, alpha=0.05, method="bootstrap", seed=None):
+        """
+        Confidence intervals of the leakage_func fit parameters from
+        resampling of the measured points. All replicates are solved as one
+        batch of linear fits with the shift g held at its fit value.
+
+        Parameters
+        ----------
+        n_boot : int
+            Number of bootstrap replicates.
+        alpha : float
+            Significance level, e.g. 0.05 for a 95% confidence interval.
+        method : str
+            "bootstrap" or "jackknife"
+        seed : int
+            Seed of the random number generator.
+
+        Returns
+        -------
+        ci : np array
+            Lower (row 0) and upper (row 1) limits of lcm_parms.
+        """
+        if len(self.lcm_parms) == 0:
+            self.lcm_fit()
+        g = self.lcm_parms[6]
+        x = np.vander(self.lcm_voltage - g, 6)
+        coef = stats.resample_lstsq(x, self.lcm_current, n_boot, method, seed)
+        replicates = np.column_stack((coef, np.full(len(coef), g)))
+        return stats.confidence_interval(replicates, alpha, method)
+
+    def leakage_current(self, voltage, temp=None):
+        """
+        Evaluates the fit leakage model.
+
+        Parameters
+        ----------
+        voltage : np array
+            Voltages at which to calculate leakage current.
+        temp : float
+            Unused, the fit is only valid at the temperature of this data.
+            Present for compatibility with LeakageSurface.
+
+        Returns
+        -------
+        np array
+            Leakage current (A)
+        """
+        return leakage_func(voltage, *self.lcm_parms)
+
     def lcm_plot(self, func=leakage_func):
         """ 
         Plots measured leakage current with fit data.
@@ -858,6 +1380,106 @@ class LeakageData(SampleData):
         ax.set_ylabel(r"Leakage Current ($\mu{}A$)")
 
 
+class LeakageSurface:
+    def __init__(self, v_order=5, t_order=3):
+        """
+        Leakage current model I(V, T) fit jointly to leakage measurements at
+        several temperatures: a polynomial in V whose coefficients are
+        polynomials in T. Can be used in place of a LeakageData object for
+        HysteresisData.leakage_compensation at any temperature.
+
+        Parameters
+        ----------
+        v_order : int
+            Order of the polynomial in voltage.
+        t_order : int
+            Order of the polynomial in temperature. Limited to one less
+            than the number of measured temperatures.
+
+        Returns
+        -------
+        n/a
+        """
+        self.v_order = v_order
+        self.t_order = t_order
+        self.lcm_parms = []
+        self.v_center = 0
+        self.v_scale = 1
+        self.t_center = 0
+        self.t_scale = 1
+
+    def _basis(self, voltage, temp):
+        x = (np.asfarray(voltage) - self.v_center) / self.v_scale
+        t = (np.asfarray(temp) - self.t_center) / self.t_scale
+        t_order, v_order = np.shape(self.lcm_parms)
+        vpow = x[..., None] ** np.arange(v_order)
+        tpow = t[..., None] ** np.arange(t_order)
+        return tpow[..., :, None] * vpow[..., None, :]
+
+    def fit(self, leakage_data, verbose=False):
+        """
+        Fits the model to all given leakage measurements in one linear
+        least squares solve.
+
+        Parameters
+        ----------
+        leakage_data : list
+            LeakageData objects measured at one or more temperatures.
+        verbose : bool
+            If True, print calculated fit parameters
+
+        Returns
+        -------
+        n/a
+        """
+        voltage = np.concatenate([d.lcm_voltage for d in leakage_data])
+        current = np.concatenate([d.lcm_current for d in leakage_data])
+        temp = np.concatenate(
+            [np.full(len(d.lcm_voltage), float(d.temp)) for d in leakage_data]
+        )
+        # leakage grows by orders of magnitude with temperature, so each
+        # curve is weighted by its own magnitude to fit all temps equally
+        weight = np.concatenate(
+            [
+                np.full(len(d.lcm_current), 1 / np.sqrt(np.mean(d.lcm_current ** 2)))
+                for d in leakage_data
+            ]
+        )
+
+        # center and scale inputs for numerical conditioning
+        self.v_center = np.mean(voltage)
+        self.v_scale = np.max(np.abs(voltage - self.v_center)) or 1
+        self.t_center = np.mean(temp)
+        self.t_scale = np.max(np.abs(temp - self.t_center)) or 1
+
+        t_order = min(self.t_order, len(np.unique(temp)) - 1)
+        self.lcm_parms = np.zeros((t_order + 1, self.v_order + 1))
+        basis = self._basis(voltage, temp).reshape(len(voltage), -1)
+        coef = np.linalg.lstsq(basis * weight[:, None], current * weight, rcond=None)[0]
+        self.lcm_parms = coef.reshape(self.lcm_parms.shape)
+        if verbose:
+            print("Fit Parms:", self.lcm_parms)
+
+    def leakage_current(self, voltage, temp):
+        """
+        Evaluates the fit leakage model.
+
+        Parameters
+        ----------
+        voltage : np array
+            Voltages at which to calculate leakage current.
+        temp : float or np array
+            Temperature(s) in K, broadcast against voltage.
+
+        Returns
+        -------
+        np array
+            Leakage current (A)
+        """
+        voltage, temp = np.broadcast_arrays(voltage, temp)
+        return np.sum(self._basis(voltage, temp) * self.lcm_parms, axis=(-2, -1))
+
+
 def main():
     plt.close("all")
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Figures of merit of hysteresis loops (Pr, Ec, Pmax, imprint, energies),
+calculated for a whole batch of HysteresisData objects at once.
+
+Loops are split into ascending and descending voltage branches and the
+zero crossings of voltage (for Pr) and polarization (for Vc) are found and
+linearly interpolated on all curves in a single pass over a padded 2d
+array. The first crossing of each kind in a curve is used.
+"""
+import numpy as np
+from ferro import data as hd
+
+metrics_dtype = np.dtype(
+    [
+        ("pr_pos", float),  # C/cm^2, P at V = 0 on descending branch
+        ("pr_neg", float),  # C/cm^2, P at V = 0 on ascending branch
+        ("psw", float),  # C/cm^2, switchable polarization pr_pos - pr_neg
+        ("pmax", float),  # C/cm^2
+        ("pmin", float),  # C/cm^2
+        ("vc_pos", float),  # V, P = 0 on ascending branch
+        ("vc_neg", float),  # V, P = 0 on descending branch
+        ("ec_pos", float),  # V/cm
+        ("ec_neg", float),  # V/cm
+        ("imprint", float),  # V, (vc_pos + vc_neg) / 2
+        ("wloss", float),  # J/cm^3, loop area
+        ("wrec", float),  # J/cm^3, energy released from pmax to pr_pos
+        ("freq", float),  # Hz
+        ("temp", float),  # K
+    ]
+)
+
+
+def _first_crossing(x, y, mask):
+    """
+    Interpolates y at the first segment of each row flagged in mask, where
+    x crosses 0 between samples k and k + 1. NaN where there is none.
+    """
+    rows = np.arange(x.shape[0])
+    found = mask.any(axis=1)
+    k = np.argmax(mask, axis=1)
+    x0, x1 = x[rows, k], x[rows, k + 1]
+    y0, y1 = y[rows, k], y[rows, k + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(x0 != x1, x0 / (x0 - x1), 0)
+    return np.where(found, y0 + t * (y1 - y0), np.nan), np.where(found, k, -1)
+
+
+def loop_metrics_array(voltage, polarization, thickness, close=True):
+    """
+    Calculates figures of merit from stacked loop data.
+
+    Parameters
+    ----------
+    voltage : 2d np array
+        Voltage of each curve (one per row), padded with NaN.
+    polarization : 2d np array
+        Polarization (C/cm^2) of each curve, padded with NaN.
+    thickness : float or 1d np array
+        Sample thickness (cm) of each curve.
+    close : bool
+        If True, each curve is closed by repeating its first sample after
+        its last, so crossings between the end and start of a full cycle
+        are found.
+
+    Returns
+    -------
+    metrics : np structured array
+        One record per curve, see metrics_dtype. freq and temp are NaN.
+    """
+    v = np.atleast_2d(np.asfarray(voltage))
+    p = np.atleast_2d(np.asfarray(polarization))
+    thickness = np.broadcast_to(np.asfarray(thickness), v.shape[:1])
+    if close:
+        rows = np.arange(v.shape[0])
+        n = np.sum(np.isfinite(v), axis=1)
+        v = np.column_stack((v, np.full(v.shape[0], np.nan)))
+        p = np.column_stack((p, np.full(p.shape[0], np.nan)))
+        v[rows, n] = v[:, 0]
+        p[rows, n] = p[:, 0]
+    e = v / thickness[:, None]
+
+    out = np.full(v.shape[0], np.nan, dtype=metrics_dtype)
+    if v.shape[1] < 2:
+        return out
+
+    v0, v1 = v[:, :-1], v[:, 1:]
+    p0, p1 = p[:, :-1], p[:, 1:]
+    up = v1 > v0
+    down = v1 < v0
+
+    out["pr_pos"], k_pr = _first_crossing(v, p, down & (v0 > 0) & (v1 <= 0))
+    out["pr_neg"] = _first_crossing(v, p, up & (v0 < 0) & (v1 >= 0))[0]
+    out["vc_pos"] = _first_crossing(p, v, up & (p0 < 0) & (p1 >= 0))[0]
+    out["vc_neg"] = _first_crossing(p, v, down & (p0 > 0) & (p1 <= 0))[0]
+    out["ec_pos"] = out["vc_pos"] / thickness
+    out["ec_neg"] = out["vc_neg"] / thickness
+    out["psw"] = out["pr_pos"] - out["pr_neg"]
+    out["imprint"] = (out["vc_pos"] + out["vc_neg"]) / 2
+    with np.errstate(invalid="ignore"):
+        out["pmax"] = np.nanmax(p, axis=1)
+        out["pmin"] = np.nanmin(p, axis=1)
+
+    # trapezoidal integral of E dP along the loop; padding contributes 0
+    e_mid = (e[:, :-1] + e[:, 1:]) / 2
+    dp = p1 - p0
+    work = np.nan_to_num(e_mid * dp)
+    out["wloss"] = np.abs(np.sum(work, axis=1))
+
+    # energy released on the descending branch from Pmax down to V = 0
+    seg = np.arange(v.shape[1] - 1)
+    k_max = np.argmax(np.nan_to_num(p, nan=-np.inf), axis=1)
+    release = down & (seg >= k_max[:, None]) & (seg < k_pr[:, None])
+    wrec = -np.sum(np.where(release, work, 0), axis=1)
+    # partial segment between the last sample above 0 V and pr_pos
+    rows = np.arange(v.shape[0])
+    k = np.maximum(k_pr, 0)
+    wrec += e[rows, k] / 2 * (p[rows, k] - out["pr_pos"])
+    out["wrec"] = np.where(k_pr >= 0, wrec, np.nan)
+
+    return out
+
+
+def loop_metrics(data):
+    """
+    Calculates figures of merit of hysteresis measurements.
+
+    Parameters
+    ----------
+    data : list or HysteresisData
+        HysteresisData objects to analyze.
+
+    Returns
+    -------
+    metrics : np structured array
+        One record per measurement with fields pr_pos, pr_neg, psw, pmax,
+        pmin, vc_pos, vc_neg, ec_pos, ec_neg, imprint, wloss, wrec, freq and
+        temp. Values that cannot be found in a curve are NaN.
+    """
+    if isinstance(data, hd.HysteresisData):
+        data = [data]
+    voltage = hd.stack_data(data, "voltage")[0]
+    polarization = hd.stack_data(data, "polarization")[0]
+    thickness = np.array([d.thickness for d in data], dtype=float)
+
+    out = loop_metrics_array(voltage, polarization, thickness)
+    out["freq"] = [d.freq for d in data]
+    out["temp"] = [d.temp for d in data]
+    return out
@@ -6,19 +6,151 @@ Created on Mon Apr 10 14:53:15 2017
 """
 
 # import re
-import copy  # used for creating C/Ilkg compensated copies of exp data
 import matplotlib.pyplot as plt
 from matplotlib.colors import Normalize
 import scipy.constants as sc
 # from scipy.stats import skew
 # from scipy.stats import skewnorm
-from scipy.optimize import fsolve, minimize, basinhopping, fmin_slsqp
+from scipy.optimize import fsolve, minimize, basinhopping, fmin_slsqp, nnls
 import numpy as np
 from mpldatacursor import datacursor
-# from ferro import data as hd
+from ferro import data as hd
+from ferro import stats
+from ferro import profiling
 # from mpl_toolkits.mplot3d import Axes3D
 
 
+def relative_permittivity(c, thickness, area):
+    """
+    Relative permittivity of a parallel plate capacitor.
+
+    Parameters
+    ----------
+    c: float or np array, capacitance (F)
+    thickness: float, film thickness (cm)
+    area: float, capacitor area (cm^2)
+
+    Returns
+    -------
+    er: float or np array
+    """
+    return c * thickness / (area * sc.epsilon_0 * 1e-2)
+
+
+def domain_array(domains, attrs=("a", "b", "g", "ebias")):
+    """
+    Stacks the parameters of a list of LandauDomain objects into an array
+    so that they can be evaluated for all domains at once.
+
+    Parameters
+    ----------
+    domains: list of LandauDomain objects. A 2d np array is assumed to
+        already hold the parameters and is returned unchanged.
+    attrs: sequence of str, domain attributes to stack (one per column)
+
+    Returns
+    -------
+    parms: 2d np array of shape (number of domains, len(attrs))
+    """
+    if isinstance(domains, np.ndarray):
+        return domains
+    return np.array(
+        [[getattr(d, k) for k in attrs] for d in domains], dtype=float
+    ).reshape(-1, len(attrs))
+
+
+def landau_roots(efield, domains):
+    """
+    Finds all real polarization values at which each domain is in
+    equilibrium with the applied field, i.e. the real roots of
+    2aP + 4bP^3 + 6gP^5 - ebias - E = 0.
+
+    The roots are the eigenvalues of the companion matrices of the
+    polynomials, which are solved for all domains and fields in one batched
+    call. Memory use scales with len(efield) * number of domains.
+
+    Parameters
+    ----------
+    efield: float or 1d np array of field values (V/cm)
+    domains: list containing all domain objects in the film, or an n by 4
+        array of domain parameters as returned by domain_array
+
+    Returns
+    -------
+    roots: np array of shape (len(efield), number of domains, 5) holding the
+        real roots in ascending order, padded with NaN.
+    """
+    a, b, g, ebias = domain_array(domains).T
+    efield = np.atleast_1d(np.asfarray(efield))
+    const = -(ebias[None, :] + efield[:, None])
+    zero = np.zeros_like(a)
+
+    roots = np.full(const.shape + (5,), np.nan)
+    # coefficients (highest power first) of each degree the polynomial
+    # drops to when its higher order terms are 0
+    for terms, mask in (
+        ((6 * g, zero, 4 * b, zero, 2 * a), g != 0),
+        ((4 * b, zero, 2 * a), (g == 0) & (b != 0)),
+        ((2 * a,), (g == 0) & (b == 0) & (a != 0)),
+    ):
+        if not np.any(mask):
+            continue
+        deg = len(terms)
+        lead = terms[0][mask]
+
+        comp = np.zeros((len(efield), len(lead), deg, deg))
+        for i, t in enumerate(terms[1:]):
+            comp[..., 0, i] = -t[mask] / lead
+        comp[..., 0, deg - 1] = -const[:, mask] / lead
+        sub = np.arange(deg - 1)
+        comp[..., sub + 1, sub] = 1
+
+        eig = np.linalg.eigvals(comp)
+        is_real = np.abs(eig.imag) <= 1e-6 * np.maximum(np.abs(eig.real), 1e-30)
+        roots[:, mask, :deg] = np.sort(np.where(is_real, eig.real, np.nan), axis=-1)
+
+    return roots
+
+
+def hysteron_states(esweep, ec, ebias, init_state=None):
+    """
+    Calculates the state of simple hysterons at every point of a field
+    sweep. A hysteron switches up when the field increases past ec + ebias
+    and down when it decreases past -ec + ebias.
+
+    Parameters
+    ----------
+    esweep: 1d np array of field values
+    ec: 1d np array, coercive field of each hysteron
+    ebias: 1d np array, bias field of each hysteron
+    init_state: np array containing initial state of hysterons (-1 or 1).
+        Defaults to -1 for all hysterons.
+
+    Returns
+    -------
+    states: 2d np array (len(esweep) by number of hysterons) of states
+    """
+    esweep = np.asfarray(esweep)
+    ec = np.asfarray(ec)
+    ebias = np.asfarray(ebias)
+    if init_state is None:
+        init_state = -np.ones(len(ec))
+
+    sweep_dir = np.gradient(esweep)[:, None]
+    step = np.arange(len(esweep), dtype=np.int32)[:, None]
+    up = (sweep_dir > 0) & (esweep[:, None] >= ec + ebias)
+    down = (sweep_dir < 0) & (esweep[:, None] <= -ec + ebias)
+
+    # index of the most recent switching event in each direction
+    last_up = np.maximum.accumulate(np.where(up, step, -1), axis=0)
+    last_down = np.maximum.accumulate(np.where(down, step, -1), axis=0)
+
+    states = np.where(last_up > last_down, 1.0, -1.0)
+    untouched = last_up == last_down
+    states[untouched] = np.broadcast_to(init_state, states.shape)[untouched]
+    return states
+
+
 class LandauFilm:
     """
     Base class for Landau Modeling of ferroelectric thin films using alpha
@@ -59,18 +191,11 @@ class LandauFilm:
             Capacitance in farads
         """
 
-        med_i = np.zeros(len(hyst_data))
-        freqs = np.zeros(len(hyst_data))
-        dvdt = np.zeros(len(hyst_data))
-
-        for i, d in enumerate(hyst_data):
-            freqs[i] = d.freq
-            dvdt[i] = np.mean(np.abs(np.diff(d.voltage) / d.dt))
-            med_i[i] = np.median(np.abs(d.current))
+        dvdt, med_i = self._c_points(hyst_data)
 
         i_fit = np.polyfit(dvdt, med_i, 1)
         i_fit_fn = np.poly1d(i_fit)
-        er = i_fit[0] * self.thickness / (self.area * sc.epsilon_0 * 1e-2)
+        er = relative_permittivity(i_fit[0], self.thickness, self.area)
 
         if plot:
             fig2 = plt.figure()
@@ -85,6 +210,54 @@ class LandauFilm:
 
         return i_fit[0]
 
+    def _c_points(self, hyst_data):
+        """Mean abs(dV/dt) and median abs(current) of each measurement."""
+        med_i = np.zeros(len(hyst_data))
+        dvdt = np.zeros(len(hyst_data))
+
+        for i, d in enumerate(hyst_data):
+            dvdt[i] = d.dvdt_mean
+            med_i[i] = np.median(np.abs(d.current))
+
+        return dvdt, med_i
+
+    def c_bootstrap(
+        self, hyst_data, n_boot=1000, alpha=0.05, method="bootstrap", seed=None
+    ):
+        """
+        Confidence intervals of the capacitance from c_calc and of the
+        relative permittivity derived from it, by resampling the
+        measurements. All replicates are solved as one batch of linear fits.
+
+        Parameters
+        ----------
+        hyst_data : array_like of HysteresisData files.
+        n_boot : int
+            Number of bootstrap replicates.
+        alpha : float
+            Significance level, e.g. 0.05 for a 95% confidence interval.
+        method : str
+            "bootstrap" or "jackknife"
+        seed : int
+            Seed of the random number generator.
+
+        Returns
+        -------
+        c_ci : np array
+            Lower and upper limit of the capacitance in farads
+        er_ci : np array
+            Lower and upper limit of the relative permittivity
+        """
+        dvdt, med_i = self._c_points(hyst_data)
+        x = np.column_stack((dvdt, np.ones(len(dvdt))))
+        c = stats.resample_lstsq(x, med_i, n_boot, method, seed)[:, 0]
+        er = relative_permittivity(c, self.thickness, self.area)
+        return (
+            stats.confidence_interval(c, alpha, method),
+            stats.confidence_interval(er, alpha, method),
+        )
+
+    @profiling.timed("c_compensation")
     def c_compensation(self, data, plot=False):
         """ 
         Calculates Pr value by subtracting out effect of capacitance in PV curve
@@ -106,33 +279,12 @@ class LandauFilm:
 
         # TODO: Test with high leakage current samples
 
-        comp_data = copy.deepcopy(data)  #
-
-        dvdt = np.mean(np.abs(np.diff(data.voltage) / data.dt))
-        #        dvdt = (data.voltage[1]-data.voltage[0])/data.dt
-        icap = self.c * dvdt
-
-        for j, i in enumerate(data.current):
-            if abs(i) >= icap:
-                comp_data.current[j] = i - np.sign(i) * icap
-            else:
-                comp_data.current[j] = 0
-
-        testpol = np.zeros(len(data.current))
-        for i in range(np.size(testpol)):
-            if i == 0:
-                next
-            else:
-                testpol[i] = (
-                    testpol[i - 1]
-                    + comp_data.current[i] * comp_data.dt / comp_data.area
-                )
+        icap = self.c * data.dvdt_mean
+        current = hd.capacitance_compensation(data.current, icap)
 
+        testpol = hd.integrate_current(current, data.dt, data.area)
         pr = (max(testpol) - min(testpol)) / 2
-        offset = max(testpol) - (max(testpol) - min(testpol)) / 2
-
-        testpol = testpol - offset
-        comp_data.polarization = testpol
+        comp_data = data.derive(current=current, polarization=testpol)
 
         if plot:
             data.hyst_plot()
@@ -140,7 +292,8 @@ class LandauFilm:
 
         return comp_data, pr
 
-    def domain_gen(self, e, er, prob, n=100, plot=False, retParms=False):
+    @profiling.timed("domain_gen")
+    def domain_gen(self, e, er, prob, n=100, plot=False, retParms=False, rng=None):
         """
         Creates N ferroelectric domains with Ebias and Ec based on the given
         FORC probability distribution.
@@ -157,6 +310,8 @@ class LandauFilm:
         n: int, number of domains        
         plot: bool, triggers plotting of generated parms        
         retParms: bool, triggers return of array of domain parms
+        rng: np.random.Generator or RandomState the domains are drawn
+            with. Defaults to the global numpy random state.
             
         Returns
         -------
@@ -179,10 +334,12 @@ class LandauFilm:
             else:
                 index[i] = index[i - 1] + 1
         #        print (probf)
+        choice = np.random.choice if rng is None else rng.choice
         domain_list = []
         domains = np.zeros([n, 4])
+        profiling.count("domains generated", n)
         for i in range(n):
-            j = int(np.random.choice(index, p=probf))
+            j = int(choice(index, p=probf))
             egrain = e[j % prob.shape[1]]
             ergrain = er[j // prob.shape[1]]
             domains[i, 0] = egrain
@@ -207,29 +364,67 @@ class LandauFilm:
         else:
             return domain_list
 
-    def get_ufe(self, pvals, domains):
+    def get_ufe(self, pvals, domains, per_domain=False):
         """
         Sums potential energy of all ferroelectric domains in a film to get
         the overall energy landscape.
+
+        All domains are evaluated at once as a matrix product of the powers
+        of P with the stacked (a, b, g, ebias) coefficients of the domains.
           
         Parameters
         ----------
         pvals: np array of polarization values at which to solve Ufe
-        domains: list containing all domain objects in the film
+        domains: list containing all domain objects in the film, or an n by 4
+            array of domain parameters as returned by domain_array
+        per_domain: bool, if True return the landscape of each domain instead
+            of their sum
             
         Returns
         -------
-            uFE: potential energy density landscape of film
+            uFE: potential energy density landscape of film. If per_domain,
+                2d array of shape (len(pvals), number of domains).
         """
+        coeffs = domain_array(domains).T
+        pvals = np.asfarray(pvals)
+        powers = np.stack((pvals ** 2, pvals ** 4, pvals ** 6, -pvals), axis=-1)
 
-        u = np.zeros(len(pvals))
-        for i in domains:
-            u = u + i.get_ufe(pvals)
+        if per_domain:
+            return powers @ coeffs
+        return powers @ coeffs.sum(axis=1)
+
+    def get_efe(self, pvals, domains, per_domain=False):
+        """
+        Sums electric field of all ferroelectric domains in a film, i.e. the
+        derivative of get_ufe with respect to P.
 
-        return u
+        Parameters
+        ----------
+        pvals: np array of polarization values at which to solve Efe
+        domains: list containing all domain objects in the film, or an n by 4
+            array of domain parameters as returned by domain_array
+        per_domain: bool, if True return the field of each domain instead
+            of their sum
 
+        Returns
+        -------
+            eFE: electric field of film. If per_domain, 2d array of shape
+                (len(pvals), number of domains).
+        """
+        coeffs = domain_array(domains).T * np.array([[2], [4], [6], [1]])
+        pvals = np.asfarray(pvals)
+        powers = np.stack(
+            (pvals, pvals ** 3, pvals ** 5, -np.ones_like(pvals)), axis=-1
+        )
+
+        if per_domain:
+            return powers @ coeffs
+        return powers @ coeffs.sum(axis=1)
+
+    @profiling.timed("calc_efe_preisach")
     def calc_efe_preisach(
-        self, esweep, domains, init_state=None, plot=False, c_add=False
+        self, esweep, domains, init_state=None, plot=False, c_add=False,
+        chunk=64
     ):
         """
         Models domains as simple hystereons using ec, pr
@@ -240,32 +435,220 @@ class LandauFilm:
         domains: list containing all domain objects in the film
         init_state: np array containing initial state of hysterons (-1 or 1)
         plot: bool, triggers plotting of generated hysteresis curve
+        chunk: int, number of domains evaluated at once, bounds memory
+            for many domains on long sweeps
             
         Returns
         -------
         p: np array, polarization charge values for film (C/cm^2)
         state: np array, final state of hysterons
         """
-        if init_state == None:
-            state = -np.ones(len(domains))
+        ec, ebias, pr, area = domain_array(domains, ("ec", "ebias", "pr", "area")).T
+        if init_state is None:
+            init_state = -np.ones(len(ec))
+        init_state = np.broadcast_to(init_state, ec.shape)
+        esweep = np.asfarray(esweep)
+        profiling.count("domain steps", len(esweep) * len(ec))
+
+        # Need to sum actual charge rather than charge density, then
+        # convert back into charge density
+        p = np.zeros(len(esweep))
+        state = np.empty(len(ec))
+        for i in range(0, len(ec), chunk):
+            s = slice(i, i + chunk)
+            states = hysteron_states(esweep, ec[s], ebias[s], init_state[s])
+            p += states @ (pr[s] * area[s])
+            state[s] = states[-1]
+        if c_add:
+            p = (p + esweep * self.thickness * self.c) / self.area
         else:
-            state = init_state
+            p = p / self.area
+
+        if plot:
+            fig1 = plt.figure()
+            fig1.set_facecolor("white")
+            plt.cla()
+            ax1 = fig1.add_subplot(111)
+            ax1.set_title("Presiach Modeled Hysteresis")
+            datacursor(ax1.plot(esweep * 1e-6, 1e6 * p))
+            ax1.set_xlabel("Electric Field (MV/cm)")
+            ax1.set_ylabel("Polarization Charge ($\mu{}C/cm^2$)")
+
+        return p, state
+
+    def preisach_fit(self, hyst_data, ec=None, ebias=None, n=30, c_add=False):
+        """
+        Fits a Preisach distribution directly to measured hysteresis loops.
+
+        Every cell of an (ec, ebias) grid is a hysteron with a non-negative
+        weight. The hysteron states for every measurement are computed once
+        and the weights that best reproduce the measured polarization are
+        found with a single non-negative least squares solve. A free
+        polarization offset is fit for each measurement.
+        Unlike forc_calc, this works with any major or minor loops.
+
+        Parameters
+        ----------
+        hyst_data : array_like of HysteresisData objects to fit
+        ec : 1d np array of hysteron coercive fields (V/cm). Defaults to n
+            values up to the largest measured field.
+        ebias : 1d np array of hysteron bias fields (V/cm). Defaults to n
+            values within +/- half the largest measured field.
+        n : int, grid size used for default ec and ebias
+        c_add : bool, if True the linear capacitor contribution (self.c) is
+            removed from the measurements before fitting
+
+        Returns
+        -------
+        ec : 1d np array of coercive field values of the grid
+        ebias : 1d np array of bias field values of the grid
+        weights : 2d np array (len(ebias) by len(ec)) of fitted hysteron
+            polarization (C/cm^2). Pass to preisach_domains to create domains.
+        """
+        emax = max(np.max(np.abs(d.field)) for d in hyst_data)
+        if ec is None:
+            ec = np.linspace(emax / n, emax, n)
+        if ebias is None:
+            ebias = np.linspace(-emax / 2, emax / 2, n)
+        ec_grid, ebias_grid = np.meshgrid(ec, ebias)
+
+        # state response of every cell, computed once for every measurement,
+        # plus +/- offset columns giving each measurement a free offset
+        response = []
+        target = []
+        for i, d in enumerate(hyst_data):
+            offsets = np.zeros((len(d.field), 2 * len(hyst_data)))
+            offsets[:, 2 * i] = 1
+            offsets[:, 2 * i + 1] = -1
+            states = hysteron_states(d.field, ec_grid.ravel(), ebias_grid.ravel())
+            response.append(np.hstack((states, offsets)))
+            if c_add:
+                target.append(d.polarization - d.voltage * self.c / self.area)
+            else:
+                target.append(d.polarization)
+        response = np.vstack(response)
+        target = np.concatenate(target)
+
+        # scale to order 1 for the solver tolerances
+        scale = np.max(np.abs(target))
+        x = nnls(response, target / scale, maxiter=10 * response.shape[1])[0]
+        weights = x[: ec_grid.size].reshape(ec_grid.shape) * scale
+
+        return ec, ebias, weights
+
+    def preisach_domains(self, ec, ebias, weights):
+        """
+        Creates one domain for every hysteron cell with a non-zero weight,
+        e.g. from the output of preisach_fit.
+
+        The area of each domain is its share of the total polarization
+        (self.pr, or the sum of weights if pr is not set).
+
+        Parameters
+        ----------
+        ec : 1d np array of coercive field values of the grid
+        ebias : 1d np array of bias field values of the grid
+        weights : 2d np array (len(ebias) by len(ec)) of hysteron weights
+
+        Returns
+        -------
+        domain_list: list containing domain objects
+        """
+        pr = self.pr if self.pr else np.sum(weights)
+        domain_list = []
+        for i, j in zip(*np.nonzero(weights)):
+            gen_domain = LandauDomain(
+                self, self.area * weights[i, j] / pr, ec[j], ebias[i]
+            )
+            gen_domain.pr = pr
+            domain_list.append(gen_domain)
+        return domain_list
+
+    def calc_efe_landau(
+        self, esweep, domains, init_state=None, max_dp=None, plot=False,
+        c_add=False
+    ):
+        """
+        Models the static (rho = 0) Landau hysteresis of all domains.
+
+        Each domain follows its current equilibrium branch of
+        E = 2aP + 4bP^3 + 6gP^5 - ebias as the field is swept, which is
+        tracked with vectorized Newton iterations seeded from the previous
+        field point. Where a branch ends (or Newton does not converge nearby)
+        the domain jumps to the closest stable root from landau_roots, which
+        produces hysteresis.
 
-        sweepDir = np.gradient(esweep)
+        Parameters
+        ----------
+        esweep: np array of field values for which to calculate P
+        domains: list containing all domain objects in the film. The a, b
+            and g parameters of the domains must be set.
+        init_state: np array, initial polarization of domains (C/cm^2).
+            Defaults to the most negative equilibrium at esweep[0].
+        max_dp: float, largest change in domain polarization between field
+            points accepted from Newton tracking. Defaults to pr/10.
+        plot: bool, triggers plotting of generated hysteresis curve
+        c_add: bool, adds linear capacitor contribution to polarization
+
+        Returns
+        -------
+        p: np array, polarization charge values for film (C/cm^2)
+        state: np array, final polarization of domains
+        """
+        parms = domain_array(domains)
+        a, b, g, ebias = parms.T
+        area, pr = domain_array(domains, ("area", "pr")).T
+        esweep = np.asfarray(esweep)
+        if max_dp is None:
+            max_dp = np.max(np.abs(pr)) / 10
+
+        def efe_defe(state):
+            """E(P) and dE/dP of every domain, in Horner form."""
+            p2 = state * state
+            efe = state * (2 * a + p2 * (4 * b + p2 * 6 * g)) - ebias
+            defe = 2 * a + p2 * (12 * b + p2 * 30 * g)
+            return efe, defe
+
+        def jump(state, prev, e, bad):
+            """Moves domains flagged bad to their closest stable root."""
+            roots = landau_roots(e, parms[bad])[0]
+            r2 = roots * roots
+            slope = 2 * a[bad, None] + r2 * (12 * b[bad, None] + r2 * 30 * g[bad, None])
+            dist = np.where(slope > 0, np.abs(roots - prev[bad, None]), np.inf)
+            found = np.isfinite(dist.min(axis=1, initial=np.inf))
+            new = state[bad]
+            new[found] = roots[found, np.argmin(dist[found], axis=1)]
+            state[bad] = new
+            return state
+
+        if init_state is None:
+            state = np.zeros(len(a))
+            state = jump(state, np.full(len(a), -np.inf), esweep[0],
+                         np.ones(len(a), dtype=bool))
+        else:
+            state = np.asfarray(init_state).copy()
 
         p = np.zeros(len(esweep))
         for j, e in enumerate(esweep):
-            for i, d in enumerate(domains):
-                if sweepDir[j] > 0:
-                    if e >= d.ec + d.ebias:
-                        state[i] = 1
-                elif sweepDir[j] < 0:
-                    if e <= -d.ec + d.ebias:
-                        state[i] = -1
-                # Need to sum actual charge rather than charge density
-                p[j] = p[j] + d.pr * d.area * state[i]
-
-                # convert back into charge density
+            prev = state
+            tol = 1e-9 * (np.abs(ebias) + np.abs(e))
+            for _ in range(8):
+                efe, defe = efe_defe(state)
+                converged = np.abs(efe - e) <= tol + 1e-9 * np.abs(efe + ebias)
+                if np.all(converged):
+                    break
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    state = state - (efe - e) / defe
+
+            bad = ~(converged & (defe > 0) & (np.abs(state - prev) <= max_dp))
+            if np.any(bad):
+                state = np.where(bad, prev, state)
+                state = jump(state, prev, e, bad)
+
+            # Need to sum actual charge rather than charge density
+            p[j] = state @ area
+
+        # convert back into charge density
         if c_add:
             p = (p + esweep * self.thickness * self.c) / self.area
         else:
@@ -276,7 +659,7 @@ class LandauFilm:
             fig1.set_facecolor("white")
             plt.cla()
             ax1 = fig1.add_subplot(111)
-            ax1.set_title("Presiach Modeled Hysteresis")
+            ax1.set_title("Landau Modeled Hysteresis")
             datacursor(ax1.plot(esweep * 1e-6, 1e6 * p))
             ax1.set_xlabel("Electric Field (MV/cm)")
             ax1.set_ylabel("Polarization Charge ($\mu{}C/cm^2$)")
@@ -364,138 +747,245 @@ class LandauFull(LandauFilm):
         self.T0 = T0
         self.rho = rho
 
-    def rho_calc(self, hyst_data):
+    def _crossing(self, hyst_data, p):
+        """
+        Finds where the polarization of each measurement first reaches p.
+
+        Returns the linearly interpolated field there and the forward
+        difference dP/dt at that point, NaN for curves that never reach p.
+        """
+        pol, n = hd.stack_data(hyst_data, "polarization")
+        field = hd.stack_data(hyst_data, "field")[0]
+        dt = np.array([d.dt for d in hyst_data])
+        rows = np.arange(len(hyst_data))
+
+        above = pol >= p
+        found = above.any(axis=1)
+        j = np.argmax(above, axis=1)
+        jm = np.maximum(j - 1, 0)
+        # forward difference, backward at the last point of a curve
+        jn = np.where(j + 1 < n, j + 1, j)
+        jp = np.where(j + 1 < n, j, jm)
+
+        q0 = pol[rows, jm]
+        q = pol[rows, j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            f = np.where(j > 0, (p - q0) / (q - q0), 1)
+        e = field[rows, jm] * (1 - f) + f * field[rows, j]  # linear interp
+        dpdt = (pol[rows, jn] - pol[rows, jp]) / dt
+
+        e[~found] = np.nan
+        dpdt[~found] = np.nan
+        return e, dpdt
+
+    def rho_calc(self, hyst_data, plot=False):
         """
         IN DEVELOPMENT - needs further testing
         
         Calculates a viscosity coefficient for the landau film given a list
         of tf1000 DHM measurement CSV files, with the DHM measurements 
-        taken at different frequencies
+        taken at different frequencies. The field at which each curve first
+        reaches the smallest Pmax of all curves is fit against dP/dt there.
 
         Parameters
         ----------
-        files : array_like of HysteresisData files.
+        hyst_data : array_like of HysteresisData files.
+        plot : bool
+            Toggles display of matplotlib plot with data fit.
         
         Returns
         -------
-        n/a - not implemented yet 
+        rho : float
+            Viscosity coefficient (slope of E vs dP/dt)
         """
         # TODO: work on improving rho calculation (noise from C, leakage I)
-        c_comp = 0
-        pmax = []
-        for f in hyst_data:
-            pmax.append(np.max(f.polarization))
+        p = min(np.max(d.polarization) for d in hyst_data)
+        e, dpdt = self._crossing(hyst_data, p)
 
-        pmax = np.asfarray(pmax)
-        p = np.min(pmax)
+        ok = np.isfinite(e) & np.isfinite(dpdt)
+        rhofit = np.polyfit(dpdt[ok], e[ok], 1)
 
-        dpdt = np.zeros(len(hyst_data))
-        e = np.zeros(len(hyst_data))
+        if plot:
+            fig1 = plt.figure()
+            fig1.set_facecolor("white")
+            plt.cla()
+            ax1 = fig1.add_subplot(111)
+            datacursor(ax1.plot(dpdt, e, "o", dpdt, np.polyval(rhofit, dpdt)))
+            ax1.set_title("rho = {:0.3e}".format(rhofit[0]))
+            ax1.set_xlabel("dP/dt")
+            ax1.set_ylabel("dE")
 
-        for i, d in enumerate(hyst_data):
-            dt = d.time[1] - d.time[0]
-            # print(dvdt[i],"\n", d.file_name)
-            dvdt = (d.voltage[1] - d.voltage[0]) / dt
-
-            for j, q in enumerate(d.polarization):
-                if j == 0:
-                    next
-                else:
-                    if c_comp == 1:
-                        dvdt = (d.voltage[j] - d.voltage[j - 1]) / dt
-                        d.current[j] = d.current[j] - self.c * dvdt
-
-                if q < p:
-                    next
-                elif q >= p:
-                    dpdt[i] = (q - d.polarization[j + 1]) / dt
-                    f = (p - d.polarization[j - 1]) / (q - d.polarization[j - 1])
-                    e[i] = d.field[j - 1] * (1 - f) + f * d.field[j]
-                    #                    print (d.polarization[j-1],p,q, '    ',d.field[j-1],e[i],d.field[j])
-                    break
-        #            d.hyst_plot()
-        #            dvdt_filtered = d.bandstop_filter(np.diff(d.voltage)/d.dt)
-        #            d.fft_plot(np.diff(d.voltage)/d.dt)
-        #            d.fft_plot(dvdt_filtered)
+        return rhofit[0]
 
-        fig1 = plt.figure()
-        fig1.set_facecolor("white")
-        plt.cla()
-        ax1 = fig1.add_subplot(111)
-        datacursor(ax1.plot(dpdt, e))
-        ax1.set_xlabel("dP/dt")
-        ax1.set_ylabel("dE")
-
-    def a0_calc(self, hystData):
+    def a0_calc(self, hyst_data, plot=False):
         """
         IN DEVELOPMENT - needs further testing
         
         Calculates an a0 for the landau film given a list
         of tf1000 DHM measurement CSV files, with the DHM measurements 
-        taken at different frequencies  
+        taken at different temperatures. The field at which each curve
+        first reaches the smallest Pmax of all curves is fit against
+        temperature.
         
         Parameters
         ----------
-        files : array_like of HysteresisData files.
+        hyst_data : array_like of HysteresisData files.
+        plot : bool
+            Toggles display of matplotlib plot with data fit.
         
         Returns
         -------
-        n/a - not implemented yet       
+        a0 : float
+            cm/(F*K)
+        Tc : float
+            Curie temperature (K)
         """
         # FIXME: a0 is an order of magnitude too high - need better temp data?
-        c_comp = 0
-        pmax = []
-        for f in hystData:
-            pmax.append(np.max(f.polarization))
-
-        pmax = np.asfarray(pmax)
-        p = np.min(pmax)
-
-        dpdt = np.zeros(len(hystData))
-        e = np.zeros(len(hystData))
-        temp = np.zeros(len(hystData))
-
-        for i, d in enumerate(hystData):
-            temp[i] = d.temp
-            dt = d.time[1] - d.time[0]
-            # print(dvdt[i],"\n", d.file_name)
-            dvdt = (d.voltage[1] - d.voltage[0]) / dt
-
-            for j, q in enumerate(d.polarization):
-                if j == 0:
-                    next
-                else:
-                    if c_comp == 1:
-                        dvdt = (d.voltage[j] - d.voltage[j - 1]) / dt
-                        d.current[j] = d.current[j] - self.c * dvdt
-
-                if q < p:
-                    next
-                elif q >= p:
-                    dpdt[i] = (q - d.polarization[j + 1]) / dt
-                    f = (p - d.polarization[j - 1]) / (q - d.polarization[j - 1])
-                    e[i] = d.field[j - 1] * (1 - f) + f * d.field[j]  # linear interp
-                    #                    print (d.polarization[j-1],p,q, '    ',d.field[j-1],e[i],d.field[j])
-                    break
-        #            d.hyst_plot()
-        #            dvdt_filtered = d.bandstop_filter(np.diff(d.voltage)/d.dt)
-        #            d.fft_plot(np.diff(d.voltage)/d.dt)
-        #            d.fft_plot(dvdt_filtered)
+        p = min(np.max(d.polarization) for d in hyst_data)
+        e = self._crossing(hyst_data, p)[0]
+        temp = np.array([d.temp for d in hyst_data], dtype=float)
 
-        a0fit = np.polyfit(temp, e, 1)
-        a0fit_fn = np.poly1d(a0fit)
+        ok = np.isfinite(e)
+        a0fit = np.polyfit(temp[ok], e[ok], 1)
         a0 = a0fit[0] / (2 * p)  # cm/(F*K)
         Tc = 1 / (4 * self.c * a0 * self.thickness) + 300  # 300K temp at which C calced
-        #        print (a0,Tc)
 
-        fig1 = plt.figure()
-        fig1.set_facecolor("white")
-        plt.cla()
-        ax1 = fig1.add_subplot(111)
-        datacursor(ax1.plot(temp, e, "o", temp, a0fit_fn(temp)))
-        ax1.set_title("a0 = {:0.3e}".format(a0))
-        ax1.set_xlabel("T (C)")
-        ax1.set_ylabel("E (V/cm)")
+        if plot:
+            fig1 = plt.figure()
+            fig1.set_facecolor("white")
+            plt.cla()
+            ax1 = fig1.add_subplot(111)
+            datacursor(ax1.plot(temp, e, "o", temp, np.polyval(a0fit, temp)))
+            ax1.set_title("a0 = {:0.3e}".format(a0))
+            ax1.set_xlabel("T (C)")
+            ax1.set_ylabel("E (V/cm)")
+
+        return a0, Tc
+
+    def calc_efe_lk(
+        self, time, esweep, domains, init_state=None, max_dp=None, plot=False,
+        c_add=False
+    ):
+        """
+        Time-domain Landau-Khalatnikov simulation of all domains in the film.
+
+        Integrates rho dP/dt = -dU/dP + E(t) for every domain at once using a
+        semi-implicit (linearized backward Euler) step. A time step is split
+        into substeps whenever a domain would change polarization by more than
+        max_dp. Several waveforms can be simulated in one run by passing 2d
+        time and esweep arrays with one waveform per row.
+        
+        Parameters
+        ----------
+        time: np array of time values (s), 1d or 2d (waveforms by samples)
+        esweep: np array of field values (V/cm), same shape as time
+        domains: list containing all domain objects in the film. The a, b
+            and g parameters of the domains must be set.
+        init_state: np array, initial polarization of domains (C/cm^2).
+            Defaults to -pr for every domain.
+        max_dp: float, largest change in domain polarization per substep.
+            Defaults to pr/20.
+        plot: bool, triggers plotting of generated hysteresis curves
+        c_add: bool, adds linear capacitor contribution to polarization
+            
+        Returns
+        -------
+        p: np array, polarization charge values for film (C/cm^2), same
+            shape as esweep
+        state: np array, final polarization of domains (one row per waveform
+            if esweep is 2d)
+        """
+        if self.rho <= 0:
+            raise ValueError("rho must be positive for time-domain simulation.")
+
+        one_waveform = np.ndim(esweep) == 1
+        time = np.atleast_2d(np.asfarray(time))
+        esweep = np.atleast_2d(np.asfarray(esweep))
+
+        a, b, g, ebias = domain_array(domains).T
+        area, pr = domain_array(domains, ("area", "pr")).T
+        if max_dp is None:
+            max_dp = np.max(np.abs(pr)) / 20
+
+        state = np.empty((esweep.shape[0], len(a)))
+        state[:] = -pr if init_state is None else init_state
+
+        p = np.zeros(esweep.shape)
+        p[:, 0] = state @ area
+        for j in range(1, esweep.shape[1]):
+            h = (time[:, j] - time[:, j - 1])[:, None]
+            e0 = esweep[:, j - 1, None]
+            e1 = esweep[:, j, None]
+
+            # substep count of each waveform from an explicit estimate of dP
+            efe = 2 * a * state + 4 * b * state ** 3 + 6 * g * state ** 5 - ebias
+            dp = np.max(h * np.abs(e1 - efe), axis=1, keepdims=True) / self.rho
+            nsub = np.clip(np.ceil(dp / max_dp), 1, 1000)
+
+            hs = h / nsub
+            for k in range(1, int(nsub.max()) + 1):
+                e = e0 + (e1 - e0) * k / nsub
+                efe = 2 * a * state + 4 * b * state ** 3 + 6 * g * state ** 5 - ebias
+                defe = 2 * a + 12 * b * state ** 2 + 30 * g * state ** 4
+                # only the stabilizing part of dE/dP is treated implicitly
+                step = hs * (e - efe) / (self.rho + hs * np.maximum(defe, 0))
+                state = np.where(k <= nsub, state + step, state)
+
+            p[:, j] = state @ area
+
+        # convert charge into charge density
+        if c_add:
+            p = (p + esweep * self.thickness * self.c) / self.area
+        else:
+            p = p / self.area
+
+        if plot:
+            fig1 = plt.figure()
+            fig1.set_facecolor("white")
+            plt.cla()
+            ax1 = fig1.add_subplot(111)
+            ax1.set_title("Landau-Khalatnikov Modeled Hysteresis")
+            for e_row, p_row in zip(esweep, p):
+                datacursor(ax1.plot(e_row * 1e-6, 1e6 * p_row))
+            ax1.set_xlabel("Electric Field (MV/cm)")
+            ax1.set_ylabel("Polarization Charge ($\mu{}C/cm^2$)")
+
+        if one_waveform:
+            return p[0], state[0]
+        return p, state
+
+    def lk_hysteresis(self, hyst_data, domains, **kwargs):
+        """
+        Simulates the measurement waveforms of a list of HysteresisData
+        objects (e.g. a frequency series) in a single calc_efe_lk run.
+
+        Waveforms of different lengths are padded by holding their last
+        sample, which does not change the simulated state.
+
+        Parameters
+        ----------
+        hyst_data : array_like of HysteresisData objects.
+        domains: list containing all domain objects in the film
+        kwargs: args
+            Arguments to pass to calc_efe_lk
+
+        Returns
+        -------
+        p_list: list of np arrays, modeled polarization (C/cm^2) for each
+            HysteresisData object, sampled at its own time values
+        """
+        n = max(len(d.time) for d in hyst_data)
+        time = np.empty((len(hyst_data), n))
+        esweep = np.empty((len(hyst_data), n))
+        for i, d in enumerate(hyst_data):
+            m = len(d.time)
+            time[i, :m] = d.time
+            time[i, m:] = d.time[-1]
+            esweep[i, :m] = d.field
+            esweep[i, m:] = d.field[-1]
+
+        p = self.calc_efe_lk(time, esweep, domains, **kwargs)[0]
+        return [p[i, : len(d.time)] for i, d in enumerate(hyst_data)]
 
 
 class LandauDomain:
@@ -612,61 +1102,90 @@ class LandauDomain:
         #                             T = 1/self.pr**2)
         self.a, self.b, self.g = parms.x
 
-    def parm_fit(self, plot=False):
+    def parm_fit(self, res=26, refine=4, plot=False):
+        """
+        Grid search for a, b and g that minimize the squared error of eqns1.
+
+        The error is evaluated over the whole (a, b, g) grid at once. Starting
+        from a wide log spaced grid around the analytical guess, each
+        refinement pass narrows the grid to the cells neighbouring the current
+        minimum, so fine resolution is reached without evaluating a fine grid
+        everywhere. The best fit is stored in the a, b and g attributes of the domain.
+
+        Parameters
+        ----------
+        res : int
+            Number of grid points along each parameter axis.
+        refine : int
+            Number of coarse-to-fine refinement passes after the initial grid.
+        plot : bool
+            Triggers 3d scatter plot of the error over the initial grid.
+
+        Returns
+        -------
+        err : float
+            Squared error of eqns1 at the best fit.
+        """
         guess = np.asarray(
             (-2 / self.pr ** 2, 1 / (2 * self.pr ** 4), 1 / self.pr ** 6)
         )
         a_guess, b_guess, g_guess = guess
-        guessRes = 26
-
-        avals = np.linspace(a_guess / 1e3, a_guess * 1e3, guessRes)
-        bvals = np.linspace(b_guess / 1e3, b_guess * 1e3, guessRes)
-        gvals = np.linspace(g_guess / 1e4, g_guess * 1e4, guessRes)
-
-        err = np.empty([guessRes, guessRes, guessRes])
-        for i, a in enumerate(avals):
-            for j, b in enumerate(bvals):
-                vals = np.asfarray(self.eqns1((a, b, gvals)))
-                err[i, j, :] = np.sum(vals ** 2, 0)
 
-        if plot:
-            x = np.empty(guessRes ** 3)
-            y = np.empty(guessRes ** 3)
-            z = np.empty(guessRes ** 3)
-            d = np.empty(guessRes ** 3)
-            for i, r in enumerate(err.flatten()):
-                xcord = i % guessRes
-                ycord = (i // guessRes) % guessRes
-                zcord = i // guessRes ** 2
-
-                x[i] = avals[xcord]
-                y[i] = bvals[ycord]
-                z[i] = gvals[zcord]
-                d[i] = r
-
-            fig1 = plt.figure()
-            #        colormap = plt.cm.viridis # uniform greyscale for printing
-            colormap = plt.cm.nipy_spectral  # diverse color for colorblindness
-            plt.clf()
-            ax1 = fig1.add_subplot(111, projection="3d")
-            #            ax1.set_xscale('log')
-            #            ax1.set_yscale('log')
-            #            ax1.set_zscale('log')
-            p = ax1.scatter(
-                np.abs(x),
-                y,
-                z,
-                c=d,
-                alpha=0.5,
-                s=15,
-                lw=0,
-                cmap=colormap,
-                norm=Normalize(),
+        bounds = [
+            (a_guess / 1e3, a_guess * 1e3),
+            (b_guess / 1e3, b_guess * 1e3),
+            (g_guess / 1e4, g_guess * 1e4),
+        ]
+
+        for n in range(refine + 1):
+            # log spaced first pass covers the decades around the guess evenly
+            space = np.geomspace if n == 0 else np.linspace
+            avals, bvals, gvals = [space(lo, hi, res) for lo, hi in bounds]
+            vals = np.asfarray(
+                self.eqns1(
+                    (avals[:, None, None], bvals[None, :, None], gvals[None, None, :])
+                )
             )
-            ax1.set_xlabel(r"-$\alpha{}$ Guess")
-            ax1.set_ylabel(r"$\beta{}$ Guess")
-            ax1.set_zlabel(r"$\gamma{}$ Guess")
-            plt.colorbar(p, ax=ax1)
+            err = np.sum(vals ** 2, 0)
+            idx = np.unravel_index(np.argmin(err), err.shape)
+
+            if plot and n == 0:
+                x, y, z = np.meshgrid(avals, bvals, gvals, indexing="ij")
+                x, y, z, d = x.ravel(), y.ravel(), z.ravel(), err.ravel()
+
+                fig1 = plt.figure()
+                #        colormap = plt.cm.viridis # uniform greyscale for printing
+                colormap = plt.cm.nipy_spectral  # diverse color for colorblindness
+                plt.clf()
+                ax1 = fig1.add_subplot(111, projection="3d")
+                #            ax1.set_xscale('log')
+                #            ax1.set_yscale('log')
+                #            ax1.set_zscale('log')
+                p = ax1.scatter(
+                    np.abs(x),
+                    y,
+                    z,
+                    c=d,
+                    alpha=0.5,
+                    s=15,
+                    lw=0,
+                    cmap=colormap,
+                    norm=Normalize(),
+                )
+                ax1.set_xlabel(r"-$\alpha{}$ Guess")
+                ax1.set_ylabel(r"$\beta{}$ Guess")
+                ax1.set_zlabel(r"$\gamma{}$ Guess")
+                plt.colorbar(p, ax=ax1)
+
+            # shrink each axis to the cells neighbouring the minimum
+            bounds = []
+            for vals_1d, i in zip((avals, bvals, gvals), idx):
+                bounds.append(
+                    (vals_1d[max(i - 1, 0)], vals_1d[min(i + 1, res - 1)])
+                )
+
+        self.a, self.b, self.g = avals[idx[0]], bvals[idx[1]], gvals[idx[2]]
+        return err[idx]
 
     def get_ufe(self, pvals):
         """
@@ -707,6 +1226,113 @@ class LandauDomain:
         )
 
 
+class OnlineCapacitance:
+    def __init__(self, thickness=13e-7, area=6606e-8, rel_error=0.001):
+        """
+        Capacitance fit of LandauFilm.c_calc, updated one measurement at a
+        time. Only the sums of the linear regression of median abs(current)
+        vs mean abs(dV/dt) are stored, so memory doesn't grow with the
+        number of measurements and adding a frequency point is immediate.
+
+        Measurements can be added whole (add, same result as c_calc) or
+        streamed in chunks (update, then finish_curve), in which case the
+        median current is estimated with a stats.QuantileSketch to within
+        rel_error.
+
+        Parameters
+        ----------
+        thickness : float
+            Film thickness (cm)
+        area : float
+            Device area (cm^2)
+        rel_error : float
+            Relative error of the median current of streamed measurements.
+        """
+        self.thickness = thickness
+        self.area = area
+        self.rel_error = rel_error
+        self.n = 0
+        self._mx = 0.0  # mean dV/dt
+        self._my = 0.0  # mean current
+        self._sxx = 0.0  # sum of squared deviations of dV/dt
+        self._sxy = 0.0  # sum of products of deviations
+        self._new_curve()
+
+    def _new_curve(self):
+        self._sketch = stats.QuantileSketch(self.rel_error)
+        self._dv = 0.0  # sum of abs(dV) of the streamed curve
+        self._dt = 0.0
+        self._last = None  # time and voltage of the last streamed sample
+
+    @property
+    def c(self):
+        """Capacitance (F), NaN until two different dV/dt were added."""
+        if self.n < 2 or self._sxx == 0:
+            return np.nan
+        return self._sxy / self._sxx
+
+    @property
+    def intercept(self):
+        """Current (A) of the fit at dV/dt = 0."""
+        return self._my - self.c * self._mx
+
+    @property
+    def er(self):
+        """Relative permittivity corresponding to c."""
+        return relative_permittivity(self.c, self.thickness, self.area)
+
+    def add_point(self, dvdt, current):
+        """
+        Adds one point (mean abs(dV/dt) in V/s, median abs(current) in A)
+        to the regression and returns the updated capacitance.
+        """
+        self.n += 1
+        dx = dvdt - self._mx
+        self._mx += dx / self.n
+        self._my += (current - self._my) / self.n
+        self._sxx += dx * (dvdt - self._mx)
+        self._sxy += dx * (current - self._my)
+        return self.c
+
+    def add(self, hyst_data):
+        """
+        Adds a HysteresisData measurement (or a list of them) and returns
+        the updated capacitance. The median current is exact, found by
+        partitioning rather than sorting the curve.
+        """
+        if not isinstance(hyst_data, (list, tuple)):
+            hyst_data = [hyst_data]
+        for d in hyst_data:
+            self.add_point(d.dvdt_mean, np.median(np.abs(d.current)))
+        return self.c
+
+    def update(self, time, voltage, current):
+        """
+        Adds a chunk of samples of the measurement in progress, see
+        finish_curve.
+        """
+        time = np.asfarray(time)
+        voltage = np.asfarray(voltage)
+        if self._last is not None:
+            time = np.append(self._last[0], time)
+            voltage = np.append(self._last[1], voltage)
+        if len(time):
+            self._dv += np.sum(np.abs(np.diff(voltage)))
+            self._dt += time[-1] - time[0]
+            self._last = (time[-1], voltage[-1])
+        self._sketch.update(np.abs(current))
+
+    def finish_curve(self):
+        """
+        Adds the measurement streamed with update to the regression and
+        returns the updated capacitance.
+        """
+        dvdt = self._dv / self._dt if self._dt else 0.0
+        current = self._sketch.quantile(0.5)
+        self._new_curve()
+        return self.add_point(dvdt, current)
+
+
 def main():
     plt.close("all")
 
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Zero-copy transport of measurement data to worker processes.
+
+SharedData places every numpy array attribute of a list of HysteresisData
+or LeakageData objects in one shared memory block. Worker processes receive a
+small picklable handle and rebuild the measurement objects with read-only
+views into that block instead of unpickling copies of every array.
+
+Example::
+
+    def comp(d, film):
+        return film.c_compensation(d)[1]
+
+    prs = parallel.pool_map(comp, freq_data, film=film)
+"""
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+# segments attached in this process, kept open while their views are in use
+_attached = {}
+_worker_data = None
+
+
+class SharedHandle:
+    def __init__(self, name, layout):
+        """
+        Picklable description of a SharedData block.
+
+        Parameters
+        ----------
+        name : str
+            Name of the shared memory block.
+        layout : list
+            (class, metadata dict, [(attr, offset, dtype, shape), ...]) for
+            each measurement, offsets in bytes.
+        """
+        self.name = name
+        self.layout = layout
+
+    def attach(self):
+        """
+        Rebuilds the measurement objects with read-only views into the
+        shared block. The block stays open for the life of the process.
+
+        Returns
+        -------
+        data : list
+            Measurement objects in the original order.
+        """
+        shm = _attached.get(self.name)
+        if shm is None:
+            shm = _open_untracked(self.name)
+            _attached[self.name] = shm
+        return _build(shm, self.layout)
+
+
+def _open_untracked(name):
+    # the creating process owns the block, attaching must not register it
+    # with the resource tracker or it would be unlinked by the wrong process
+    try:
+        return SharedMemory(name=name, track=False)  # python >= 3.13
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _build(shm, layout):
+    data = []
+    for cls, meta, arrays in layout:
+        d = cls.__new__(cls)
+        d.__dict__.update(meta)
+        d.__dict__["_cache"] = {}
+        for attr, offset, dtype, shape in arrays:
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            setattr(d, attr, view)
+        data.append(d)
+    return data
+
+
+class SharedData:
+    def __init__(self, data):
+        """
+        Copies the numpy array attributes of several measurements into one
+        shared memory block, the other attributes are pickled with the
+        handle. Use as a context manager, the block is released when
+        the with statement exits.
+
+        Parameters
+        ----------
+        data : list
+            HysteresisData or LeakageData objects.
+        """
+        layout = []
+        chunks = []
+        offset = 0
+        for d in data:
+            arrays = []
+            meta = {}
+            for attr, v in vars(d).items():
+                if attr == "_cache":
+                    continue
+                if isinstance(v, np.ndarray) and not v.dtype.hasobject:
+                    a = np.ascontiguousarray(v)
+                    arrays.append((attr, offset, a.dtype, a.shape))
+                    chunks.append((offset, a))
+                    offset += -(-a.nbytes // 8) * 8  # keep 8 byte alignment
+                else:
+                    meta[attr] = v
+            layout.append((type(d), meta, arrays))
+
+        self.shm = SharedMemory(create=True, size=max(offset, 8))
+        for off, a in chunks:
+            np.ndarray(a.shape, dtype=a.dtype, buffer=self.shm.buf, offset=off)[...] = a
+        self.handle = SharedHandle(self.shm.name, layout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.handle.layout)
+
+    def load(self):
+        """Measurement objects viewing the shared block from this process."""
+        return _build(self.shm, self.handle.layout)
+
+    def close(self):
+        """
+        Removes the shared block. Objects from load() must not be used
+        afterwards.
+        """
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                pass  # views from load() still exist, mapping freed with them
+            self.shm.unlink()
+            self.shm = None
+
+
+def _init_worker(handle):
+    global _worker_data
+    _worker_data = handle.attach()
+
+
+def _call(args):
+    func, i, kwargs = args
+    return func(_worker_data[i], **kwargs)
+
+
+def pool_map(func, data, processes=None, chunksize=1, **kwargs):
+    """
+    Applies func to every measurement in a process pool. The measurement
+    arrays are passed through shared memory, only func, kwargs and the
+    results are pickled.
+
+    Parameters
+    ----------
+    func : callable
+        Module level function taking a measurement object as its first
+        argument. The object's arrays are read-only.
+    data : list
+        HysteresisData or LeakageData objects.
+    processes : int
+        Number of worker processes. Defaults to the number of CPUs.
+    chunksize : int
+        Number of measurements sent to a worker at a time.
+    **kwargs
+        Passed on to func.
+
+    Returns
+    -------
+    results : list
+        func(d, **kwargs) for each measurement, in order.
+    """
+    with SharedData(data) as shared:
+        with Pool(processes, _init_worker, (shared.handle,)) as pool:
+            return pool.map(
+                _call, [(func, i, kwargs) for i in range(len(shared))], chunksize
+            )
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Cached analysis pipelines.
+
+A Pipeline is a set of named stages, each a function of the outputs of
+other stages plus its own parameters. Running the pipeline computes the
+requested stages in dependency order and remembers every output together
+with a key built from the stage parameters and the fingerprints of its
+inputs. Running it again (e.g. after changing one parameter with update())
+only recomputes the stages whose key changed. Stages that don't depend on
+each other, like the frequency and temperature series of a device, run
+concurrently in a thread pool.
+
+Example::
+
+    pipe = pipeline.characterization(freqdir, forcfile, 255E-7, 1E-4)
+    res = pipe.run()
+    pipe.update("domains", n=1000)
+    res = pipe.run()  # only domains and preisach are recomputed
+"""
+import hashlib
+import pickle
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from os import makedirs, stat
+from os.path import join, exists
+import numpy as np
+from ferro import data as hd
+from ferro import models as lf
+from ferro import profiling
+
+
+def fingerprint(value):
+    """
+    Hash identifying the content of a stage input or output. Measurement
+    objects use their data fingerprint, arrays their bytes and paths of
+    existing files or directories also their size and modification time,
+    so edited data files invalidate the stages reading them.
+    """
+    h = hashlib.sha1()
+    _update(h, value)
+    return h.hexdigest()
+
+
+def _update(h, value):
+    if isinstance(value, hd.SampleData):
+        h.update(type(value).__name__.encode())
+        h.update(value.fingerprint.encode())
+        meta = {k: v for k, v in vars(value).items()
+                if isinstance(v, (int, float, str))}
+        h.update(repr(sorted(meta.items())).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(f"{value.dtype}{value.shape}".encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(f"{type(value).__name__}{len(value)}".encode())
+        for v in value:
+            _update(h, v)
+    elif isinstance(value, dict):
+        h.update(b"dict")
+        for k in sorted(value, key=repr):
+            h.update(repr(k).encode())
+            _update(h, value[k])
+    elif isinstance(value, str):
+        h.update(value.encode())
+        if exists(value):
+            s = stat(value)
+            h.update(f"{s.st_size}:{s.st_mtime_ns}".encode())
+    elif hasattr(value, "__dict__") and not callable(value):
+        h.update(type(value).__name__.encode())
+        _update(h, vars(value))
+    else:
+        h.update(repr(value).encode())
+
+
+class Stage:
+    def __init__(self, name, func, inputs, params):
+        """
+        One step of a Pipeline.
+
+        Parameters
+        ----------
+        name : str
+        func : callable
+            Called as func(*input values, **params).
+        inputs : tuple
+            Names of the stages whose outputs are passed to func.
+        params : dict
+            Keyword arguments of func.
+        """
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = dict(params)
+
+
+class Pipeline:
+    def __init__(self, threads=None, cache_dir=None):
+        """
+        Parameters
+        ----------
+        threads : int
+            Maximum number of stages run at the same time. Defaults to the
+            ThreadPoolExecutor default.
+        cache_dir : str
+            If given, stage outputs are also pickled to this directory and
+            reused by later sessions.
+        """
+        self.stages = {}
+        self.threads = threads
+        self.cache_dir = cache_dir
+        self._cache = {}  # name: (key, fingerprint, value)
+        self.recomputed = []  # stages computed by the last run
+
+    def add(self, name, func, *inputs, **params):
+        """
+        Adds a stage computing func(*outputs of inputs, **params). Replacing
+        an existing stage invalidates its output.
+        """
+        for i in inputs:
+            if i not in self.stages:
+                raise ValueError(f"Unknown input stage {i} of {name}")
+        self.stages[name] = Stage(name, func, inputs, params)
+        self._cache.pop(name, None)
+        return self
+
+    def update(self, name, **params):
+        """Changes parameters of a stage, invalidating it and its dependents."""
+        self.stages[name].params.update(params)
+
+    def invalidate(self, name=None):
+        """Forgets the cached output of a stage (all stages if None)."""
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+    def dependencies(self, targets):
+        """Names of targets and all stages they depend on, in run order."""
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle through {name}")
+            visiting.add(name)
+            for i in self.stages[name].inputs:
+                visit(i)
+            visiting.discard(name)
+            order.append(name)
+
+        for t in targets:
+            visit(t)
+        return order
+
+    def _key(self, stage, fps):
+        h = hashlib.sha1(stage.name.encode())
+        h.update(getattr(stage.func, "__qualname__", repr(stage.func)).encode())
+        h.update(fingerprint(stage.params).encode())
+        for i in stage.inputs:
+            h.update(fps[i].encode())
+        return h.hexdigest()
+
+    def _load(self, name, key):
+        if name in self._cache and self._cache[name][0] == key:
+            return self._cache[name]
+        if self.cache_dir:
+            path = join(self.cache_dir, f"{name}-{key}.pkl")
+            if exists(path):
+                with open(path, "rb") as f:
+                    entry = (key,) + pickle.load(f)
+                self._cache[name] = entry
+                return entry
+        return None
+
+    def _compute(self, stage, args):
+        with profiling.stage("pipeline:" + stage.name):
+            value = stage.func(*args, **stage.params)
+        return value, fingerprint(value)
+
+    def _store(self, name, key, fp, value):
+        self._cache[name] = (key, fp, value)
+        if self.cache_dir:
+            makedirs(self.cache_dir, exist_ok=True)
+            with open(join(self.cache_dir, f"{name}-{key}.pkl"), "wb") as f:
+                pickle.dump((fp, value), f)
+
+    def run(self, targets=None):
+        """
+        Computes the target stages (all if None), reusing every cached
+        output whose parameters and inputs are unchanged.
+
+        Returns
+        -------
+        results : dict
+            {stage name: output} of the targets and their dependencies.
+        """
+        if targets is None:
+            targets = list(self.stages)
+        elif isinstance(targets, str):
+            targets = [targets]
+        order = self.dependencies(targets)
+        fps = {}
+        values = {}
+        self.recomputed = []
+
+        todo = list(order)
+        running = {}
+        with ThreadPoolExecutor(self.threads) as pool:
+            while todo or running:
+                for name in list(todo):
+                    stage = self.stages[name]
+                    if not all(i in fps for i in stage.inputs):
+                        continue
+                    todo.remove(name)
+                    key = self._key(stage, fps)
+                    entry = self._load(name, key)
+                    if entry is not None:
+                        profiling.count("pipeline stages cached")
+                        fps[name], values[name] = entry[1], entry[2]
+                        if not stage.inputs:
+                            # e.g. file lists, whose files may have changed
+                            fps[name] = fingerprint(values[name])
+                        continue
+                    args = [values[i] for i in stage.inputs]
+                    running[pool.submit(self._compute, stage, args)] = (name, key)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key = running.pop(future)
+                    value, fp = future.result()
+                    self._store(name, key, fp, value)
+                    self.recomputed.append(name)
+                    fps[name], values[name] = fp, value
+        return values
+
+
+# Stages of the multidomain characterization of a device
+# (see bin/multidomainAnalysis.py)
+
+
+def read_dir(path):
+    """Sorted tsv files in path."""
+    return sorted(hd.dir_read(path))
+
+
+def read_list(files, lkgfiles=None, **kwargs):
+    """hd.list_read of files, leakage compensated if lkgfiles are given."""
+    return hd.list_read(files, lkgfiles, **kwargs)
+
+
+def read_forc(path, **kwargs):
+    d = hd.HysteresisData(**kwargs)
+    d.tsv_read(path)
+    return d
+
+
+def forc_calc(data, **kwargs):
+    return data.forc_calc(**kwargs)
+
+
+def c_calc(data, thickness, area):
+    return lf.LandauFull(thickness=thickness, area=area).c_calc(data)
+
+
+def c_compensation(data, c, thickness, area):
+    """Capacitance compensated data and Pr of each measurement."""
+    film = lf.LandauFull(thickness=thickness, area=area, c=c)
+    return [film.c_compensation(d) for d in data]
+
+
+def rho_calc(data, thickness, area):
+    return lf.LandauFull(thickness=thickness, area=area).rho_calc(data)
+
+
+def a0_calc(data, c, thickness, area):
+    return lf.LandauFull(thickness=thickness, area=area, c=c).a0_calc(data)
+
+
+def film(c, comp, rho, a0=(0, 0), index=1, thickness=13e-7, area=6606e-8):
+    """LandauFull film with the parameters extracted by the other stages."""
+    return lf.LandauFull(thickness=thickness, area=area, c=c, pr=comp[index][1],
+                         rho=rho, a0=a0[0], T0=a0[1])
+
+
+def domain_gen(film, forc, n=100, seed=None):
+    # a local generator, stages run concurrently on the thread pool
+    rng = None if seed is None else np.random.default_rng(seed)
+    return film.domain_gen(*forc, n=n, rng=rng)
+
+
+def esweep(data, index=1, scale=1.1, num=1000):
+    """Field sweep up and back down to scale times the largest measured field."""
+    elimit = scale * np.max(data[index].voltage) / data[index].thickness
+    e = np.linspace(-elimit, elimit, num=num)
+    return np.append(e, e[::-1])
+
+
+def preisach(film, domains, esweep, c_add=True):
+    return film.calc_efe_preisach(esweep, domains, c_add=c_add)
+
+
+def characterization(freqdir, forcfile, thickness, area, area_real=None,
+                     tempdir=None, lkgdir=None, leakage_comp=False,
+                     n_domains=100, seed=None, index=1, **kwargs):
+    """
+    Pipeline of the multidomain characterization of a device: capacitance,
+    viscosity and (with tempdir) a0 from the frequency and temperature
+    series, FORC domain generation and the Preisach model of the film.
+
+    Parameters
+    ----------
+    freqdir : str
+        Directory of hysteresis measurements at several frequencies.
+    forcfile : str
+        FORC measurement.
+    thickness : float
+        Film thickness (cm)
+    area : float
+        Mask defined device area (cm^2), used to read the data.
+    area_real : float
+        Actual device area used for the film model, defaults to area.
+    tempdir : str
+        Directory of hysteresis measurements at several temperatures.
+    lkgdir : str
+        Directory of leakage measurements. Needed for leakage_comp and the
+        'freq_lkg' stage.
+    leakage_comp : bool
+        Compensate the temperature series for leakage current.
+    n_domains : int
+        Number of domains generated from the FORC distribution.
+    seed : int
+        Seed of the domain generation.
+    index : int
+        Frequency measurement used for Pr and the field sweep.
+    **kwargs
+        Passed on to Pipeline().
+
+    Returns
+    -------
+    pipe : Pipeline
+        Stages 'freq_data', 'c', 'comp', 'rho', 'forc', 'film', 'domains',
+        'esweep' and 'preisach', plus 'temp_data' and 'a0' with tempdir
+        and 'freq_lkg' with lkgdir.
+    """
+    if area_real is None:
+        area_real = area
+    meas = dict(thickness=thickness, area=area)
+    model = dict(thickness=thickness, area=area_real)
+
+    pipe = Pipeline(**kwargs)
+    pipe.add("freq_files", read_dir, path=freqdir)
+    pipe.add("freq_data", read_list, "freq_files", **meas)
+    if lkgdir is not None:
+        pipe.add("lkg_files", read_dir, path=lkgdir)
+        pipe.add("freq_lkg", read_list, "freq_files", "lkg_files", **meas)
+    pipe.add("c", c_calc, "freq_data", **model)
+    pipe.add("comp", c_compensation, "freq_data", "c", **model)
+    pipe.add("rho", rho_calc, "freq_data", **model)
+    film_inputs = ("c", "comp", "rho")
+    if tempdir is not None:
+        pipe.add("temp_files", read_dir, path=tempdir)
+        if leakage_comp:
+            pipe.add("temp_data", read_list, "temp_files", "lkg_files", **meas)
+        else:
+            pipe.add("temp_data", read_list, "temp_files", **meas)
+        pipe.add("a0", a0_calc, "temp_data", "c", **model)
+        film_inputs += ("a0",)
+    pipe.add("film", film, *film_inputs, index=index, **model)
+    pipe.add("forc_data", read_forc, path=forcfile, **meas)
+    pipe.add("forc", forc_calc, "forc_data")
+    pipe.add("domains", domain_gen, "film", "forc", n=n_domains, seed=seed)
+    pipe.add("esweep", esweep, "freq_data", index=index)
+    pipe.add("preisach", preisach, "film", "domains", "esweep")
+    return pipe
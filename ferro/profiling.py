@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Lightweight timing and counting of the main processing stages.
+
+Profiling is off by default, the instrumented functions then only pay for
+one flag check per call. Turn it on with enable() (or by setting the
+FERRO_PROFILE environment variable before importing ferro), run the
+analysis and print summary() or write a Chrome trace (chrome://tracing or
+https://ui.perfetto.dev) with export_chrome_trace()::
+
+    from ferro import profiling
+    profiling.enable()
+    data = hd.list_read(files, lkgfiles)
+    e, er, prob = data[0].forc_calc()
+    print(profiling.summary())
+
+With enable(memory=True) every stage also records its peak and retained
+traced memory (tracemalloc), and memory_report() lists the source lines
+holding the most memory. tracemalloc slows Python allocations down
+noticeably, so this mode is meant for diagnosing large ingests.
+
+A memory budget (set_memory_budget) makes the parsers switch to their
+streaming code paths for inputs that would not fit in it.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+
+enabled = bool(os.environ.get("FERRO_PROFILE"))
+track_memory = False
+memory_budget = None  # bytes
+_started_tracing = False  # tracemalloc was started by enable()
+
+_local = threading.local()
+
+_lock = threading.Lock()
+_events = []  # (name, start, duration, thread id, peak bytes, retained bytes)
+_counters = {}
+_t0 = time.perf_counter()
+
+
+def enable(on=True, memory=False):
+    """
+    Turns recording of stages and counters on (or off with on=False).
+
+    Parameters
+    ----------
+    on : bool
+    memory : bool
+        Also record peak and retained memory of each stage with tracemalloc.
+        tracemalloc is only stopped again if it was started here.
+    """
+    global enabled, track_memory, _started_tracing
+    enabled = on
+    track_memory = on and memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    elif not track_memory and _started_tracing:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _started_tracing = False
+
+
+def disable():
+    """Turns recording off. Recorded data is kept until reset()."""
+    enable(False)
+
+
+def set_memory_budget(nbytes):
+    """
+    Sets the memory (bytes) a single input may use before parsers switch
+    to streaming. None removes the budget.
+    """
+    global memory_budget
+    memory_budget = nbytes
+
+
+def over_budget(nbytes):
+    """True if a memory budget is set and nbytes exceeds it."""
+    return memory_budget is not None and nbytes > memory_budget
+
+
+def nbytes(data):
+    """
+    Bytes of the numpy arrays held by a measurement object or a list of
+    them. Arrays sharing memory (e.g. from SampleData.derive) are counted
+    once.
+    """
+    if not isinstance(data, (list, tuple)):
+        data = [data]
+    seen = set()
+    total = 0
+    for d in data:
+        for v in vars(d).values():
+            if isinstance(v, np.ndarray):
+                while isinstance(v.base, np.ndarray):
+                    v = v.base
+                if id(v) not in seen:
+                    seen.add(id(v))
+                    total += v.nbytes
+    return total
+
+
+def reset():
+    """Clears all recorded stages and counters."""
+    global _t0
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _t0 = time.perf_counter()
+
+
+def count(name, n=1):
+    """Adds n to the counter name, if profiling is enabled."""
+    if enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def stage(name):
+    """Context manager timing the enclosed block as stage name."""
+    if not enabled:
+        yield
+        return
+    token = _begin()
+    try:
+        yield
+    finally:
+        _record(name, token)
+
+
+def timed(name=None):
+    """
+    Decorator timing every call of a function as a stage. The stage name
+    defaults to the function's name.
+    """
+
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            token = _begin()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(label, token)
+
+        return wrapper
+
+    return decorate
+
+
+def _mem_stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _begin():
+    if not track_memory:
+        return time.perf_counter(), None
+    current, peak = tracemalloc.get_traced_memory()
+    stack = _mem_stack()
+    if stack:
+        # the peak is reset below, keep the enclosing stage's peak so far
+        stack[-1] = max(stack[-1], peak)
+    tracemalloc.reset_peak()
+    stack.append(current)
+    return time.perf_counter(), current
+
+
+def _record(name, token):
+    start, mem0 = token
+    dur = time.perf_counter() - start
+    peak = retained = None
+    stack = _mem_stack()
+    if mem0 is not None and stack and tracemalloc.is_tracing():
+        current, traced_peak = tracemalloc.get_traced_memory()
+        abs_peak = max(stack.pop(), traced_peak)
+        if stack:
+            stack[-1] = max(stack[-1], abs_peak)
+        peak = abs_peak - mem0
+        retained = current - mem0
+    event = (name, start, dur, threading.get_ident(), peak, retained)
+    with _lock:
+        _events.append(event)
+
+
+def stats():
+    """
+    Returns
+    -------
+    stages : dict
+        {stage name: {'calls': n, 'total': s, 'max': s}}, plus 'peak'
+        (largest peak over all calls) and 'retained' (sum over calls) in
+        bytes when memory was tracked. Nested stages are included in the
+        enclosing stage.
+    counters : dict
+        {counter name: value}
+    """
+    stages = {}
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+    for name, start, dur, tid, peak, retained in events:
+        s = stages.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0})
+        s["calls"] += 1
+        s["total"] += dur
+        s["max"] = max(s["max"], dur)
+        if peak is not None:
+            s["peak"] = max(s.get("peak", 0), peak)
+            s["retained"] = s.get("retained", 0) + retained
+    return stages, counters
+
+
+def summary():
+    """Table of the recorded stages (sorted by total time) and counters."""
+    stages, counters = stats()
+    memory = any("peak" in s for s in stages.values())
+    header = f"{'stage':<24s} {'calls':>7s} {'total [s]':>10s} {'mean [ms]':>10s} {'max [ms]':>10s}"
+    if memory:
+        header += f" {'peak [MB]':>10s} {'kept [MB]':>10s}"
+    lines = [header]
+    for name, s in sorted(stages.items(), key=lambda kv: -kv[1]["total"]):
+        line = (
+            f"{name:<24s} {s['calls']:7d} {s['total']:10.3f} "
+            f"{1E3 * s['total'] / s['calls']:10.2f} {1E3 * s['max']:10.2f}"
+        )
+        if "peak" in s:
+            line += f" {s['peak'] / 2**20:10.2f} {s['retained'] / 2**20:10.2f}"
+        lines.append(line)
+    if counters:
+        lines.append("")
+        lines.append(f"{'counter':<24s} {'value':>12s}")
+        for name, v in sorted(counters.items()):
+            lines.append(f"{name:<24s} {v:12g}")
+    return "\n".join(lines)
+
+
+def export_chrome_trace(filename):
+    """
+    Writes the recorded stages in the Chrome trace event JSON format, with
+    counters as metadata.
+    """
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+    trace = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": 1E6 * (start - _t0),
+            "dur": 1E6 * dur,
+            "pid": pid,
+            "tid": tid,
+        }
+        for name, start, dur, tid, peak, retained in events
+    ]
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": trace, "otherData": counters}, f)
+
+
+def memory_report(top=10):
+    """
+    Source lines holding the most traced memory right now, from a
+    tracemalloc snapshot. Needs enable(memory=True).
+    """
+    if not tracemalloc.is_tracing():
+        return "Memory tracking is off, use enable(memory=True)."
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    lines = [f"{'size [MB]':>10s} {'blocks':>8s}  location"]
+    for stat in snapshot.statistics("lineno")[:top]:
+        frame = stat.traceback[0]
+        lines.append(
+            f"{stat.size / 2**20:10.2f} {stat.count:8d}  {frame.filename}:{frame.lineno}"
+        )
+    return "\n".join(lines)
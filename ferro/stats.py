@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Resampling functions for estimating confidence intervals of fit parameters.
+
+Linear least squares fits are resampled as weighted fits, so all bootstrap
+or jackknife replicates are solved together as one batch of normal
+equations. Other fits can be resampled over a process pool with bootstrap.
+"""
+from multiprocessing import Pool
+import numpy as np
+from scipy.stats import norm
+
+
+def weighted_lstsq(x, y, weights):
+    """
+    Solves a batch of weighted linear least squares problems that share
+    the same design matrix.
+
+    Parameters
+    ----------
+    x : 2d np array
+        Design matrix (n samples by k parameters).
+    y : 1d np array
+        Observations (n samples).
+    weights : 2d np array
+        Weight of each sample in each fit (m fits by n samples).
+
+    Returns
+    -------
+    coef : 2d np array
+        Fit parameters (m fits by k parameters).
+    """
+    xtwx = np.einsum("bn,ni,nj->bij", weights, x, x)
+    xtwy = np.einsum("bn,ni,n->bi", weights, x, y)
+    # pinv handles replicates that do not determine all parameters
+    return np.einsum("bij,bj->bi", np.linalg.pinv(xtwx), xtwy)
+
+
+def resample_lstsq(x, y, n_boot=1000, method="bootstrap", seed=None):
+    """
+    Computes bootstrap (resampling of pairs) or jackknife (leave one out)
+    replicates of a linear least squares fit.
+
+    Parameters
+    ----------
+    x : 2d np array
+        Design matrix (n samples by k parameters).
+    y : 1d np array
+        Observations (n samples).
+    n_boot : int
+        Number of bootstrap replicates. Unused for the jackknife.
+    method : str
+        "bootstrap" or "jackknife"
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    replicates : 2d np array
+        Fit parameters of each replicate.
+    """
+    n = len(y)
+    if method == "bootstrap":
+        rng = np.random.default_rng(seed)
+        # number of times each sample is drawn in each replicate
+        weights = rng.multinomial(n, np.full(n, 1 / n), size=n_boot)
+    elif method == "jackknife":
+        weights = 1 - np.eye(n)
+    else:
+        raise ValueError("Unknown resampling method: {}".format(method))
+    return weighted_lstsq(x, y, weights.astype(float))
+
+
+def confidence_interval(replicates, alpha=0.05, method="bootstrap"):
+    """
+    Confidence interval of parameters from their resampled replicates.
+
+    Parameters
+    ----------
+    replicates : np array
+        Replicates of the parameters, one replicate per row.
+    alpha : float
+        Significance level, e.g. 0.05 for a 95% confidence interval.
+    method : str
+        "bootstrap" uses percentiles of the replicates, "jackknife" uses
+        the jackknife standard error with a normal approximation.
+
+    Returns
+    -------
+    ci : np array
+        Lower (row 0) and upper (row 1) limits of each parameter.
+    """
+    replicates = np.asfarray(replicates)
+    if method == "jackknife":
+        n = len(replicates)
+        mean = np.mean(replicates, axis=0)
+        se = np.sqrt((n - 1) / n * np.sum((replicates - mean) ** 2, axis=0))
+        z = norm.ppf(1 - alpha / 2)
+        return np.stack((mean - z * se, mean + z * se))
+    return np.percentile(replicates, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+
+
+def bootstrap(func, samples, n_boot=1000, processes=None, seed=None):
+    """
+    Bootstrap replicates of an arbitrary (e.g. nonlinear) fit, computed
+    over a process pool.
+
+    Parameters
+    ----------
+    func : function
+        Module level (picklable) function taking a resampled sequence of
+        samples and returning the fit parameters.
+    samples : list
+        Samples to resample with replacement.
+    n_boot : int
+        Number of bootstrap replicates.
+    processes : int
+        Number of worker processes. Defaults to the number of CPUs.
+        If 1, replicates are computed in this process.
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+    replicates : np array
+        Fit parameters of each replicate.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(samples)
+    resampled = [
+        [samples[i] for i in rng.integers(0, n, n)] for _ in range(n_boot)
+    ]
+    if processes == 1:
+        return np.asarray([func(r) for r in resampled])
+    with Pool(processes) as pool:
+        return np.asarray(pool.map(func, resampled))
+
+
+class QuantileSketch:
+    def __init__(self, rel_error=0.001):
+        """
+        Streaming quantile estimate with bounded relative error. Samples are
+        counted in logarithmically spaced bins (as in DDSketch, Masson et
+        al., 2019, DOI: 10.14778/3352063.3352135), so memory depends on the
+        range of the values but not on their number or order. Unlike
+        marker based estimates (P-square) the result isn't biased by
+        samples arriving in order, e.g. along a hysteresis loop.
+
+        Parameters
+        ----------
+        rel_error : float
+            Maximum relative error of the quantiles.
+        """
+        self.gamma = (1 + rel_error) / (1 - rel_error)
+        self._log_gamma = np.log(self.gamma)
+        self.n = 0
+        self.zeros = 0
+        self.pos = {}  # bin: count of positive values
+        self.neg = {}  # bin: count of negative values
+
+    def _add(self, bins, x):
+        keys, counts = np.unique(
+            np.ceil(np.log(x) / self._log_gamma).astype(int), return_counts=True
+        )
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            bins[k] = bins.get(k, 0) + c
+
+    def update(self, x):
+        """Adds a sample or an array of samples."""
+        x = np.ravel(np.asfarray(x))
+        x = x[np.isfinite(x)]
+        self.n += len(x)
+        self.zeros += int(np.count_nonzero(x == 0))
+        if np.any(x > 0):
+            self._add(self.pos, x[x > 0])
+        if np.any(x < 0):
+            self._add(self.neg, -x[x < 0])
+
+    def _value(self, k):
+        return 2 * self.gamma ** k / (self.gamma + 1)
+
+    def quantile(self, p):
+        """Estimate of the p quantile (0 to 1), NaN without samples."""
+        if self.n == 0:
+            return np.nan
+        rank = p * (self.n - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.pos))
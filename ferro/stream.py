@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Online analysis of streamed hysteresis measurements.
+
+A LoopStream takes chunks of (time, voltage, current) samples while they
+are acquired, e.g. during long fatigue runs, and reports the figures of
+merit of every cycle (see metrics) as soon as the cycle is complete. Only
+the samples of the current cycle are kept, in a fixed size RingBuffer, so
+memory use doesn't grow with the length of the run::
+
+    s = stream.LoopStream(area=1E-4, thickness=10E-7, capacity=100000)
+    for t, v, i in chunks:  # e.g. stream.socket_chunks(sock)
+        for cycle in s.feed(t, v, i):
+            print(cycle["cycle"], cycle["psw"], cycle["ec_pos"])
+
+Each cycle is compensated and integrated like a measurement passed through
+HysteresisData.leakage_compensation and LandauFilm.c_compensation. Cycles
+start at each rising zero crossing of the voltage.
+"""
+from warnings import warn
+import numpy as np
+from ferro import data as hd
+from ferro import metrics
+
+cycle_dtype = np.dtype(
+    metrics.metrics_dtype.descr
+    + [
+        ("cycle", int),  # number of the cycle in the stream
+        ("time", float),  # s, start of the cycle
+        ("n", int),  # samples in the cycle
+    ]
+)
+
+
+class RingBuffer:
+    def __init__(self, capacity, width=1):
+        """
+        Fixed size first in, first out buffer of rows of floats.
+
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of rows held.
+        width : int
+            Number of columns.
+        """
+        self.buf = np.empty((capacity, width))
+        self.start = 0  # position of the oldest row in buf
+        self.size = 0
+        self.dropped = 0  # rows dropped so far, index of the oldest row
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.buf)
+
+    def append(self, rows):
+        """
+        Appends rows (n x width array) after the newest row. Raises
+        OverflowError if they don't fit.
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.buf.shape[1])
+        n = len(rows)
+        if self.size + n > self.capacity:
+            raise OverflowError(
+                f"{n} rows don't fit in the buffer ({self.capacity - self.size} free)")
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.buf[end: end + first] = rows[:first]
+        self.buf[: n - first] = rows[first:]
+        self.size += n
+
+    def get(self, n=None):
+        """Copy of the oldest n rows (all if None), oldest first."""
+        n = self.size if n is None else min(n, self.size)
+        idx = (self.start + np.arange(n)) % self.capacity
+        return self.buf[idx]
+
+    def drop(self, n):
+        """Removes the oldest n rows."""
+        n = min(n, self.size)
+        self.start = (self.start + n) % self.capacity
+        self.size -= n
+        self.dropped += n
+
+
+class LoopStream:
+    def __init__(self, area, thickness, capacity=1000000, c=0, leakage=None,
+                 temp=300, v_threshold=0, callback=None):
+        """
+        Parameters
+        ----------
+        area : float
+            Device area (cm^2)
+        thickness : float
+            Film thickness (cm)
+        capacity : int
+            Samples buffered, has to be larger than the samples of a cycle.
+        c : float
+            Capacitance (F) whose current C dV/dt is subtracted, e.g. from
+            LandauFilm.c_calc. As in c_compensation, the mean |dV/dt| of
+            each cycle is used.
+        leakage : LeakageData or LeakageSurface
+            Fit leakage model whose current is subtracted. The mean
+            current of each cycle is then removed, as in
+            leakage_compensation.
+        temp : float
+            Temperature (K) of the measurement.
+        v_threshold : float
+            A new cycle only starts once the voltage went above +v_threshold
+            and below -v_threshold, so noise around 0 V isn't taken as
+            extra cycles.
+        callback : callable
+            Called with each completed cycle record.
+        """
+        self.area = area
+        self.thickness = thickness
+        self.c = c
+        self.leakage = leakage
+        self.temp = temp
+        self.v_threshold = v_threshold
+        self.callback = callback
+        self.buffer = RingBuffer(capacity, 3)  # time, voltage, current
+        self.cycles = 0  # completed cycles
+        self.samples = 0  # samples received
+        self._last = None  # time, voltage of the previous sample
+        self._started = False  # a cycle start was seen
+        self._complete = False  # buffer begins at the start of a cycle
+        self._seen_pos = False
+        self._seen_neg = False
+
+    def _starts(self, v):
+        """Indices in v where a cycle starts (rising zero crossings)."""
+        v_prev = np.append(v[0] if self._last is None else self._last[1], v[:-1])
+        candidates = np.flatnonzero((v_prev < 0) & (v >= 0))
+        if self._last is None:
+            candidates = candidates[candidates > 0]
+        starts = []
+        k0 = 0
+        for k in candidates:
+            seg = v[k0:k]
+            self._seen_pos |= bool(np.any(seg > self.v_threshold))
+            self._seen_neg |= bool(np.any(seg < -self.v_threshold))
+            k0 = k
+            if (self._seen_pos and self._seen_neg) or not self._started:
+                starts.append(k)
+                self._seen_pos = self._seen_neg = False
+                self._started = True
+        seg = v[k0:]
+        self._seen_pos |= bool(np.any(seg > self.v_threshold))
+        self._seen_neg |= bool(np.any(seg < -self.v_threshold))
+        return starts
+
+    def _finish(self, n):
+        """Metrics of the cycle formed by the oldest n buffered samples."""
+        t, v, i = self.buffer.get(n).T
+        self.buffer.drop(n)
+        duration = t[-1] - t[0] + (t[-1] - t[-2])
+        if self.leakage is not None:
+            i = i - self.leakage.leakage_current(v, self.temp)
+            i = i - np.mean(i)
+        if self.c:
+            dvdt_mean = np.sum(np.abs(np.diff(v))) / (t[-1] - t[0])
+            i = hd.capacitance_compensation(i, self.c * dvdt_mean)
+        p = hd.integrate_current(i, np.append(0, np.diff(t)), self.area)
+        m = metrics.loop_metrics_array(v, p, self.thickness)[0]
+        rec = np.zeros((), dtype=cycle_dtype)
+        for name in metrics.metrics_dtype.names:
+            rec[name] = m[name]
+        rec["freq"] = 1 / duration
+        rec["temp"] = self.temp
+        rec["cycle"] = self.cycles
+        rec["time"] = t[0]
+        rec["n"] = n
+        self.cycles += 1
+        if self.callback is not None:
+            self.callback(rec)
+        return rec
+
+    def feed(self, time, voltage, current):
+        """
+        Adds a chunk of samples.
+
+        Parameters
+        ----------
+        time, voltage, current : 1d np arrays
+            Samples in s, V and A.
+
+        Returns
+        -------
+        cycles : np structured array
+            Records of the cycles completed by this chunk (cycle_dtype),
+            with the fields of metrics.metrics_dtype plus cycle number,
+            start time and number of samples.
+        """
+        time = np.asfarray(time)
+        voltage = np.asfarray(voltage)
+        current = np.asfarray(current)
+        done = []
+        step = max(self.buffer.capacity // 2, 1)
+        for k in range(0, len(time), step):
+            done.extend(self._feed(time[k: k + step], voltage[k: k + step],
+                                   current[k: k + step]))
+        return np.array(done, dtype=cycle_dtype)
+
+    def _feed(self, t, v, i):
+        if len(t) == 0:
+            return []
+        starts = self._starts(v)
+        self._last = (t[-1], v[-1])
+        self.samples += len(t)
+
+        done = []
+        k0 = 0
+        base = self.buffer.dropped + len(self.buffer)  # stream index of t[0]
+        chunk = np.column_stack((t, v, i))
+        for k in starts:
+            self._append(chunk[k0:k])
+            k0 = k
+            # samples before the first start don't form a complete cycle
+            n = base + k - self.buffer.dropped
+            if self._complete and n > 2:
+                done.append(self._finish(n))
+            else:
+                self.buffer.drop(n)
+            self._complete = True
+        self._append(chunk[k0:])
+        return done
+
+    def _append(self, rows):
+        free = self.buffer.capacity - len(self.buffer)
+        if len(rows) > free:
+            warn(
+                "Cycle longer than the stream buffer, it is skipped. "
+                "Increase capacity.",
+                RuntimeWarning,
+            )
+            self.buffer.drop(len(rows) - free)
+            self._complete = False
+        self.buffer.append(rows)
+
+
+def socket_chunks(sock, n=4096):
+    """
+    Reads samples from a socket as little endian float64 triplets
+    (time, voltage, current) until it is closed.
+
+    Yields
+    ------
+    time, voltage, current : 1d np arrays
+        Chunks of up to n samples.
+    """
+    record = 3 * 8
+    pending = b""
+    while True:
+        data = sock.recv(n * record)
+        if not data:
+            break
+        pending += data
+        usable = len(pending) - len(pending) % record
+        if usable:
+            a = np.frombuffer(pending[:usable], dtype="<f8").reshape(-1, 3)
+            pending = pending[usable:]
+            yield a[:, 0], a[:, 1], a[:, 2]
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Generates synthetic measurement files for scale and stress testing.
+
+Writes AixACCT .dat files in the DynamicHysteresisResult and LeakageResult
+layout read by aixacct.read_tfdata, and TSV files in the TF-1000 layout read
+by HysteresisData.tsv_read and LeakageData.lcm_read. Polarization is the
+response of a Gaussian Preisach distribution of hysterons (see
+models.hysteron_states) plus a linear dielectric term and noise, so the
+files can be used with the FORC and modeling code as well as the parsers.
+
+Example::
+
+    files = synthetic.generate_dataset("/tmp/big", n_tables=100, n_points=100000)
+"""
+from os import makedirs
+from os.path import join
+import numpy as np
+import scipy.constants as sc
+from ferro import metrics
+from ferro.models import hysteron_states
+
+hyst_columns = "Time [s]\tV+ [V]\tV- [V]\tI1 [A]\tP1 [uC/cm2]\tI2 [A]\tP2 [uC/cm2]\tI3 [A]\tP3 [uC/cm2]\t"
+lkg_columns = "Voltage [V]\tLeakage Current Density [uA/cm2]\tMedian Current Density [uA/cm2]\t"
+tsv_hyst_columns = "Time s\tVplus V\tVminus V\tI1 A\tP1 uC_per_cm2\tI2 A\tP2 uC_per_cm2\tI3 A\tP3 uC_per_cm2"
+tsv_lkg_columns = "Voltage V\tLeakage Current Density uA_per_cm2\tMedian Current Density uA_per_cm2"
+
+global_header = [
+    "Program: aixPlorer Software version 3.0.25.0",
+    "TimeStamp: 01/01/2020 00:00:00",
+    "ProgramMode: 0",
+    "TfaFileType: data",
+    "BasicUnit: BU612-1",
+    "TfaVersion: 4.5.0",
+]
+
+
+def preisach_weights(ec_mean=1E6, ec_std=2E5, ebias_std=1E5, n=20):
+    """
+    Gaussian distribution of hysterons on an ec by ebias grid.
+
+    Parameters
+    ----------
+    ec_mean, ec_std : float
+        Mean and standard deviation of the coercive field (V/cm).
+    ebias_std : float
+        Standard deviation of the bias field (V/cm), centered at 0.
+    n : int
+        Grid points along each axis.
+
+    Returns
+    -------
+    ec : 1d np array
+        Coercive field of each hysteron.
+    ebias : 1d np array
+        Bias field of each hysteron.
+    weights : 1d np array
+        Weight of each hysteron, summing to 1.
+    """
+    ec_grid = np.linspace(
+        max(ec_mean - 3 * ec_std, 0.05 * ec_mean), ec_mean + 3 * ec_std, n
+    )
+    ebias_grid = np.linspace(-3 * ebias_std, 3 * ebias_std, n)
+    ec, ebias = [g.ravel() for g in np.meshgrid(ec_grid, ebias_grid)]
+    weights = np.exp(
+        -0.5 * ((ec - ec_mean) / ec_std) ** 2 - 0.5 * (ebias / ebias_std) ** 2
+    )
+    return ec, ebias, weights / np.sum(weights)
+
+
+def preisach_polarization(esweep, ec, ebias, weights, pr, chunk=64):
+    """
+    Polarization of a Preisach distribution of hysterons along a field
+    sweep. The sweep is run once beforehand so that the result is the
+    steady state loop of a periodic waveform. Hysterons are processed in
+    chunks to bound memory on long sweeps.
+
+    Parameters
+    ----------
+    esweep : 1d np array
+        Field values (V/cm).
+    ec, ebias, weights : 1d np arrays
+        Hysteron distribution, see preisach_weights.
+    pr : float
+        Remanent polarization (C/cm^2) of the film.
+    chunk : int
+        Number of hysterons evaluated at once.
+
+    Returns
+    -------
+    p : 1d np array
+        Polarization (C/cm^2) at every point of esweep.
+    """
+    p = np.zeros(len(esweep))
+    for i in range(0, len(ec), chunk):
+        s = slice(i, i + chunk)
+        state = hysteron_states(esweep, ec[s], ebias[s])[-1]
+        p += hysteron_states(esweep, ec[s], ebias[s], state) @ weights[s]
+    return pr * p
+
+
+def triangle_wave(amplitude, freq, n):
+    """
+    One period of a triangle waveform, 0 to +amplitude to -amplitude to 0.
+
+    Returns
+    -------
+    time : 1d np array (s)
+    voltage : 1d np array (V)
+    """
+    time = np.arange(n) / (n * freq)
+    voltage = amplitude * np.interp(time * freq, [0, 0.25, 0.75, 1], [0, 1, -1, 0])
+    return time, voltage
+
+
+def forc_wave(amplitude, n_reversals, n, rate=1E3):
+    """
+    First order reversal curve waveform as used by forc_calc: from 0 up to
+    +amplitude, then for each reversal voltage down to it and back up to
+    +amplitude, finally back to 0.
+
+    Parameters
+    ----------
+    amplitude : float
+        Maximum voltage (V).
+    n_reversals : int
+        Number of reversal curves, reversal voltages evenly spaced from
+        +amplitude to -amplitude.
+    n : int
+        Total number of points.
+    rate : float
+        Sweep rate (V/s).
+
+    Returns
+    -------
+    time : 1d np array (s)
+    voltage : 1d np array (V)
+    """
+    vr = np.linspace(amplitude, -amplitude, n_reversals + 1)[1:]
+    corners = np.concatenate(
+        ([0, amplitude], np.column_stack((vr, np.full(n_reversals, amplitude))).ravel(), [0])
+    )
+    path = np.concatenate(([0], np.cumsum(np.abs(np.diff(corners)))))
+    # sample every corner exactly so that the reversal points are strict
+    # minima/maxima of the sampled waveform
+    counts = np.diff(np.round(path / path[-1] * (n - 1)).astype(int))
+    voltage = np.concatenate(
+        [np.linspace(a, b, k, endpoint=False) for a, b, k in zip(corners, corners[1:], counts)]
+        + [corners[-1:]]
+    )
+    step = path[-1] / (n - 1)
+    return np.arange(n) * step / rate, voltage
+
+
+def hysteresis_table(
+    time, voltage, thickness=13E-7, area=1E-4, pr=20E-6, er=30,
+    distribution=None, noise=0.01, rng=None
+):
+    """
+    Simulated hysteresis measurement of a waveform.
+
+    Parameters
+    ----------
+    time, voltage : 1d np arrays
+        Waveform, e.g. from triangle_wave or forc_wave.
+    thickness : float
+        Film thickness (cm).
+    area : float
+        Capacitor area (cm^2).
+    pr : float
+        Remanent polarization (C/cm^2).
+    er : float
+        Relative permittivity of the linear dielectric response.
+    distribution : tuple
+        (ec, ebias, weights) hysteron distribution. Defaults to
+        preisach_weights().
+    noise : float
+        Standard deviation of the polarization noise relative to pr.
+    rng : np.random.Generator
+
+    Returns
+    -------
+    table : dict
+        'time' (s), 'voltage' (V), 'current' (A), 'polarization' (C/cm^2).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if distribution is None:
+        distribution = preisach_weights()
+    field = voltage / thickness
+    p = preisach_polarization(field, *distribution, pr) + sc.epsilon_0 * 1e-2 * er * field
+    p = p + noise * pr * rng.standard_normal(len(p))
+    p = p - 0.5 * (p.max() + p.min())
+    current = area * np.gradient(p, time)
+    return {"time": time, "voltage": voltage, "current": current, "polarization": p}
+
+
+def leakage_table(vmax=4.0, step=0.5, j0=1E-9, v0=0.5, noise=0.05, rng=None):
+    """
+    Simulated leakage current measurement, 0 to +vmax to -vmax to 0 in
+    voltage steps, with a current density of j0*sinh(V/v0) (A/cm^2) and
+    relative noise.
+
+    Returns
+    -------
+    table : dict
+        'voltage' (V), 'current_density' (A/cm^2).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    up = np.arange(0, vmax + step / 2, step)
+    voltage = np.concatenate((up, up[-2::-1], -up[1:], -up[-2::-1]))
+    j = j0 * np.sinh(voltage / v0) * (1 + noise * rng.standard_normal(len(voltage)))
+    return {"voltage": voltage, "current_density": j}
+
+
+def _write_rows(f, columns):
+    np.savetxt(f, np.column_stack(columns), fmt="%.6e", delimiter="\t", newline="\t\n")
+
+
+def _hyst_columns(table):
+    p = 1E6 * table["polarization"]  # uC/cm^2
+    i = table["current"]
+    return (table["time"], table["voltage"], -table["voltage"], i, p, i, p, i, p)
+
+
+def _summary(f, names, rows):
+    f.write("\t".join(names) + "\t\n")
+    _write_rows(f, [np.arange(1, len(rows) + 1), np.zeros(len(rows))] + list(np.transpose(rows)))
+
+
+def write_hysteresis_dat(
+    filename, tables, freqs, thickness=13E-7, area=1E-4, sample_name="Synthetic",
+    waveform="triangle"
+):
+    """
+    Writes hysteresis tables to a DynamicHysteresisResult .dat file.
+
+    Parameters
+    ----------
+    filename : str
+    tables : list
+        Dicts from hysteresis_table.
+    freqs : list
+        Measurement frequency (Hz) of each table.
+    thickness, area : float
+        Sample thickness (cm) and area (cm^2) written to the metadata.
+    """
+    m = [
+        metrics.loop_metrics_array(t["voltage"], t["polarization"], thickness)[0]
+        for t in tables
+    ]
+    amplitude = [np.max(np.abs(t["voltage"])) for t in tables]
+
+    with open(filename, "w", encoding="cp1252") as f:
+        f.write("DynamicHysteresisResult\n\nTable 1\n")
+        _summary(
+            f,
+            ["Index [1]", "Measurement Status [1]", "Vc+ [V]", "Vc- [V]",
+             "Pr+ [uC/cm2]", "Pr- [uC/cm2]", "Hysteresis Frequency [Hz]",
+             "Hysteresis Amplitude [V]"],
+            [(r["vc_pos"], r["vc_neg"], 1E6 * r["pr_pos"], 1E6 * r["pr_neg"], fr, a)
+             for r, fr, a in zip(m, freqs, amplitude)],
+        )
+        f.write("\nDynamicHysteresis\n")
+        f.write("\n".join(global_header).replace("ProgramMode", "TfaModule: DHM\nProgramMode"))
+        f.write("\n\n")
+        for i, (t, r, fr, a) in enumerate(zip(tables, m, freqs, amplitude)):
+            if i:
+                f.write("\n")
+            f.write(f"Table {i + 1}\n")
+            f.write(
+                f"TableVersion: 4.5.0\nAverages: 1\nWaveform: {waveform}\n"
+                f"SampleName: {sample_name}\nArea [mm2]: {area * 1E2:g}\n"
+                f"Thickness [nm]: {thickness * 1E7:g}\n"
+                f"Hysteresis Frequency [Hz]: {fr:g}\nHysteresis Amplitude [V]: {a:g}\n"
+                f"Vc+ [V]: {r['vc_pos']:g}\nVc- [V]: {r['vc_neg']:g}\n"
+                f"Pr+ [uC/cm2]: {1E6 * r['pr_pos']:g}\nPr- [uC/cm2]: {1E6 * r['pr_neg']:g}\n"
+                f"Pmax [uC/cm2]: {1E6 * r['pmax']:g}\nMeasurement Status: 0\n"
+            )
+            f.write(hyst_columns + "\n")
+            _write_rows(f, _hyst_columns(t))
+
+
+def write_leakage_dat(
+    filename, tables, thickness=13E-7, area=1E-4, sample_name="Synthetic"
+):
+    """
+    Writes leakage tables to a LeakageResult .dat file.
+
+    Parameters
+    ----------
+    filename : str
+    tables : list
+        Dicts from leakage_table.
+    thickness, area : float
+        Sample thickness (cm) and area (cm^2) written to the metadata.
+    """
+    with open(filename, "w", encoding="cp1252") as f:
+        f.write("LeakageResult\n\nTable 1\n")
+        _summary(
+            f,
+            ["Index [1]", "Measurement Status [1]", "Max. Voltage [V]"],
+            [(np.max(t["voltage"]),) for t in tables],
+        )
+        f.write("\nLeakage\n")
+        f.write("\n".join(global_header).replace("ProgramMode", "TfaModule: LM\nProgramMode"))
+        f.write("\n\n")
+        for i, t in enumerate(tables):
+            if i:
+                f.write("\n")
+            j = 1E6 * t["current_density"]  # uA/cm^2
+            f.write(
+                f"Table {i + 1}\nTableVersion: 4.2.0\nSampleName: {sample_name}\n"
+                f"Area [mm2]: {area * 1E2:g}\nThickness [nm]: {thickness * 1E7:g}\n"
+                f"Max. Voltage [V]: {np.max(t['voltage']):g}\n"
+                f"Voltage Step [V]: {abs(t['voltage'][1] - t['voltage'][0]):g}\n"
+                f"Measurement Status: 0\n"
+            )
+            f.write(lkg_columns + "\n")
+            _write_rows(f, (t["voltage"], j, j))
+
+
+def write_hysteresis_tsv(filename, table):
+    """Writes a hysteresis table in the TSV layout read by tsv_read."""
+    with open(filename, "w") as f:
+        f.write(tsv_hyst_columns + "\n")
+        np.savetxt(f, np.column_stack(_hyst_columns(table)), fmt="%.6e", delimiter="\t")
+
+
+def write_leakage_tsv(filename, table):
+    """Writes a leakage table in the TSV layout read by lcm_read."""
+    j = 1E6 * table["current_density"]
+    with open(filename, "w") as f:
+        f.write(tsv_lkg_columns + "\n")
+        np.savetxt(f, np.column_stack((table["voltage"], j, j)), fmt="%.6e", delimiter="\t")
+
+
+def generate_dataset(
+    path, n_tables=10, n_points=2000, noise=0.01, forc_points=10000,
+    n_reversals=25, amplitude=4.0, thickness=13E-7, area=1E-4, pr=20E-6,
+    tsv=True, seed=None, sample_name="Synthetic"
+):
+    """
+    Writes a frequency series, a FORC measurement and a temperature series
+    of leakage measurements of one synthetic sample, as .dat files and
+    optionally as TSV files.
+
+    Parameters
+    ----------
+    path : str
+        Output directory, created if needed.
+    n_tables : int
+        Number of tables in each file (frequencies / temperatures).
+    n_points : int
+        Points per hysteresis table.
+    noise : float
+        Polarization noise relative to pr.
+    forc_points : int
+        Points of the FORC waveform, 0 to skip the FORC file.
+    n_reversals : int
+        Number of FORC reversal curves.
+    amplitude : float
+        Maximum voltage (V).
+    thickness, area, pr : float
+        Film thickness (cm), area (cm^2) and remanent polarization (C/cm^2).
+    tsv : bool
+        Also write every table as a TSV file.
+    seed : int
+        Seed of the random number generator.
+    sample_name : str
+
+    Returns
+    -------
+    files : dict
+        'freq', 'forc', 'leakage' .dat file names and 'freq_tsv',
+        'forc_tsv', 'leakage_tsv' lists of TSV file names.
+    """
+    rng = np.random.default_rng(seed)
+    makedirs(path, exist_ok=True)
+    dist = preisach_weights(ec_mean=0.4 * amplitude / thickness,
+                            ec_std=0.1 * amplitude / thickness,
+                            ebias_std=0.05 * amplitude / thickness)
+    kwargs = dict(thickness=thickness, area=area, pr=pr, distribution=dist,
+                  noise=noise, rng=rng)
+    files = {"freq_tsv": [], "forc_tsv": [], "leakage_tsv": []}
+
+    freqs = np.round(np.geomspace(100, 10000, n_tables))
+    tables = [
+        hysteresis_table(*triangle_wave(amplitude, fr, n_points), **kwargs)
+        for fr in freqs
+    ]
+    files["freq"] = join(path, f"{sample_name}_freqs.dat")
+    write_hysteresis_dat(files["freq"], tables, freqs, thickness, area, sample_name)
+    if tsv:
+        makedirs(join(path, "freqs"), exist_ok=True)
+        for i, (t, fr) in enumerate(zip(tables, freqs)):
+            name = join(path, "freqs", f"{sample_name} {fr:.0f}Hz {amplitude:g}V 1Average Table{i + 1}.tsv")
+            write_hysteresis_tsv(name, t)
+            files["freq_tsv"].append(name)
+
+    if forc_points:
+        t = hysteresis_table(*forc_wave(amplitude, n_reversals, forc_points), **kwargs)
+        files["forc"] = join(path, f"{sample_name}_forc.dat")
+        write_hysteresis_dat(files["forc"], [t], [0], thickness, area, sample_name, "FORC")
+        if tsv:
+            makedirs(join(path, "forc"), exist_ok=True)
+            name = join(path, "forc", f"{sample_name} 0Hz {amplitude:g}V 1Average Table1.tsv")
+            write_hysteresis_tsv(name, t)
+            files["forc_tsv"].append(name)
+
+    temps = np.linspace(27, 177, n_tables).round()
+    tables = [
+        leakage_table(amplitude, j0=1E-9 * np.exp((tc - 27) / 50), rng=rng)
+        for tc in temps
+    ]
+    files["leakage"] = join(path, f"{sample_name}_lkg.dat")
+    write_leakage_dat(files["leakage"], tables, thickness, area, sample_name)
+    if tsv:
+        makedirs(join(path, "lkg"), exist_ok=True)
+        for i, (t, tc) in enumerate(zip(tables, temps)):
+            name = join(path, "lkg", f"{sample_name} {tc:.0f}C 2s step Table{i + 1}.tsv")
+            write_leakage_tsv(name, t)
+            files["leakage_tsv"].append(name)
+    return files
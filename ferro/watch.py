@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Incremental processing of measurement files as they are written.
+
+A Watcher polls a directory tree for new or changed .tsv and .dat files,
+parses only those and updates running results: the capacitance regression
+of each series (as in LandauFilm.c_calc), the leakage fits and per die
+summaries (see aggregate). Every update is published as an event dict to a
+callback and/or an asyncio.Queue::
+
+    async def main():
+        queue = asyncio.Queue()
+        watcher = watch.Watcher("/data/lot42", queue=queue, config=config)
+        task = asyncio.create_task(watcher.run())
+        while True:
+            event = await queue.get()
+            print(event["path"], event.get("c"))
+
+A file is processed once its size and modification time stayed the same
+for one polling interval, so files still being written are not read half
+finished. With the default interval of 0.2 s results are updated about
+0.5 s after a file is written.
+"""
+import asyncio
+import time
+from os import walk, stat
+from os.path import join, dirname, basename
+from warnings import warn
+import numpy as np
+from ferro import aixacct as aix
+from ferro import metrics
+from ferro import batch
+from ferro import aggregate
+
+
+class Watcher:
+    def __init__(self, root, callback=None, queue=None, interval=0.2,
+                 config=None, existing=True):
+        """
+        Parameters
+        ----------
+        root : str
+            Directory watched, including subdirectories.
+        callback : callable
+            Called with each event dict, may be a coroutine function.
+        queue : asyncio.Queue
+            Events are also put on this queue.
+        interval : float
+            Seconds between polls.
+        config : configparser.ConfigParser
+            Thickness and area settings, see batch.load_config.
+        existing : bool
+            Also process the files present when watching starts.
+        """
+        self.root = root
+        self.callback = callback
+        self.queue = queue
+        self.interval = interval
+        self.config = config if config is not None else batch.load_config()
+        self.existing = existing
+        self._stat = {}  # processed files: (size, mtime)
+        self._pending = {}  # changed files waiting to settle
+        self._first = True
+        self._running = False
+
+        self.points = {}  # series: {file: (mean |dV/dt|, median |I|)}
+        self.loops = {}  # series: {file: median Ec of the file's loops}
+        self.c = {}  # series: capacitance fit
+        self.leakage = {}  # series: {file: [(temp, lcm_parms), ...]}
+        self.dies = {}  # (device, stack, die, structure): summary dict
+
+    def scan(self):
+        """
+        Polls the tree once.
+
+        Returns
+        -------
+        ready : list
+            Paths of new or changed files whose size and modification time
+            didn't change since the last poll.
+        """
+        ready = []
+        for path, dirs, files in walk(self.root):
+            dirs.sort()
+            for f in sorted(files):
+                if not f.endswith((".tsv", ".dat")):
+                    continue
+                p = join(path, f)
+                try:
+                    st = stat(p)
+                except OSError:
+                    continue  # removed in the meantime
+                s = (st.st_size, st.st_mtime_ns)
+                if self._stat.get(p) == s:
+                    continue
+                if self._first and not self.existing:
+                    self._stat[p] = s
+                elif self._pending.get(p) == s:
+                    del self._pending[p]
+                    self._stat[p] = s
+                    ready.append(p)
+                else:
+                    self._pending[p] = s
+        if self._first and self.existing:
+            # files present at start are complete, don't wait for them
+            for p, s in self._pending.items():
+                self._stat[p] = s
+                ready.append(p)
+            self._pending.clear()
+        self._first = False
+        return ready
+
+    def _series(self, path):
+        if path.endswith(".dat"):
+            datatype = aix.check_datatype(path)
+            if datatype == aix.MeasEnum.LEAKAGE:
+                kind = "leakage"
+            elif datatype == aix.MeasEnum.HYSTERESIS:
+                kind = batch._kind(basename(path))
+            else:
+                return None
+            s = batch.Series(path, self.root, kind, [path])
+        else:
+            spath = dirname(path)
+            s = batch.Series(spath, self.root, batch._kind(basename(spath)), [path])
+        batch.apply_config([s], self.config)
+        return s
+
+    def process(self, path):
+        """
+        Parses one file and updates the results depending on it.
+
+        Returns
+        -------
+        events : list
+            Event dicts with the file path, series, kind, die (or None) and
+            the updated values: c of the series for hysteresis data, ec of
+            the file, lcm_parms of leakage data and the die summary.
+        """
+        series = self._series(path)
+        if series is None or series.kind == "forc":
+            return []
+        data = batch._read(series, series.settings)[0]
+        event = {"path": path, "series": series.path, "kind": series.kind}
+        key = series.path
+
+        if series.kind == "leakage":
+            fits = []
+            for d in data:
+                d.lcm_fit()
+                fits.append((float(d.temp), [float(p) for p in d.lcm_parms]))
+            self.leakage.setdefault(key, {})[path] = fits
+            event["lcm_parms"] = [f[1] for f in fits]
+        else:
+            points = self.points.setdefault(key, {})
+            for i, d in enumerate(data):
+                points[(path, i)] = (d.dvdt_mean, np.median(np.abs(d.current)))
+            m = metrics.loop_metrics(data)
+            self.loops.setdefault(key, {})[path] = float(
+                np.nanmedian((m["ec_pos"] - m["ec_neg"]) / 2))
+            event["ec"] = self.loops[key][path]
+            dvdt, med_i = np.array(list(points.values())).T
+            if len(np.unique(dvdt)) > 1:
+                self.c[key] = np.polyfit(dvdt, med_i, 1)[0]
+            event["c"] = self.c.get(key, np.nan)
+
+        info = aggregate.parse_name(series.path)
+        event["die"] = None
+        if info is not None:
+            die = (info["device"], info["stack"], info["die"], info["structure"])
+            event["die"] = die
+            event["summary"] = self._update_die(die, info["series"], key)
+        return [event]
+
+    def _update_die(self, die, name, key):
+        summary = self.dies.setdefault(
+            die, {"c": np.nan, "ec": np.nan, "lcm_parms": [np.nan] * 7})
+        if name == "freq":
+            summary["c"] = self.c.get(key, np.nan)
+            summary["ec"] = float(np.median(list(self.loops[key].values())))
+        elif name == "leakage":
+            fits = [f for file_fits in self.leakage[key].values() for f in file_fits]
+            summary["lcm_parms"] = min(fits, key=lambda f: abs(f[0] - 300))[1]
+        return dict(summary)
+
+    async def _publish(self, event):
+        if self.callback is not None:
+            res = self.callback(event)
+            if asyncio.iscoroutine(res):
+                await res
+        if self.queue is not None:
+            await self.queue.put(event)
+
+    async def run(self):
+        """Watches the tree until stop() is called or the task is cancelled."""
+        loop = asyncio.get_running_loop()
+        self._running = True
+        while self._running:
+            for path in await loop.run_in_executor(None, self.scan):
+                try:
+                    events = await loop.run_in_executor(None, self.process, path)
+                except Exception as e:
+                    warn(f"Could not process {path}: {e}", RuntimeWarning)
+                    continue
+                now = time.time()
+                for event in events:
+                    # from the file's last modification to the result
+                    event["latency"] = now - self._stat[path][1] * 1E-9
+                    await self._publish(event)
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        """Ends run() after the current poll."""
+        self._running = False
@@ -21,10 +21,14 @@ setup(
     license='Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International',
     description='Manipulation and Modeling of Ferroelectric Test Data',
     long_description=open('README.md').read(),
+    python_requires='>=3.9',
     install_requires=[
         'scipy',
         'numpy',
         'matplotlib',
         'mpldatacursor',
     ],
+    entry_points={
+        'console_scripts': ['ferro-batch=ferro.batch:main'],
+    },
 )
\ No newline at end of file
@@ -20,7 +20,7 @@ freqdata = hd.list_read(freqfiles)
 hfo2 = lf.LandauFull(thickness=13E-7, area=6579E-8)
 
 hfo2.c = hfo2.c_calc(freqdata, plot=1)
-hfo2.rho_calc(freqdata)
+hfo2.rho = hfo2.rho_calc(freqdata, plot=True)
 
 tempdir = join(sampledir, 'H9_x9y4_1e4_S3_temps')
 tempfiles = hd.dir_read(tempdir)
@@ -28,7 +28,7 @@ tempdata = hd.list_read(tempfiles)
 templkgdir = join(sampledir, 'H9_x9y4_1e4_S3_tempslkg')
 templkgfiles = hd.dir_read(templkgdir)
 
-hfo2.a0 = hfo2.a0_calc(tempdata)
+hfo2.a0, hfo2.T0 = hfo2.a0_calc(tempdata, plot=True)
 
 
 # Following code plots a series of diff freq hystdata files on same plot
@@ -9,8 +9,10 @@ Copied from http://python-guide-pt-br.readthedocs.io/en/latest/writing/structure
 
 import os
 import sys
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../ferro/')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import data
-import models
-import aixacct
+# import through the package, so data and models are the same modules the
+# package uses internally (not a second copy)
+from ferro import data
+from ferro import models
+from ferro import aixacct
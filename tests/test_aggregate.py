@@ -0,0 +1,44 @@
+import os
+import shutil
+import numpy as np
+from ferro import aggregate, batch
+from os.path import join, dirname, realpath
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'FeFETD1', 'MFS+')
+
+
+def test_parse_name():
+    info = aggregate.parse_name('x/FeFETD1_die84_MFS+_100_10x10_lkg.dat')
+    assert info == {'device': 'FeFETD1', 'die': 84, 'stack': 'MFS+',
+                    'structure': '100_10x10', 'series': 'leakage'}
+    assert aggregate.parse_name('RTWhiteB_freqs') is None
+
+
+def test_die_stats(tmp_path):
+    root = tmp_path / 'FeFETD1' / 'MFS+'
+    for die in ('die66', 'die116'):
+        shutil.copytree(join(sampledir, die), root / die)
+    config = batch.load_config()
+    config['batch'].update({'thickness': '10E-7', 'area': '1E-4'})
+    cache = str(tmp_path / 'cache.json')
+
+    stats = aggregate.die_stats(str(tmp_path), config, processes=2, cache=cache)
+    assert len(stats) == 6 and set(stats['die']) == {66, 116}
+    assert np.all(stats['c'] > 0) and np.all(np.isfinite(stats['lcm_parms']))
+
+    # touching one die's files only reanalyzes that die
+    changed = root / 'die66' / 'FeFETD1_die66_MFS+_60_20x20_freq'
+    for f in changed.iterdir():
+        os.utime(f, ns=(0, 0))
+    calls = []
+    analyze = aggregate.analyze_die
+    aggregate.analyze_die = lambda g: calls.append(g) or analyze(g)
+    try:
+        stats2 = aggregate.die_stats(str(tmp_path), config, processes=1, cache=cache)
+    finally:
+        aggregate.analyze_die = analyze
+    assert len(calls) == 1
+    assert np.allclose(stats2['c'], stats['c'])
+
+    summary = aggregate.group_by(stats, 'c')
+    assert summary[('FeFETD1', '60_20x20')][2] == 2
@@ -28,6 +28,16 @@ def test_direct_load_aixACCT_leakage_data():
     print(all(elem in directlkgData for elem in lkglist))
     assert all(elem in directlkgData for elem in lkglist)
 
+def test_dedup_tsv_and_dat():
+    RTfreqData = hd.list_read(hd.dir_read(join(sampledir, 'RTWhiteB_freqs')),
+                              thickness=255E-7, area=1e-4)
+    directFreqData = aix.load_tfdata(aix.read_tfdata(join(sampledir, 'RTWhiteB_freqs.dat')))
+
+    unique = hd.dedup(directFreqData + RTfreqData)
+    assert len(unique) == len(directFreqData)
+    assert all(u is d for u, d in zip(unique, directFreqData))
+    assert set(RTfreqData) <= set(directFreqData)
+
 if __name__ == '__main__':
     test_direct_load_aixACCT_hysteresis_data()
     test_direct_load_aixACCT_leakage_data()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import csv
+import shutil
+import warnings
+import pytest
+from ferro import batch
+from os.path import join, dirname, realpath
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'RTWhiteB')
+
+
+def test_batch(tmp_path):
+    root = tmp_path / 'data'
+    for d in ('RTWhiteB_freqs', 'RTWhiteB_lkg', 'RTWhiteB_FORC'):
+        shutil.copytree(join(sampledir, d), root / d)
+    config = tmp_path / 'lot.ini'
+    config.write_text('[batch]\nthickness = 255E-7  # cm\narea = 1E-4\n'
+                      '[*FORC]\nanalyses = forc\n')
+    out = tmp_path / 'out'
+    args = [str(root), '-c', str(config), '-o', str(out), '-j', '2', '-q']
+
+    assert batch.main(args) == 0
+    with open(out / 'results.csv') as f:
+        rows = list(csv.DictReader(f))
+    kinds = {r['analysis'] for r in rows}
+    assert kinds == {'metrics', 'capacitance', 'leakage', 'forc'}
+    c = [r for r in rows if r['analysis'] == 'capacitance']
+    assert len(c) == 1 and float(c[0]['c']) > 0
+    forc = [r for r in rows if r['forc_file']]
+    assert forc and (out / forc[0]['forc_file']).exists()
+
+    # nothing changed, everything is taken from the progress file
+    series = batch.discover(str(root))
+    assert {s.name: s.leakage for s in series}['RTWhiteB_freqs'].name == 'RTWhiteB_lkg'
+    rows2, failed = batch.run(str(root), str(out), batch.load_config(str(config)),
+                              processes=1, verbose=False)
+    assert not failed and len(rows2) == len(rows)
+    assert (out / 'progress.jsonl').read_text().count('\n') == len(series)
+
+
+def test_leakage_temp_tol(tmp_path):
+    root = tmp_path / 'data'
+    shutil.copytree(join(sampledir, 'RTWhiteB_freqs'), root / 'RTWhiteB_freqs')
+    (root / 'RTWhiteB_lkg').mkdir()
+    # leakage measured 10 K above the hysteresis loops
+    shutil.copy(join(sampledir, 'RTWhiteB_lkg', 'RTWhiteB 2s step 27C Table1.tsv'),
+                root / 'RTWhiteB_lkg' / 'RTWhiteB 2s step 37C Table1.tsv')
+    series = batch.discover(str(root))
+    freqs = [s for s in series if s.name == 'RTWhiteB_freqs'][0]
+    config = batch.load_config()
+    config['batch'].update({'thickness': '255E-7', 'area': '1E-4',
+                            'analyses': 'metrics'})
+    batch.apply_config(series, config)
+
+    with pytest.warns(RuntimeWarning, match='not compensated'):
+        exact = batch.process(freqs, str(tmp_path))
+    freqs.settings['leakage'] = 'none'
+    uncompensated = batch.process(freqs, str(tmp_path))
+    assert exact == uncompensated
+
+    freqs.settings.update(leakage='auto', leakage_temp_tol='10')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        compensated = batch.process(freqs, str(tmp_path))
+    assert compensated != uncompensated
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from ferro import data as hd
 from ferro import aixacct as aix
 from os.path import join, dirname, realpath
@@ -36,4 +37,132 @@ def test_tsvload_frequency_parse(input_notemp_dhm):
 
 def test_hysteresisData_Str(input_notemp_dhm):
     string = input_notemp_dhm.__str__()
-    assert string == 'Hysteresis Data, 401 points, -3.97 to 3.96 V, 400.0 Hz, 300K, Pmax = 18.43 uC/cm^2'
\ No newline at end of file
+    assert string == 'Hysteresis Data, 401 points, -3.97 to 3.96 V, 400.0 Hz, 300K, Pmax = 18.43 uC/cm^2'
+
+@pytest.fixture
+def lkg_list():
+    sampledir = join(dirname(realpath(__file__)), 'testData', r"hfo2_MFM", "H9_x9y4_1e4_S3_tempslkg")
+    data = []
+    for f in sorted(hd.dir_read(sampledir)):
+        ldata = hd.LeakageData()
+        ldata.lcm_read(f)
+        data.append(ldata)
+    return data
+
+
+def test_lcm_fit_matches_curve_fit(lkg_list):
+    from scipy.optimize import curve_fit
+    ldata = lkg_list[0]
+    ldata.lcm_fit()
+    p_ref = curve_fit(hd.leakage_func, ldata.lcm_voltage, ldata.lcm_current,
+                      p0=np.array([2e-10, 2e-10, 0.8e-6, -1e-6, 1e-6, 0, -1]))[0]
+    fit = hd.leakage_func(ldata.lcm_voltage, *ldata.lcm_parms)
+    ref = hd.leakage_func(ldata.lcm_voltage, *p_ref)
+    assert np.sum((ldata.lcm_current - fit)**2) <= np.sum((ldata.lcm_current - ref)**2)
+
+
+def test_lcm_fit_list_matches_single_fits(lkg_list):
+    hd.lcm_fit_list(lkg_list)
+    for ldata in lkg_list:
+        parms = ldata.lcm_parms
+        ldata.lcm_fit()
+        assert np.allclose(hd.leakage_func(ldata.lcm_voltage, *parms),
+                           hd.leakage_func(ldata.lcm_voltage, *ldata.lcm_parms))
+
+
+def test_leakage_surface_compensates_all_temps(lkg_list):
+    surface = hd.LeakageSurface()
+    surface.fit(lkg_list)
+    for ldata in lkg_list:
+        err = surface.leakage_current(ldata.lcm_voltage, ldata.temp) - ldata.lcm_current
+        assert np.max(np.abs(err)) < 0.1 * np.max(np.abs(ldata.lcm_current))
+
+    tempdir = join(dirname(realpath(__file__)), 'testData', r"hfo2_MFM", "H9_x9y4_1e4_S3_temps")
+    files = hd.dir_read(tempdir)
+    comp = hd.list_read(files, leakage_model=surface)
+    raw = hd.list_read(files)
+    for c, r in zip(comp, raw):
+        ilkg = surface.leakage_current(r.voltage, r.temp)
+        assert np.allclose(c.current, r.current - ilkg - np.mean(r.current - ilkg))
+
+
+def test_branch_interp():
+    data = hd.HysteresisData(thickness=10E-7)
+    t = np.linspace(0, 1, 401)
+    data.time = t
+    data.voltage = np.interp(t, [0, 0.25, 0.75, 1], [0, 2, -2, 0])
+    data.polarization = np.tanh(data.voltage - np.sign(np.gradient(data.voltage)))
+    x = np.array([-1.5, 0.0, 1.5, 3.0])
+    up = data.branch_interp(x, branch="up")
+    assert np.allclose(up[:3], np.tanh(x[:3] - 1), atol=1E-3)
+    assert np.isnan(up[3])
+    down = data.branch_interp(x / 10E-7, branch="down", x_attr="field")
+    assert np.allclose(down[:3], np.tanh(x[:3] + 1), atol=1E-3)
+
+    batch = hd.branch_interp([data, data], x, branch="up")
+    assert batch.shape == (2, 4) and np.allclose(batch, up, equal_nan=True)
+
+    # the cached branch is rebuilt when the data changes
+    data.polarization = -data.polarization
+    assert np.allclose(data.branch_interp(x[:3], branch="up"), -up[:3])
+
+
+def test_derived_cache():
+    data = hd.HysteresisData(thickness=10E-7)
+    data.time = np.linspace(0, 1E-3, 11)
+    data.voltage = np.linspace(0, 1, 11)
+    data.polarization = 2E-6 * data.voltage
+    field = data.field
+    assert data.field is field
+    assert not field.flags.writeable
+    assert np.allclose(data.dvdt, 1E3) and np.isclose(data.dvdt_mean, 1E3)
+    assert np.allclose(data.dpdv[0], 2E-6)
+
+    data.thickness = 20E-7
+    assert np.allclose(data.field, data.voltage / 20E-7)
+    data.voltage = 2 * data.voltage
+    assert np.isclose(data.dvdt_mean, 2E3)
+    assert np.allclose(data.dpdv[0], 1E-6)
+
+
+def test_derive_shares_arrays():
+    data = hd.HysteresisData(thickness=10E-7)
+    data.time = np.linspace(0, 1E-3, 11)
+    data.voltage = np.linspace(0, 1, 11)
+    data.current = np.ones(11)
+    data.polarization = np.zeros(11)
+    d1 = data.derive(current=2 * data.current)
+    d2 = d1.derive(polarization=np.ones(11))
+    assert np.shares_memory(d2.voltage, data.voltage)
+    assert np.shares_memory(d2.current, d1.current)
+    assert np.allclose(data.current, 1) and np.allclose(d2.current, 2)
+    with pytest.raises(ValueError):
+        d2.voltage[0] = 1.0
+    data.voltage[0] = 0.5  # original stays writable
+
+
+def test_dedup_same_sweep_lot(monkeypatch):
+    rng = np.random.default_rng(0)
+    v = np.linspace(-5, 5, 200)
+    lot = []
+    for k in range(2000):
+        d = hd.LeakageData(thickness=255E-7, area=1e-4)
+        d.lcm_voltage = v
+        d.lcm_current = 1E-9 * rng.random(len(v))
+        lot.append(d)
+    calls = []
+    eq = hd.LeakageData.__eq__
+    monkeypatch.setattr(hd.LeakageData, '__eq__',
+                        lambda a, b: calls.append(1) or eq(a, b))
+    unique = hd.dedup(lot + lot[:10])
+    assert len(unique) == len(lot) and len(calls) == 10
+
+
+def test_leakage_eq_below_float32():
+    a = hd.LeakageData(thickness=255E-7, area=1e-4)
+    a.lcm_voltage = np.linspace(1, 5, 50)
+    a.lcm_current = np.linspace(1E-9, 1E-8, 50)
+    b = a.derive(lcm_voltage=a.lcm_voltage + 1E-9)
+    assert a.fingerprint == b.fingerprint  # same as float32
+    assert a != b
+    assert len(hd.dedup([a, b])) == 2
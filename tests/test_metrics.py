@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from ferro import data as hd
+from ferro import metrics
+from ferro import models as lf
+from os.path import join, dirname, realpath
+
+
+@pytest.fixture
+def square_loop():
+    """Single hysteron loop with Ec = 1E5 V/cm, Pr = 20 uC/cm^2"""
+    film = lf.LandauSimple(thickness=100E-7, area=1E-4, pr=20E-6)
+    domains = [lf.LandauDomain(film, film.area, 1E5, 0)]
+    t = np.linspace(0, 1, 4001)
+    esweep = 2E5 * np.interp(t, [0, 0.25, 0.75, 1], [0, 1, -1, 0])
+    data = hd.HysteresisData(thickness=film.thickness, area=film.area)
+    data.time = t * 1E-2
+    data.voltage = esweep * film.thickness
+    data.polarization = film.calc_efe_preisach(esweep, domains)[0]
+    return data
+
+
+def test_square_loop_metrics(square_loop):
+    m = metrics.loop_metrics(square_loop)[0]
+    assert np.isclose(m['pr_pos'], 20E-6) and np.isclose(m['pr_neg'], -20E-6)
+    assert np.isclose(m['psw'], 40E-6)
+    assert np.isclose(m['ec_pos'], 1E5, rtol=1E-3) and np.isclose(m['ec_neg'], -1E5, rtol=1E-3)
+    assert abs(m['imprint']) < 1E-3
+    assert np.isclose(m['wloss'], 4 * 20E-6 * 1E5, rtol=1E-2)
+    assert np.isclose(m['wrec'], 0, atol=1E-6)
+
+
+def test_batch_matches_single():
+    freqdir = join(dirname(realpath(__file__)), 'testData', 'hfo2_MFM', 'H9_x9y4_1e4_freq')
+    data = hd.list_read(hd.dir_read(freqdir), thickness=13E-7)
+    batch = metrics.loop_metrics(data)
+    assert len(batch) == len(data)
+    for d, m in zip(data, batch):
+        single = metrics.loop_metrics(d)[0]
+        assert all(np.isclose(single[k], m[k], equal_nan=True) for k in metrics.metrics_dtype.names)
+    assert np.all(batch['pr_pos'] > 0) and np.all(batch['pr_neg'] < 0)
+    assert np.all(batch['vc_pos'] > 0) and np.all(batch['vc_neg'] < 0)
@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+from ferro import models as lf
+from ferro import data as hd
+
+
+@pytest.fixture
+def film():
+    return lf.LandauFull(thickness=255E-7, area=1E-4, c=1E-10, pr=20E-6)
+
+
+@pytest.fixture
+def domain(film):
+    return lf.LandauDomain(film, film.area / 100, 1E5, 1E4)
+
+
+def test_parm_fit_beats_initial_grid(domain):
+    err = domain.parm_fit(refine=0)
+    refined_err = domain.parm_fit(refine=4)
+    assert refined_err <= err
+    assert np.isclose(np.sum(np.asfarray(domain.eqns1((domain.a, domain.b, domain.g))) ** 2),
+                      refined_err)
+
+
+def test_film_landscape_matches_domain_sum(film):
+    domains = [lf.LandauDomain(film, film.area / 3, 1E5, eb, a_term=-2E5, b=1E15, g=1E25)
+               for eb in (-1E4, 0, 2E4)]
+    pvals = np.linspace(-30E-6, 30E-6, 11)
+    assert np.allclose(film.get_ufe(pvals, domains),
+                       sum(d.get_ufe(pvals) for d in domains))
+    assert np.allclose(film.get_efe(pvals, domains, per_domain=True),
+                       np.stack([d.get_efe(pvals) for d in domains], axis=1))
+
+
+def _triangle(freq, n=400, emax=2E6):
+    t = np.linspace(0, 1 / freq, n)
+    return t, emax * np.interp(t * freq, [0, 0.25, 0.75, 1], [0, 1, -1, 0])
+
+
+def test_lk_coercive_field_increases_with_frequency():
+    film = lf.LandauFull(thickness=10E-7, area=1E-4, pr=20E-6, rho=5E5)
+    domains = [lf.LandauDomain(film, film.area, 7.7E5, 0, a_term=-5E10, b=6.25E19)]
+    waves = [_triangle(f) for f in (10, 1E3)]
+    t = np.stack([w[0] for w in waves])
+    e = np.stack([w[1] for w in waves])
+
+    p, state = film.calc_efe_lk(t, e, domains)
+    assert p.shape == e.shape and state.shape == (2, 1)
+    assert np.allclose(p[1], film.calc_efe_lk(t[1], e[1], domains)[0])
+
+    ec = [row_e[np.argmax(row_p > 0)] for row_e, row_p in zip(e, p)]
+    assert 7E5 < ec[0] < ec[1]
+
+
+def test_landau_roots_and_static_loop():
+    film = lf.LandauFull(thickness=10E-7, area=1E-4, pr=20E-6)
+    domains = [lf.LandauDomain(film, film.area, 7.7E5, 0, a_term=-5E10, b=6.25E19)]
+    roots = lf.landau_roots([0, 2E6], domains)
+    assert np.allclose(roots[0, 0, :3], [-20E-6, 0, 20E-6], atol=1E-12)
+    assert np.isnan(roots[1, 0, 1:]).all()
+
+    esweep = np.linspace(-2E6, 2E6, 401)
+    esweep = np.append(esweep, esweep[::-1])
+    p, state = film.calc_efe_landau(esweep, domains)
+    # switching at the fold of the double well, E = 4/(3*sqrt(3)) * |a| * Ps
+    ec = 4 / (3 * np.sqrt(3)) * 5E10 * 20E-6
+    assert abs(esweep[np.argmax(p > 0)] - ec) < 2E4
+    assert p[0] < 0 and p[-1] < 0 and state[0] < 0
+
+
+def _preisach_loop(esweep, domains):
+    """Reference implementation of the hysteron model, one point at a time."""
+    state = -np.ones(len(domains))
+    sweep_dir = np.gradient(esweep)
+    p = np.zeros(len(esweep))
+    for j, e in enumerate(esweep):
+        for i, d in enumerate(domains):
+            if sweep_dir[j] > 0 and e >= d.ec + d.ebias:
+                state[i] = 1
+            elif sweep_dir[j] < 0 and e <= -d.ec + d.ebias:
+                state[i] = -1
+            p[j] += d.pr * d.area * state[i]
+    return p, state
+
+
+@pytest.fixture
+def preisach_sweep(film):
+    rng = np.random.default_rng(1)
+    domains = [lf.LandauDomain(film, film.area / 200, ec, eb)
+               for ec, eb in zip(rng.normal(1E5, 2E4, 200), rng.normal(1E4, 1E4, 200))]
+    esweep = np.concatenate([np.linspace(0, 3E5, 100), np.linspace(3E5, -3E5, 200),
+                             np.linspace(-3E5, 3E5, 200), np.linspace(3E5, -1E5, 100),
+                             np.linspace(-1E5, 2E5, 60)])
+    return esweep, domains
+
+
+def test_preisach_matches_reference(film, preisach_sweep):
+    esweep, domains = preisach_sweep
+    p, state = film.calc_efe_preisach(esweep, domains)
+    p_ref, state_ref = _preisach_loop(esweep, domains)
+    assert np.allclose(p, p_ref / film.area)
+    assert np.array_equal(state, state_ref)
+    p2, state2 = film.calc_efe_preisach(esweep, domains, init_state=state, chunk=7)
+    p3, state3 = film.calc_efe_preisach(esweep, domains, init_state=state, chunk=1000)
+    assert np.allclose(p2, p3) and np.array_equal(state2, state3)
+
+
+def test_preisach_fit_reproduces_loop(film, preisach_sweep):
+    esweep, domains = preisach_sweep
+    p = film.calc_efe_preisach(esweep, domains)[0]
+    data = hd.HysteresisData(thickness=film.thickness, area=film.area)
+    data.voltage = esweep * film.thickness
+    data.polarization = p + 3E-6
+
+    ec, ebias, weights = film.preisach_fit([data])
+    assert np.all(weights >= 0)
+    assert np.isclose(weights.sum(), film.pr, rtol=0.05)
+
+    fit_domains = film.preisach_domains(ec, ebias, weights)
+    p_fit = film.calc_efe_preisach(esweep, fit_domains)[0]
+    resid = data.polarization - p_fit
+    assert np.std(resid) < 0.05 * np.std(p)
+
+
+def test_crossing_interpolates_first_point_above(film):
+    data = hd.HysteresisData(thickness=film.thickness, area=film.area)
+    data.time = np.arange(5) * 1E-3
+    data.voltage = np.array([0, 1, 2, 3, 4]) * film.thickness
+    data.polarization = np.array([0, 1, 3, 5, 6]) * 1E-6
+    short = hd.HysteresisData(thickness=film.thickness, area=film.area)
+    short.time = np.arange(3) * 1E-3
+    short.voltage = np.array([0, 1, 2]) * film.thickness
+    short.polarization = np.array([0, 1, 2]) * 1E-6
+
+    e, dpdt = film._crossing([data, short], 2E-6)
+    assert np.allclose(e, [1.5, 2])
+    # forward difference, backward at the end of a curve
+    assert np.allclose(dpdt, [2E-3, 1E-3])
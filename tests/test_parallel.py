@@ -0,0 +1,40 @@
+import numpy as np
+from ferro import data as hd
+from ferro import parallel
+from os.path import join, dirname, realpath
+
+freqdir = join(dirname(realpath(__file__)), 'testData', 'hfo2_MFM', 'H9_x9y4_1e4_freq')
+
+
+def _pmax(d, scale=1.0):
+    return scale * np.max(d.polarization), d.polarization.flags.writeable
+
+
+def test_shared_data_roundtrip():
+    data = hd.list_read(hd.dir_read(freqdir), thickness=13E-7)
+    with parallel.SharedData(data) as shared:
+        loaded = shared.load()
+        assert len(shared) == len(data)
+        assert all(a == b for a, b in zip(loaded, data))
+        assert loaded[0].freq == data[0].freq
+        assert not loaded[0].voltage.flags.writeable
+        del loaded
+
+    # every array attribute is shared, whatever its dtype and shape
+    data[0].mask = np.arange(6, dtype=np.int32).reshape(2, 3)
+    data[1].empty = np.zeros(0)
+    with parallel.SharedData(data) as shared:
+        loaded = shared.load()
+        assert 'mask' not in shared.handle.layout[0][1]
+        assert np.array_equal(loaded[0].mask, data[0].mask)
+        assert loaded[0].mask.dtype == np.int32
+        assert not loaded[0].mask.flags.writeable
+        assert loaded[1].empty.shape == (0,)
+        del loaded
+
+
+def test_pool_map():
+    data = hd.list_read(hd.dir_read(freqdir), thickness=13E-7)
+    res = parallel.pool_map(_pmax, data, processes=2, scale=1E6)
+    assert [r[0] for r in res] == [1E6 * np.max(d.polarization) for d in data]
+    assert not any(r[1] for r in res)
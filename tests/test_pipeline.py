@@ -0,0 +1,52 @@
+import shutil
+import numpy as np
+from ferro import pipeline
+from os.path import join, dirname, realpath
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'RTWhiteB')
+forcfile = join(sampledir, 'RTWhiteB_FORC', 'RTWhiteB 0Hz 5V 1Average Table1.tsv')
+
+
+def test_pipeline(tmp_path):
+    freqdir = tmp_path / 'freqs'
+    shutil.copytree(join(sampledir, 'RTWhiteB_freqs'), freqdir)
+    pipe = pipeline.characterization(str(freqdir), forcfile, 255E-7, 1E-4,
+                                     n_domains=50, seed=0)
+    res = pipe.run()
+    assert set(pipe.recomputed) == set(pipe.stages)
+    assert res['c'] > 0 and len(res['comp']) == len(res['freq_data'])
+    assert res['preisach'][0].shape == res['esweep'].shape
+
+    pipe.run()
+    assert pipe.recomputed == []
+
+    pipe.update('domains', n=20)
+    res2 = pipe.run('preisach')
+    assert sorted(pipe.recomputed) == ['domains', 'preisach']
+    assert len(res2['domains']) == 20 and res2['c'] == res['c']
+
+    # seeded domains are reproducible and leave the global random state alone
+    state = np.random.get_state()[1].copy()
+    ec = [d.ec for d in res2['domains']]
+    pipe.invalidate('domains')
+    assert [d.ec for d in pipe.run('domains')['domains']] == ec
+    assert np.array_equal(np.random.get_state()[1], state)
+
+    # removing a measurement invalidates everything depending on the series
+    files = sorted(freqdir.iterdir())
+    files[0].unlink()
+    pipe.run()
+    assert 'forc' not in pipe.recomputed and 'c' in pipe.recomputed
+
+
+def test_pipeline_cache_dir(tmp_path):
+    def make():
+        pipe = pipeline.Pipeline(cache_dir=str(tmp_path))
+        pipe.add('files', pipeline.read_dir, path=join(sampledir, 'RTWhiteB_freqs'))
+        pipe.add('data', pipeline.read_list, 'files', thickness=255E-7, area=1E-4)
+        pipe.add('c', pipeline.c_calc, 'data', thickness=255E-7, area=1E-4)
+        return pipe
+
+    c = make().run()['c']
+    pipe = make()
+    assert pipe.run()['c'] == c and pipe.recomputed == []
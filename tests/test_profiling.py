@@ -0,0 +1,69 @@
+import json
+import tracemalloc
+from ferro import data as hd
+from ferro import aixacct as aix
+from ferro import profiling
+from os.path import join, dirname, realpath
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'RTWhiteB')
+
+
+def test_profiling(tmp_path):
+    profiling.reset()
+    aix.read_tfdata(join(sampledir, 'RTWHITEB_lkg.dat'))
+    assert profiling.stats() == ({}, {})  # off by default
+
+    profiling.enable()
+    try:
+        files = hd.dir_read(join(sampledir, 'RTWhiteB_freqs'))
+        hd.list_read(files, thickness=255E-7, area=1e-4)
+        aix.read_tfdata(join(sampledir, 'RTWHITEB_lkg.dat'))
+    finally:
+        profiling.disable()
+
+    stages, counters = profiling.stats()
+    assert stages['tsv_read']['calls'] == len(files)
+    assert stages['list_read']['calls'] == 1
+    assert stages['list_read']['total'] >= stages['tsv_read']['total']
+    assert counters['files parsed'] == len(files) + 1
+    assert 'tsv_read' in profiling.summary()
+
+    trace = tmp_path / 'trace.json'
+    profiling.export_chrome_trace(str(trace))
+    events = json.loads(trace.read_text())['traceEvents']
+    assert len(events) == len(files) + 2 and all(e['ph'] == 'X' for e in events)
+    profiling.reset()
+
+
+def test_memory_budget():
+    f = join(sampledir, 'RTWhiteB_freqs.dat')
+    profiling.reset()
+    profiling.enable(memory=True)
+    profiling.set_memory_budget(1)  # every file is streamed
+    try:
+        streamed = aix.load_tfdata(aix.read_tfdata(f))
+    finally:
+        profiling.set_memory_budget(None)
+        profiling.disable()
+    assert all(d == s for d, s in zip(aix.load_tfdata(aix.read_tfdata(f)), streamed))
+
+    stages, counters = profiling.stats()
+    assert stages['read_tfdata']['peak'] > 0
+    assert stages['load_tfdata']['retained'] >= 0
+    assert counters['array bytes'] == profiling.nbytes(streamed) > 0
+    assert 'peak [MB]' in profiling.summary()
+    profiling.reset()
+
+
+def test_tracemalloc_owner():
+    tracemalloc.start()
+    try:
+        profiling.enable(memory=True)
+        profiling.disable()
+        assert tracemalloc.is_tracing()  # started by the caller, kept on
+    finally:
+        tracemalloc.stop()
+    profiling.enable(memory=True)
+    profiling.disable()
+    assert not tracemalloc.is_tracing()
+    profiling.reset()
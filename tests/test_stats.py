@@ -0,0 +1,78 @@
+import numpy as np
+from ferro import data as hd
+from ferro import models as lf
+from ferro import stats
+from os.path import join, dirname, realpath
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'RTWhiteB')
+
+
+def _mean(samples):
+    return np.mean(samples)
+
+
+def test_weighted_lstsq_matches_lstsq():
+    rng = np.random.default_rng(0)
+    x = np.column_stack((rng.normal(size=20), np.ones(20)))
+    y = 3 * x[:, 0] + 1 + rng.normal(scale=0.1, size=20)
+    coef = stats.weighted_lstsq(x, y, np.ones((2, 20)))
+    assert np.allclose(coef, np.linalg.lstsq(x, y, rcond=None)[0])
+
+
+def test_c_bootstrap_contains_fit():
+    freq_data = hd.list_read(hd.dir_read(join(sampledir, 'RTWhiteB_freqs')),
+                             thickness=255E-7, area=1E-4)
+    film = lf.LandauSimple(thickness=255E-7, area=1E-4)
+    c = film.c_calc(freq_data)
+    for method in ('bootstrap', 'jackknife'):
+        c_ci, er_ci = film.c_bootstrap(freq_data, method=method, seed=0)
+        assert c_ci[0] <= c <= c_ci[1]
+        assert er_ci[0] < er_ci[1]
+
+
+def test_lcm_bootstrap_contains_fit():
+    ldata = hd.LeakageData(thickness=255E-7, area=1E-4)
+    ldata.lcm_read(hd.dir_read(join(sampledir, 'RTWhiteB_lkg'))[0])
+    ldata.lcm_fit()
+    ci = ldata.lcm_bootstrap(n_boot=500, seed=0)
+    assert ci.shape == (2, 7)
+    assert np.all(ci[0, :6] <= ldata.lcm_parms[:6])
+    assert np.all(ldata.lcm_parms[:6] <= ci[1, :6])
+
+
+def test_bootstrap_pool_matches_serial():
+    samples = list(np.arange(10.0))
+    serial = stats.bootstrap(_mean, samples, n_boot=20, processes=1, seed=1)
+    pooled = stats.bootstrap(_mean, samples, n_boot=20, processes=2, seed=1)
+    assert np.allclose(serial, pooled)
+
+
+def test_quantile_sketch():
+    x = np.sort(np.random.default_rng(0).lognormal(size=10001))  # in order
+    q = stats.QuantileSketch(rel_error=1E-3)
+    for chunk in np.array_split(x, 7):
+        q.update(chunk)
+    for p in (0.1, 0.5, 0.9):
+        assert np.isclose(q.quantile(p), np.quantile(x, p), rtol=1E-3)
+    q.update(-x)
+    assert np.isclose(q.quantile(0.25), np.quantile(np.append(x, -x), 0.25), rtol=1E-3)
+
+
+def test_online_capacitance_matches_c_calc():
+    data = hd.list_read(hd.dir_read(join(sampledir, 'RTWhiteB_freqs')),
+                        thickness=255E-7, area=1E-4)
+    film = lf.LandauFull(thickness=255E-7, area=1E-4)
+    c = film.c_calc(data)
+
+    online = lf.OnlineCapacitance(thickness=255E-7, area=1E-4)
+    for d in data:
+        online.add(d)
+    assert np.isclose(online.c, c, rtol=1E-12)
+
+    streamed = lf.OnlineCapacitance(thickness=255E-7, area=1E-4)
+    assert np.isnan(streamed.c)
+    for d in data:
+        for k in range(0, len(d.time), 64):
+            streamed.update(d.time[k:k + 64], d.voltage[k:k + 64], d.current[k:k + 64])
+        streamed.finish_curve()
+    assert np.isclose(streamed.c, c, rtol=1E-2)
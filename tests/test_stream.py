@@ -0,0 +1,89 @@
+import socket
+import threading
+import numpy as np
+from os.path import join, dirname, realpath
+from ferro import stream, metrics
+from ferro import data as hd
+from ferro import models as lf
+from ferro import synthetic as syn
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'RTWhiteB')
+
+
+def test_ring_buffer():
+    b = stream.RingBuffer(5, 2)
+    b.append(np.arange(8).reshape(4, 2))
+    b.drop(3)
+    b.append(np.arange(8, 16).reshape(4, 2))  # wraps around
+    assert len(b) == 5 and b.dropped == 3
+    assert np.array_equal(b.get()[:, 0], [6, 8, 10, 12, 14])
+
+
+def test_loop_stream():
+    t, v = syn.triangle_wave(3, 1000, 2000)
+    n = 6
+    t = np.concatenate([t + k * 1E-3 for k in range(n)])
+    v = np.tile(v, n)
+    table = syn.hysteresis_table(t, v, thickness=10E-7, area=1E-4, noise=0,
+                                 rng=np.random.default_rng(0))
+    p = table['polarization'][2000:4000]
+    ref = metrics.loop_metrics_array(v[2000:4000], p - (p.max() + p.min()) / 2, 10E-7)
+
+    # the buffer holds little more than one cycle
+    s = stream.LoopStream(area=1E-4, thickness=10E-7, capacity=2500)
+    cycles = []
+    for k in range(0, len(t), 777):
+        cycles.extend(s.feed(table['time'][k:k + 777], table['voltage'][k:k + 777],
+                             table['current'][k:k + 777]))
+        assert len(s.buffer) <= 2500
+    # the first period starts before the first rising zero crossing and
+    # the last one ends without the start of a next cycle
+    assert [c['cycle'] for c in cycles] == list(range(n - 2))
+    for c in cycles:
+        assert c['n'] == 2000 and np.isclose(c['freq'], 1000)
+        for name in ('psw', 'ec_pos', 'ec_neg', 'pmax'):
+            assert np.isclose(c[name], ref[name][0], rtol=2E-3)
+
+
+def test_loop_stream_measured():
+    files = hd.dir_read(join(sampledir, 'RTWhiteB_freqs'))
+    data = hd.list_read(files, thickness=255E-7, area=1E-4)
+    film = lf.LandauFull(thickness=255E-7, area=1E-4)
+    film.c = film.c_calc(data)
+    lkg = hd.LeakageData(thickness=255E-7, area=1E-4)
+    lkg.lcm_read(join(sampledir, 'RTWhiteB_lkg', 'RTWhiteB 2s step 27C Table1.tsv'))
+    lkg.lcm_fit()
+
+    d = [d for d in data if d.freq == 100][0]
+    comp = film.c_compensation(d.leakage_compensation(lkg))[0]
+    ref = metrics.loop_metrics([comp])
+
+    # the measured loop repeated, it starts at a rising zero crossing
+    n = 4
+    period = len(d.time) * d.dt
+    t = np.concatenate([d.time + k * period for k in range(n)])
+    s = stream.LoopStream(area=1E-4, thickness=255E-7, c=film.c, leakage=lkg,
+                          temp=d.temp)
+    cycles = s.feed(t, np.tile(d.voltage, n), np.tile(d.current, n))
+    assert len(cycles) == n - 2
+    for c in cycles:
+        assert c['n'] == len(d.time)
+        for name in ('psw', 'ec_pos', 'ec_neg', 'pmax', 'pr_pos', 'pr_neg'):
+            assert np.isclose(c[name], ref[name][0], rtol=1E-9)
+
+
+def test_socket_chunks():
+    a, b = socket.socketpair()
+    samples = np.random.default_rng(0).random((1000, 3))
+
+    def send():
+        data = samples.astype('<f8').tobytes()
+        for k in range(0, len(data), 1001):  # not aligned to records
+            a.sendall(data[k:k + 1001])
+        a.close()
+
+    threading.Thread(target=send).start()
+    chunks = list(stream.socket_chunks(b, n=100))
+    b.close()
+    got = np.column_stack([np.concatenate(c) for c in zip(*chunks)])
+    assert np.array_equal(got, samples)
@@ -0,0 +1,23 @@
+import numpy as np
+from ferro import data as hd
+from ferro import aixacct as aix
+from ferro import synthetic as syn
+
+
+def test_generated_files_parse(tmp_path):
+    files = syn.generate_dataset(str(tmp_path), n_tables=3, n_points=1000,
+                                 forc_points=5000, n_reversals=10, seed=1)
+
+    dat = aix.load_tfdata(aix.read_tfdata(files["freq"]))
+    tsv = hd.list_read(files["freq_tsv"], thickness=13E-7, area=1E-4)
+    assert len(dat) == 3 and [d.freq for d in dat] == [d.freq for d in tsv]
+    assert all(np.allclose(a.polarization, b.polarization) for a, b in zip(dat, tsv))
+    assert np.isclose(dat[0].thickness, 13E-7) and np.isclose(dat[0].area, 1E-4)
+    assert 15E-6 < np.max(dat[0].polarization) < 40E-6
+
+    lkg = aix.load_tfdata(aix.read_tfdata(files["leakage"]))
+    assert len(lkg) == 3 and np.all(np.diff([np.max(l.lcm_current) for l in lkg]) > 0)
+
+    forc = aix.load_tfdata(aix.read_tfdata(files["forc"]))[0]
+    e, er, prob = forc.forc_calc()
+    assert prob.shape == (10, 200)
@@ -0,0 +1,42 @@
+import asyncio
+import shutil
+import numpy as np
+from ferro import watch, batch
+from ferro import models as lf
+from ferro import data as hd
+from os.path import join, dirname, realpath
+
+sampledir = join(dirname(realpath(__file__)), 'testData', 'FeFETD1', 'MFS+', 'die66')
+series = 'FeFETD1_die66_MFS+_60_20x20_freq'
+
+
+def test_watcher(tmp_path):
+    files = sorted(hd.dir_read(join(sampledir, series)))
+    target = tmp_path / 'die66' / series
+    target.mkdir(parents=True)
+    shutil.copy(files[0], target)
+    config = batch.load_config()
+    config['batch'].update({'thickness': '10E-7', 'area': '1E-4'})
+
+    async def main():
+        queue = asyncio.Queue()
+        watcher = watch.Watcher(str(tmp_path), queue=queue, interval=0.05,
+                                config=config)
+        task = asyncio.create_task(watcher.run())
+        events = [await asyncio.wait_for(queue.get(), 5)]
+        for f in files[1:]:
+            shutil.copy(f, target)
+        while len(events) < len(files):
+            events.append(await asyncio.wait_for(queue.get(), 5))
+        watcher.stop()
+        await task
+        return events
+
+    events = asyncio.run(main())
+    assert np.isnan(events[0]['c'])  # one frequency, no fit yet
+    assert all(e['latency'] < 1 for e in events[1:])
+    data = hd.list_read(files, thickness=10E-7, area=1E-4)
+    c = lf.LandauFull(thickness=10E-7, area=1E-4).c_calc(data)
+    assert np.isclose(events[-1]['c'], c)
+    assert events[-1]['die'] == ('FeFETD1', 'MFS+', 66, '60_20x20')
+    assert events[-1]['summary']['c'] == events[-1]['c']